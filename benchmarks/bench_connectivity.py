@@ -0,0 +1,86 @@
+###################################
+# Script :
+# 1) Benchmark of sequence connectivity
+# of large ensembles evaluated with
+# array operations over all models
+#
+###################################
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import connectivity
+
+
+def get_ensemble(models: int, chains: int, beads: int,
+                 seed: int = 0) -> (np.ndarray, dict):
+    """
+    coordinates (models, beads, 3) and sphere table of random walks of
+    touching beads with occasional breaks
+    """
+    rng = np.random.default_rng(seed)
+    n = chains * beads
+    radii = rng.uniform(2., 5., n)
+    step = rng.normal(size=(models, n, 3))
+    step /= np.linalg.norm(step, axis=2)[:, :, None]
+    length = radii + np.roll(radii, 1)
+    length = length * np.where(rng.random((models, n)) < 0.01, 2., 1.)
+    xyz = np.cumsum(step * length[:, :, None], axis=1)
+    table = {
+        'xyz': xyz[0],
+        'radius': radii,
+        'asym_id': np.repeat(np.array([chr(65 + k % 26) + str(k // 26)
+                                       for k in range(chains)],
+                                      dtype=object), beads),
+        'seq_id_begin': np.tile(np.arange(1, beads + 1), chains),
+        'seq_id_end': np.tile(np.arange(1, beads + 1), chains),
+    }
+    return xyz, table
+
+
+def best_time(f, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark of sequence connectivity of ensembles')
+    parser.add_argument('-m', type=int, default=1000, help="Number of models")
+    parser.add_argument('-c', type=int, default=10, help="Number of chains")
+    parser.add_argument('-n', type=int, default=500,
+                        help="Number of beads per chain")
+    args = parser.parse_args()
+
+    xyz, table = get_ensemble(args.m, args.c, args.n)
+    numbers = list(range(1, args.m + 1))
+
+    def vectorized():
+        tables = connectivity.get_empty_tables()
+        connectivity.add_block_results(*tables, numbers, xyz, table)
+        return tables
+
+    def per_model():
+        tables = connectivity.get_empty_tables()
+        for k in range(args.m):
+            connectivity.add_block_results(*tables, numbers[k:k + 1],
+                                           xyz[k:k + 1], table)
+        return tables
+
+    assert vectorized() == per_model()
+    summary, outliers = vectorized()
+    t_all = best_time(vectorized)
+    t_one = best_time(per_model)
+    print(f'{args.m} models, {args.c} chains of {args.n} beads, '
+          f'{len(outliers["Model"])} outliers')
+    print(f'all models at once: {t_all:.3f} s')
+    print(f'one model at a time: {t_one:.3f} s ({t_one / t_all:.1f}x)')
@@ -0,0 +1,88 @@
+###################################
+# Script :
+# 1) Benchmark of the excluded volume
+# calculation: per-sphere loop vs
+# vectorized KD-tree pair query, with
+# and without radius classes
+#
+###################################
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from scipy.spatial import KDTree
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import exv_engine
+
+
+def get_random_model(n: int, large: float = 0., seed: int = 0) -> (np.ndarray, np.ndarray):
+    """
+    beads of 1-residue size in a box with protein-like density;
+    a fraction (large) of beads has the size of 20+ residues
+    as in multi-resolution models
+    """
+    rng = np.random.default_rng(seed)
+    radii = rng.uniform(2.5, 4.5, n)
+    mask = rng.random(n) < large
+    radii[mask] = rng.uniform(12., 25., mask.sum())
+    side = ((4 / 3 * np.pi * radii ** 3).sum() / 0.4) ** (1 / 3)
+    xyz = rng.uniform(0, side, (n, 3))
+    return xyz, radii
+
+
+def count_violations_loop(xyz: np.ndarray, radii: np.ndarray) -> int:
+    """original per-sphere loop of GetExcludedVolume.get_violation_dict"""
+    maxr = np.max(radii)
+    t = KDTree(xyz)
+    viols = 0
+    for i in range(len(xyz) - 1):
+        for j in t.query_ball_point(xyz[i], radii[i] + maxr):
+            if j > i:
+                d = np.linalg.norm(xyz[i] - xyz[j])
+                if d < (radii[i] + radii[j]):
+                    viols += 1
+    return viols
+
+
+def best_time(f, *args, repeat: int = 3) -> (float, int):
+    best = float('inf')
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = f(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, nargs='+', default=[5000, 50000],
+                        help='Number of beads')
+    parser.add_argument('--large', type=float, default=0.01,
+                        help='Fraction of large beads in multi-resolution models')
+    parser.add_argument('--no-loop', action='store_true', default=False,
+                        help='Skip the per-sphere loop')
+    args = parser.parse_args()
+
+    for label, large in (('uniform', 0.), ('multi-resolution', args.large)):
+        print(label)
+        for n in args.n:
+            xyz, radii = get_random_model(n, large)
+            t_single, v_single = best_time(exv_engine.count_violations,
+                                           xyz, radii, None)
+            t_class, v_class = best_time(exv_engine.count_violations,
+                                         xyz, radii)
+            assert v_single == v_class
+            line = (f'{n:8d} beads  violations: {v_class:8d}  '
+                    f'single query: {t_single:8.4f} s  '
+                    f'radius classes: {t_class:8.4f} s '
+                    f'({t_single / t_class:5.1f}x)')
+            if not args.no_loop:
+                t_loop, v_loop = best_time(count_violations_loop, xyz, radii,
+                                           repeat=1)
+                assert v_loop == v_class
+                line += f'  loop: {t_loop:8.3f} s ({t_loop / t_class:5.1f}x)'
+            print(line)
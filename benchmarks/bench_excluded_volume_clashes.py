@@ -0,0 +1,67 @@
+###################################
+# Script :
+# 1) Benchmark of streaming output
+# of overlapping pairs of spheres
+# compared to counting violations
+#
+###################################
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import exv_engine
+from excludedvolume import GetExcludedVolume
+from bench_excluded_volume_chains import get_assembly
+
+
+def get_table(radii: np.ndarray, chains: np.ndarray) -> dict:
+    """sphere table with chain ids and residue ranges of the spheres"""
+    seq_id_begin = np.arange(len(radii)) % 1000 * 10 + 1
+    return {'asym_id': np.array([f'{c}' for c in chains], dtype=object),
+            'seq_id_begin': seq_id_begin, 'seq_id_end': seq_id_begin + 9}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', type=int, default=100, help='Number of chains')
+    parser.add_argument('-n', type=int, default=300, help='Number of beads per chain')
+    parser.add_argument('-m', type=int, default=10, help='Number of models')
+    parser.add_argument('-s', type=float, default=0.8, help='Scale of radii')
+    args = parser.parse_args()
+
+    xyz, radii, chains = get_assembly(args.c, args.n)
+    radii = radii * args.s
+    rng = np.random.default_rng(1)
+    models = [(xyz + rng.normal(0, 1., xyz.shape), radii, None, chains)
+              for m in range(args.m)]
+    table = get_table(radii, chains)
+
+    t0 = time.perf_counter()
+    counts = list(exv_engine.iter_violations_parallel(iter(models), workers=1,
+                                                      details=True))
+    t_count = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = os.path.join(tmpdir, 'clashes.csv')
+        t0 = time.perf_counter()
+        with open(fname, 'w') as fh:
+            for k, result in enumerate(exv_engine.iter_violations_parallel(
+                    iter(models), workers=1, clashes=True), 1):
+                GetExcludedVolume.write_clashes(fh, k, table, result['pairs'],
+                                                result['overlap'])
+        t_clashes = time.perf_counter() - t0
+        size = os.path.getsize(fname)
+
+    violations = sum(c['violations'] for c in counts)
+    print(f'{len(radii)} beads, {args.m} models, '
+          f'{violations / args.m / len(radii):.2f} violations per bead')
+    print(f'number of violations:   {t_count:7.3f} s')
+    print(f'with clash CSV output:  {t_clashes:7.3f} s  '
+          f'overhead: {(t_clashes / t_count - 1) * 100:5.1f}%  '
+          f'{size / 1024 ** 2:.1f} MB')
@@ -0,0 +1,46 @@
+###################################
+# Script :
+# 1) Benchmark of excluded volume
+# throughput on ensembles with
+# shared memory worker processes
+#
+###################################
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import exv_engine
+from bench_excluded_volume import get_random_model
+
+
+def iter_ensemble(models: int, beads: int):
+    """models of the same size generated on the fly"""
+    for k in range(models):
+        yield get_random_model(beads, large=0.01, seed=k)
+
+
+if __name__ == '__main__':
+    cores = exv_engine.get_available_cores()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', type=int, default=1000, help='Number of models')
+    parser.add_argument('-n', type=int, default=5000, help='Number of beads per model')
+    parser.add_argument('-w', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, 16, 32, cores} & set(range(1, cores + 1))),
+                        help='Numbers of workers')
+    args = parser.parse_args()
+
+    base = None
+    for workers in args.w:
+        t0 = time.perf_counter()
+        for violations in exv_engine.iter_violations_parallel(
+                iter_ensemble(args.m, args.n), workers=workers):
+            pass
+        t = time.perf_counter() - t0
+        base = base or t
+        print(f'{workers:4d} workers  {args.m / t:8.1f} models/s  '
+              f'speedup: {base / t:5.2f}x  efficiency: {base / t / workers:5.2f}')
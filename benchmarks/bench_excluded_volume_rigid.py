@@ -0,0 +1,86 @@
+###################################
+# Script :
+# 1) Benchmark of excluded volume of
+# rigid-body models with pairs within
+# rigid bodies evaluated once
+#
+###################################
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import exv_engine
+
+
+def get_rigid_body_model(bodies: int, beads: int, flexible: int,
+                         seed: int = 0) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    globular rigid bodies of 1-residue beads on a lattice, in contact
+    with their neighbours, and flexible beads around them
+    """
+    rng = np.random.default_rng(seed)
+    xyz, radii, labels = [], [], []
+    # Radius of a ball of beads with protein-like density
+    body_radius = (beads * 3.5 ** 3 / 0.5) ** (1 / 3)
+    side = int(np.ceil(bodies ** (1 / 3)))
+    for k in range(bodies):
+        center = 2 * body_radius * np.array(np.unravel_index(k, (side,) * 3))
+        direction = rng.normal(size=(beads, 3))
+        direction /= np.linalg.norm(direction, axis=1)[:, None]
+        r = body_radius * rng.random(beads) ** (1 / 3)
+        xyz.append(center + direction * r[:, None])
+        radii.append(rng.uniform(2.5, 4.5, beads))
+        labels.append(np.full(beads, k))
+    xyz.append(rng.uniform(-body_radius, (2 * side - 1) * body_radius,
+                           (flexible, 3)))
+    radii.append(rng.uniform(2.5, 4.5, flexible))
+    labels.append(np.full(flexible, -1))
+    return np.concatenate(xyz), np.concatenate(radii), np.concatenate(labels)
+
+
+def iter_models(xyz, radii, labels, models: int, seed: int = 0):
+    """models with rigid bodies moved by random rotations and translations"""
+    rng = np.random.default_rng(seed)
+    flexible, rigid = exv_engine.get_body_index(labels)
+    for m in range(models):
+        new = xyz.copy()
+        for body in rigid:
+            center = xyz[body].mean(axis=0)
+            rotation = Rotation.random(random_state=rng.integers(1 << 31))
+            new[body] = rotation.apply(xyz[body] - center) + center \
+                + rng.normal(0, 1., 3)
+        new[flexible] += rng.normal(0, 2., (len(flexible), 3))
+        yield new, radii, labels
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-b', type=int, default=50, help='Number of rigid bodies')
+    parser.add_argument('-n', type=int, default=1000, help='Number of beads per rigid body')
+    parser.add_argument('-f', type=int, default=5000, help='Number of flexible beads')
+    parser.add_argument('-m', type=int, default=20, help='Number of models')
+    args = parser.parse_args()
+
+    model = get_rigid_body_model(args.b, args.n, args.f)
+    models = list(iter_models(*model, args.m))
+
+    t0 = time.perf_counter()
+    full = [exv_engine.count_violations(xyz, radii) for xyz, radii, labels in models]
+    t_full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    split = list(exv_engine.iter_rigid_body_violations(iter(models), workers=1))
+    t_rigid = time.perf_counter() - t0
+
+    print(f'{len(model[1])} beads, {args.b} rigid bodies, {args.m} models')
+    print(f'all pairs per model:          {t_full:7.3f} s')
+    print(f'rigid bodies evaluated once:  {t_rigid:7.3f} s  '
+          f'speedup: {t_full / t_rigid:5.2f}x')
+    mismatch = sum(a != b + c for a, (b, c) in zip(full, split))
+    print(f'models with different totals (rounding at contact): {mismatch}')
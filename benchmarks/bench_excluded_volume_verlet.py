@@ -0,0 +1,55 @@
+###################################
+# Script :
+# 1) Benchmark of excluded volume on
+# trajectory-like ensembles with and
+# without Verlet list reuse
+#
+###################################
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import exv_engine
+from bench_excluded_volume import get_random_model
+
+
+def get_trajectory(models: int, beads: int, step: float, seed: int = 0) -> list:
+    """consecutive models differ by a random displacement of rms step"""
+    rng = np.random.default_rng(seed)
+    xyz, radii = get_random_model(beads, large=0.01, seed=seed)
+    trajectory = []
+    for k in range(models):
+        trajectory.append((xyz, radii))
+        xyz = xyz + rng.normal(0, step / np.sqrt(3), xyz.shape)
+    return trajectory
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', type=int, default=200, help='Number of models')
+    parser.add_argument('-n', type=int, default=20000, help='Number of beads per model')
+    parser.add_argument('--step', type=float, nargs='+', default=[0.05, 0.2, 1.],
+                        help='RMS displacement between consecutive models (A)')
+    parser.add_argument('--skin', type=float, nargs='+', default=[1., 2., 4.],
+                        help='Skin distances (A)')
+    args = parser.parse_args()
+
+    for step in args.step:
+        trajectory = get_trajectory(args.m, args.n, step)
+        t0 = time.perf_counter()
+        scratch = [exv_engine.count_violations(*m) for m in trajectory]
+        t_scratch = time.perf_counter() - t0
+        print(f'step {step:5.2f} A  from scratch: {t_scratch:7.3f} s')
+        for skin in args.skin:
+            verlet = exv_engine.VerletList(skin)
+            t0 = time.perf_counter()
+            reused = [verlet.count_violations(*m) for m in trajectory]
+            t = time.perf_counter() - t0
+            assert reused == scratch
+            print(f'    skin {skin:4.1f} A  {t:7.3f} s  builds: {verlet.builds:4d}/{args.m}'
+                  f'  speedup: {t_scratch / t:5.2f}x')
@@ -0,0 +1,78 @@
+###################################
+# Script :
+# 1) Benchmark of parsing MolProbity
+# outputs with many outliers into
+# tables
+#
+###################################
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import molprobity_tables
+
+
+def get_outputs(models: int, lines: int, seed: int = 0) -> (dict, dict, list, dict):
+    """
+    ramalyze and rotalyze lines per model, clashscore output and
+    chains_map of random residues of 26 chains
+    """
+    rng = np.random.default_rng(seed)
+    chains = rng.integers(0, 26, lines * models)
+    resseqs = rng.integers(1, 2000, lines * models)
+    ids = [f'{chr(65 + c):>2}{r:>4}  ALA' for c, r in zip(chains, resseqs)]
+    evaluations = rng.choice(['Favored', 'Allowed', 'OUTLIER'], len(ids))
+    rama, rota, clash = {}, {}, []
+    for m in range(1, models + 1):
+        block = slice((m - 1) * lines, m * lines)
+        rama[m] = [f'{i}:1.00:-60.00:-40.00:{e}:General'
+                   for i, e in zip(ids[block], evaluations[block])]
+        rota[m] = [f'{i}:1.00:0.30:62.1:180.0:::{e}:OUTLIER'
+                   for i, e in zip(ids[block], evaluations[block])]
+        clash.append(f'Bad Clashes >= 0.4 Angstrom MODEL {m}:')
+        clash += [f'{i}   CB {j}   CB :0.512'
+                  for i, j in zip(ids[block], ids[block][::-1])]
+    clash += [f'MODEL {m} clashscore = 10.00' for m in range(1, models + 1)]
+    chains_map = {(chr(65 + c), str(r)): (chr(65 + c), str(r))
+                  for c in range(26) for r in range(1, 2000)}
+    return rama, rota, clash, chains_map
+
+
+def best_time(f, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark of parsing MolProbity outputs into tables')
+    parser.add_argument('-m', type=int, default=10, help="Number of models")
+    parser.add_argument('-n', type=int, default=10000,
+                        help="Number of lines per model and tool")
+    args = parser.parse_args()
+
+    rama, rota, clash, chains_map = get_outputs(args.m, args.n)
+
+    def residues(parse, models):
+        table = parse(models)
+        molprobity_tables.get_evaluation_summary(table)
+        molprobity_tables.get_outlier_details(table, chains_map)
+
+    def clashes():
+        table, clashscores = molprobity_tables.parse_clash(clash, args.m)
+        molprobity_tables.get_clash_summary(table, clashscores, args.m)
+        molprobity_tables.get_clash_details(table, chains_map)
+
+    print(f'{args.m} models, {args.m * args.n} lines per tool')
+    print(f'ramalyze: {best_time(lambda: residues(molprobity_tables.parse_rama, rama)):.3f} s')
+    print(f'rotalyze: {best_time(lambda: residues(molprobity_tables.parse_rota, rota)):.3f} s')
+    print(f'clashscore: {best_time(clashes):.3f} s')
@@ -0,0 +1,66 @@
+###################################
+# Script :
+# 1) Benchmark of the entry composition
+# and supplementary table stages with
+# and without memoized tables
+#
+###################################
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import mmcif_io
+import report
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example', 'PDBDEV_00000001.cif')
+
+MEMOIZED = ['get_composition', 'get_software_comp', 'get_ensembles',
+            'get_dataset_comp', 'get_restraints', 'get_dataset_details',
+            'get_sampling']
+
+
+def set_memoization(enabled: bool) -> None:
+    """switch between memoized and original accessors"""
+    cls = mmcif_io.GetInputInformation
+    for name in MEMOIZED:
+        f = cls.__dict__[name]
+        f = getattr(f, '__wrapped__', f)
+        setattr(cls, name, mmcif_io.memoized(f) if enabled else f)
+
+
+def run(fname: str, repeat: int) -> (float, float):
+    """best time of entry composition and supplementary table stages"""
+    # Plots are not rendered here, so skip the webdriver
+    report.WriteReport.create_webdriver = lambda self: None
+    best_comp, best_supp = float('inf'), float('inf')
+    for i in range(repeat):
+        r = report.WriteReport(fname, db='.', cache=None)
+        td = {}
+        t0 = time.perf_counter()
+        r.run_entry_composition(td)
+        t1 = time.perf_counter()
+        r.run_supplementary_table(td)
+        t2 = time.perf_counter()
+        best_comp = min(best_comp, t1 - t0)
+        best_supp = min(best_supp, t2 - t1)
+    return best_comp, best_supp
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', default=EXAMPLE, help='Input mmCIF file')
+    parser.add_argument('-n', type=int, default=5, help='Number of repeats')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    for label, enabled in (('before (no memoization)', False),
+                           ('after (memoized)', True)):
+        set_memoization(enabled)
+        comp, supp = run(args.f, args.n)
+        print(f'{label:25s} run_entry_composition: {comp * 1e3:8.2f} ms  '
+              f'run_supplementary_table: {supp * 1e3:8.2f} ms')
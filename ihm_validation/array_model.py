@@ -0,0 +1,295 @@
+###################################
+# Script :
+# 1) Contains model class for python-ihm
+# reader that keeps coordinates in
+# NumPy arrays instead of python objects
+#
+###################################
+
+import numpy as np
+import ihm
+import ihm.model
+
+# Columns: name -> (dtype, shape of a single row);
+# strings are python objects, mmCIF does not limit their length
+ATOM_COLUMNS = {
+    'xyz': (np.float64, (3,)),
+    'asym': (np.int32, ()),
+    'seq_id': (np.int32, ()),
+    'atom_id': (object, ()),
+    'type_symbol': (object, ()),
+    'het': (np.bool_, ()),
+    'biso': (np.float64, ()),
+    'occupancy': (np.float64, ()),
+    'alt_id': (object, ()),
+}
+
+SPHERE_COLUMNS = {
+    'xyz': (np.float64, (3,)),
+    'asym': (np.int32, ()),
+    'seq_id_range': (np.int32, (2,)),
+    'radius': (np.float64, ()),
+    'rmsf': (np.float64, ()),
+}
+
+
+def _none_to_nan(value) -> float:
+    # Both missing (.) and unknown (?) values are NaN
+    return np.nan if value is None or value is ihm.unknown else value
+
+
+def _nan_to_none(value):
+    return None if np.isnan(value) else float(value)
+
+
+class GrowableTable(object):
+    """Columnar table backed by NumPy arrays; capacity doubles on overflow"""
+
+    def __init__(self, columns: dict, capacity: int = 64):
+        self.columns = columns
+        self.size = 0
+        self._data = self._allocate(capacity)
+
+    def _allocate(self, capacity: int) -> dict:
+        return {k: np.zeros((capacity,) + shape, dtype=dtype)
+                for k, (dtype, shape) in self.columns.items()}
+
+    def _grow(self) -> None:
+        capacity = max(2 * len(self._data['xyz']), 64)
+        data = self._allocate(capacity)
+        for k, v in self._data.items():
+            data[k][:self.size] = v[:self.size]
+        self._data = data
+
+    def append(self, **row) -> None:
+        if self.size == len(self._data['xyz']):
+            self._grow()
+        for k, v in row.items():
+            self._data[k][self.size] = v
+        self.size += 1
+
+    def clear(self) -> None:
+        self.size = 0
+        self._data = self._allocate(64)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        """column view without unused capacity"""
+        return self._data[key][:self.size]
+
+    def __getstate__(self):
+        # Do not serialize unused capacity
+        return {'columns': self.columns, 'size': self.size,
+                '_data': {k: v[:self.size].copy() for k, v in self._data.items()}}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+class _AtomRow(object):
+    """Writable view of a single atom row. python-ihm reader uses
+    model._atoms to renumber seq_id of branched entities"""
+
+    def __init__(self, model, row: int):
+        self._model, self._row = model, row
+
+    @property
+    def asym_unit(self):
+        return self._model._asyms[self._model._atom_table['asym'][self._row]]
+
+    @property
+    def seq_id(self) -> int:
+        return int(self._model._atom_table['seq_id'][self._row])
+
+    @seq_id.setter
+    def seq_id(self, value: int) -> None:
+        self._model._atom_table['seq_id'][self._row] = value
+
+
+class ArrayModel(ihm.model.Model):
+    """
+    Drop-in replacement for ihm.model.Model. Atoms and spheres are stored
+    in per-model NumPy tables; get_atoms()/get_spheres() recreate python-ihm
+    objects on demand, get_atom_table()/get_sphere_table() return arrays.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._asyms = []
+        self._asym_index = {}
+        self._atom_table = GrowableTable(ATOM_COLUMNS)
+        self._sphere_table = GrowableTable(SPHERE_COLUMNS)
+        super().__init__(*args, **kwargs)
+
+    def _get_asym_index(self, asym) -> int:
+        key = id(asym)
+        if key not in self._asym_index:
+            self._asym_index[key] = len(self._asyms)
+            self._asyms.append(asym)
+        return self._asym_index[key]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # id()-based index is not valid after unpickling
+        del state['_asym_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._asym_index = {id(a): i for i, a in enumerate(self._asyms)}
+
+    # Compatibility with code using private lists of ihm.model.Model
+    @property
+    def _atoms(self) -> list:
+        return [_AtomRow(self, i) for i in range(len(self._atom_table))]
+
+    @_atoms.setter
+    def _atoms(self, atoms: list) -> None:
+        self._atom_table.clear()
+        for a in atoms:
+            self.add_atom(a)
+
+    @property
+    def _spheres(self) -> list:
+        return list(self.get_spheres())
+
+    @_spheres.setter
+    def _spheres(self, spheres: list) -> None:
+        self._sphere_table.clear()
+        for s in spheres:
+            self.add_sphere(s)
+
+    def add_atom(self, atom: ihm.model.Atom) -> None:
+        self._atom_table.append(
+            xyz=(atom.x, atom.y, atom.z),
+            asym=self._get_asym_index(atom.asym_unit),
+            seq_id=atom.seq_id,
+            atom_id=atom.atom_id,
+            type_symbol=atom.type_symbol or '',
+            het=atom.het,
+            biso=_none_to_nan(atom.biso),
+            occupancy=_none_to_nan(atom.occupancy),
+            alt_id=atom.alt_id or '')
+
+    def add_sphere(self, sphere: ihm.model.Sphere) -> None:
+        self._sphere_table.append(
+            xyz=(sphere.x, sphere.y, sphere.z),
+            asym=self._get_asym_index(sphere.asym_unit),
+            seq_id_range=sphere.seq_id_range,
+            radius=sphere.radius,
+            rmsf=_none_to_nan(sphere.rmsf))
+
+    def get_atoms(self):
+        t = self._atom_table
+        for i in range(len(t)):
+            x, y, z = t['xyz'][i]
+            yield ihm.model.Atom(
+                asym_unit=self._asyms[t['asym'][i]],
+                seq_id=int(t['seq_id'][i]),
+                atom_id=str(t['atom_id'][i]),
+                type_symbol=str(t['type_symbol'][i]) or None,
+                x=float(x), y=float(y), z=float(z),
+                het=bool(t['het'][i]),
+                biso=_nan_to_none(t['biso'][i]),
+                occupancy=_nan_to_none(t['occupancy'][i]),
+                alt_id=str(t['alt_id'][i]) or None)
+
+    def get_spheres(self):
+        t = self._sphere_table
+        for i in range(len(t)):
+            x, y, z = t['xyz'][i]
+            b, e = t['seq_id_range'][i]
+            yield ihm.model.Sphere(
+                asym_unit=self._asyms[t['asym'][i]],
+                seq_id_range=(int(b), int(e)),
+                x=float(x), y=float(y), z=float(z),
+                radius=float(t['radius'][i]),
+                rmsf=_nan_to_none(t['rmsf'][i]))
+
+    def get_number_of_atoms(self) -> int:
+        return len(self._atom_table)
+
+    def get_number_of_spheres(self) -> int:
+        return len(self._sphere_table)
+
+    def get_atom_table(self) -> dict:
+        t = self._atom_table
+        return {
+            'xyz': t['xyz'],
+            'asym_id': self._get_asym_ids(t['asym']),
+            'seq_id': t['seq_id'],
+            'atom_id': t['atom_id'],
+            'type_symbol': t['type_symbol'],
+            'het': t['het'],
+            'biso': t['biso'],
+            'occupancy': t['occupancy'],
+        }
+
+    def get_sphere_table(self) -> dict:
+        t = self._sphere_table
+        return {
+            'xyz': t['xyz'],
+            'radius': t['radius'],
+            'asym_id': self._get_asym_ids(t['asym']),
+            'seq_id_begin': t['seq_id_range'][:, 0],
+            'seq_id_end': t['seq_id_range'][:, 1],
+        }
+
+    def _get_asym_ids(self, index: np.ndarray) -> np.ndarray:
+        ids = np.array([a._id for a in self._asyms] or [''], dtype=object)
+        return ids[index]
+
+
+def get_atom_table(model: ihm.model.Model) -> dict:
+    """atom table for any python-ihm model"""
+    if isinstance(model, ArrayModel):
+        return model.get_atom_table()
+
+    atoms = list(model.get_atoms())
+    return {
+        'xyz': np.array([(a.x, a.y, a.z) for a in atoms],
+                        dtype=np.float64).reshape(-1, 3),
+        'asym_id': np.array([a.asym_unit._id for a in atoms], dtype=object),
+        'seq_id': np.array([a.seq_id for a in atoms], dtype=np.int32),
+        'atom_id': np.array([a.atom_id for a in atoms], dtype=object),
+        'type_symbol': np.array([a.type_symbol or '' for a in atoms], dtype=object),
+        'het': np.array([a.het for a in atoms], dtype=np.bool_),
+        'biso': np.array([_none_to_nan(a.biso) for a in atoms], dtype=np.float64),
+        'occupancy': np.array([_none_to_nan(a.occupancy) for a in atoms],
+                              dtype=np.float64),
+    }
+
+
+def get_sphere_table(model: ihm.model.Model) -> dict:
+    """sphere table for any python-ihm model"""
+    if isinstance(model, ArrayModel):
+        return model.get_sphere_table()
+
+    return spheres_to_table(list(model.get_spheres()))
+
+
+def spheres_to_table(spheres: list) -> dict:
+    """convert list of ihm.model.Sphere objects to sphere table"""
+    seq_id_range = np.array([s.seq_id_range for s in spheres],
+                            dtype=np.int32).reshape(-1, 2)
+    return {
+        'xyz': np.array([(s.x, s.y, s.z) for s in spheres],
+                        dtype=np.float64).reshape(-1, 3),
+        'radius': np.array([s.radius for s in spheres], dtype=np.float64),
+        'asym_id': np.array([s.asym_unit._id for s in spheres], dtype=object),
+        'seq_id_begin': seq_id_range[:, 0],
+        'seq_id_end': seq_id_range[:, 1],
+    }
+
+
+def get_number_of_spheres(model: ihm.model.Model) -> int:
+    if isinstance(model, ArrayModel):
+        return model.get_number_of_spheres()
+    return len(model._spheres)
+
+
+def get_number_of_atoms(model: ihm.model.Model) -> int:
+    if isinstance(model, ArrayModel):
+        return model.get_number_of_atoms()
+    return len(model._atoms)
@@ -0,0 +1,323 @@
+###################################
+# Script :
+# 1) Contains byte-offset index of
+# mmCIF categories for selective
+# loading of text mmCIF files
+#
+###################################
+
+import mmap
+from collections import defaultdict
+from cif_tokenizer import split_line
+
+# Line prefixes which can start a new section or a text field
+LOOP_, DATA_, TAG, TEXT = b'loop_', b'data_', b'_', b';'
+
+# Coordinates of models and starting models;
+# not needed for metadata-only reports
+COORDINATE_CATEGORIES = ('_atom_site', '_ihm_sphere_obj_site',
+                         '_ihm_gaussian_obj_site',
+                         '_ihm_starting_model_coord')
+
+# Loop bodies up to this size are read row by row by find_loop_end
+MIN_STEP = 1 << 16
+
+
+class LineStarts(object):
+    """
+    Find lines starting with one of the prefixes. Each prefix is
+    searched independently with find(), which runs at memchr speed,
+    in windows growing from the current position, so that jumping
+    ahead does not cost a search of the skipped bytes
+    """
+
+    def __init__(self, buf, size: int, prefixes=(LOOP_, DATA_, TAG, TEXT)):
+        self.buf, self.size = buf, size
+        # prefix -> (next line start or None, end of searched window)
+        self.state = {p: (None, 0) for p in prefixes}
+
+    def _find(self, prefix: bytes, start: int, stop: int):
+        """first line start in [start, stop) with prefix or None"""
+        if start == 0 and self.buf[:len(prefix)] == prefix:
+            return 0
+        i = self.buf.find(b'\n' + prefix, max(start - 1, 0), stop + len(prefix))
+        return None if i < 0 else i + 1
+
+    def find(self, pos: int, step: int = 1 << 16) -> (int, bytes):
+        """first line at or after pos starting with one of the prefixes"""
+        while True:
+            stop = min(pos + step, self.size)
+            best = (self.size, None)
+            for p, (q, hi) in self.state.items():
+                if q is None or q < pos:
+                    if q is not None or hi < pos:
+                        # Stale; search again from pos
+                        q, hi = None, pos
+                    if hi < stop:
+                        q, hi = self._find(p, hi, stop), stop
+                    self.state[p] = (q, hi)
+                if q is not None and q < best[0]:
+                    best = (q, p)
+            # Prefixes are only known to be absent before stop
+            if best[0] < stop or stop >= self.size:
+                return best
+            step *= 2
+
+
+def read_line(buf, pos: int, size: int) -> bytes:
+    """line starting at pos including the newline"""
+    end = buf.find(b'\n', pos)
+    return buf[pos:size if end < 0 else end + 1]
+
+
+def next_line_start(buf, pos: int, size: int) -> int:
+    """start of the first line at or after pos"""
+    if pos == 0 or buf[pos - 1:pos] == b'\n':
+        return pos
+    end = buf.find(b'\n', pos)
+    return size if end < 0 else end + 1
+
+
+def is_loop_terminator(line: bytes) -> bool:
+    return line[:1] in (b'', b'#', b'_') or line.startswith((LOOP_, DATA_))
+
+
+def get_row_shape(line: bytes) -> tuple:
+    """kinds of tokens in a loop row; '' for missing values"""
+    shape = []
+    for token in split_line(line.decode('latin-1')):
+        if token in ('.', '?'):
+            shape.append('')
+        elif token.lstrip('+-').isdigit():
+            shape.append('i')
+        else:
+            try:
+                float(token)
+                shape.append('f')
+            except ValueError:
+                shape.append('s')
+    return tuple(shape)
+
+
+def is_same_shape(shape: tuple, other: tuple) -> bool:
+    return len(shape) == len(other) and \
+        all(a == b or a == '' or b == '' for a, b in zip(shape, other))
+
+
+def first_terminator(buf, start: int, end: int):
+    """start of the first line in (start, end) which can end a loop
+    (a tag, loop_, data_, comment or text field), or None"""
+    found = [buf.find(b'\n' + p, max(start - 1, 0), end - 1)
+             for p in (TAG, LOOP_, DATA_, b'#', TEXT)]
+    found = [i + 1 for i in found if i >= 0]
+    return min(found) if found else None
+
+
+def find_loop_end(buf, start: int, size: int, min_step: int = MIN_STEP):
+    """
+    Offset of the first line after the rows of a loop body which starts
+    at start. Rows are assumed to be one per line and to have the same
+    shape (number and kinds of tokens) as the first row. The end is found
+    with galloping and binary search, so only O(log n) rows are read.
+    A later loop with rows of the same shape can mislead the search, so
+    the rows before the end found are checked for loop terminators (at
+    memchr speed); if there is one, the search is repeated up to it.
+    Returns None if the rows do not look uniform.
+    """
+    first = read_line(buf, start, size)
+    if is_loop_terminator(first) or first.startswith(TEXT):
+        return None
+    shape = get_row_shape(first)
+
+    def search(limit):
+        def is_row(pos):
+            a = next_line_start(buf, pos, limit)
+            return a < limit and is_same_shape(
+                shape, get_row_shape(read_line(buf, a, limit)))
+
+        lo, hi, step = start, limit, min_step
+        while lo + step < limit:
+            if is_row(lo + step):
+                lo += step
+                step *= 2
+            else:
+                hi = lo + step
+                break
+
+        while hi - lo > min_step:
+            mid = (lo + hi) // 2
+            if is_row(mid):
+                lo = mid
+            else:
+                hi = mid
+
+        pos = next_line_start(buf, lo, limit)
+        while pos < limit:
+            line = read_line(buf, pos, limit)
+            if not is_same_shape(shape, get_row_shape(line)):
+                break
+            pos += len(line)
+        return pos
+
+    pos = search(size)
+    terminator = first_terminator(buf, start, pos)
+    if terminator is not None:
+        pos = search(terminator)
+
+    if pos < size and not is_loop_terminator(read_line(buf, pos, size)):
+        return None
+    return pos
+
+
+def get_tag_category(line: bytes) -> str:
+    """b'_atom_site.id 1' -> '_atom_site'"""
+    tag = line.split(None, 1)[0] if line.strip() else b''
+    return tag.split(b'.', 1)[0].decode('ascii', 'ignore').lower()
+
+
+class CategoryIndex(object):
+    """
+    Byte offsets of the categories of a text mmCIF file.
+    The file is scanned once over a memory map by searching for line
+    prefixes (bytes.find runs at memchr speed), so loop rows
+    (e.g. atom_site) are never visited in Python.
+    Only the first data block is indexed; tags have to start
+    at the beginning of a line, as in files written by python-ihm.
+    """
+
+    def __init__(self, fname, skip=None):
+        """Bodies of loops in skip (e.g. COORDINATE_CATEGORIES) are
+        jumped over with find_loop_end instead of being searched"""
+        self.fname = fname
+        self.skip = set(c.lower() for c in skip or [])
+        # Body (start, end) of loops which were jumped over
+        self.loop_bodies = {}
+        # (category, start, end); sections cover the file contiguously
+        self.sections = self.scan()
+
+    def scan(self) -> list:
+        with open(self.fname, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                return []
+            with mm:
+                return self._scan(mm, len(mm))
+
+    def _scan(self, buf, size: int) -> list:
+        sections = []
+        category = None     # category of the current section
+        start = 0           # start of the current section
+        in_loop = False     # current section is a loop
+        in_header = False   # reading tags of the loop header
+        last_tag_end = 0    # end of the last header tag line
+        in_text = False
+        blocks = 0
+
+        def new_section(pos, cat):
+            nonlocal category, start
+            if pos > start or category is not None:
+                sections.append((category, start, pos))
+            category, start = cat, pos
+
+        starts = LineStarts(buf, size)
+        next_pos = 0
+        while True:
+            pos, kind = starts.find(next_pos)
+            if pos >= size:
+                break
+            next_pos = pos + 1
+
+            if kind == TEXT:
+                in_text = not in_text
+                continue
+            if in_text:
+                continue
+
+            if kind == DATA_:
+                blocks += 1
+                if blocks > 1:
+                    # Only the first data block is indexed
+                    new_section(pos, None)
+                    start = size
+                    break
+                new_section(pos, 'data_')
+                in_loop = in_header = False
+            elif kind == LOOP_:
+                new_section(pos, None)
+                in_loop, in_header = True, True
+                last_tag_end = buf.find(b'\n', pos) + 1
+            else:
+                line_end = buf.find(b'\n', pos) + 1 or size
+                cat = get_tag_category(buf[pos:line_end])
+                if in_loop and in_header and category is None:
+                    # First tag of the loop header
+                    category = cat
+                    last_tag_end = line_end
+                elif in_loop and in_header and pos == last_tag_end \
+                        and cat == category:
+                    last_tag_end = line_end
+                elif not in_loop and cat == category:
+                    # Next key-value pair of the same category
+                    continue
+                else:
+                    new_section(pos, cat)
+                    in_loop = in_header = False
+                    continue
+                if in_loop and category in self.skip \
+                        and buf[line_end:line_end + 1] != TAG:
+                    # Last tag of the header; jump over the loop body
+                    end = find_loop_end(buf, line_end, size)
+                    if end is not None:
+                        self.loop_bodies[category] = (line_end, end)
+                        in_header = False
+                        next_pos = end
+
+        if start < size:
+            sections.append((category, start, size))
+
+        return sections
+
+    def get_categories(self) -> dict:
+        """size in bytes of each category"""
+        sizes = defaultdict(int)
+        for cat, start, end in self.sections:
+            if cat is not None:
+                sizes[cat] += end - start
+        return dict(sizes)
+
+    def get_ranges(self, categories=None, exclude=None) -> list:
+        """byte ranges of the selected categories in file order.
+        The data block header is always included"""
+        if categories is not None:
+            categories = set(c.lower() for c in categories)
+        exclude = set(c.lower() for c in exclude or [])
+
+        ranges = []
+        for cat, start, end in self.sections:
+            if cat is None:
+                continue
+            if cat != 'data_':
+                if categories is not None and cat not in categories:
+                    continue
+                if cat in exclude:
+                    continue
+            # Merge adjacent ranges
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def read(self, categories=None, exclude=None) -> bytes:
+        """raw text of the selected categories"""
+        out = []
+        with open(self.fname, 'rb') as f:
+            for start, end in self.get_ranges(categories, exclude):
+                f.seek(start)
+                chunk = f.read(end - start)
+                out.append(chunk)
+                if not chunk.endswith(b'\n'):
+                    out.append(b'\n')
+        return b''.join(out)
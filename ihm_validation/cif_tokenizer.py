@@ -0,0 +1,179 @@
+###################################
+# Script :
+# 1) Contains streaming tokenizer
+# for text mmCIF files
+#
+###################################
+
+from typing import Iterator
+
+# Event types produced by iter_cif_events
+DATA = 'data'
+ITEM = 'item'
+LOOP = 'loop'
+ROWS = 'rows'
+OTHER = 'other'
+
+
+def split_line(line: str) -> list:
+    """
+    Split a line into CIF tokens. Quoted values are returned
+    with their quotes; comments are dropped
+    """
+    tokens = []
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if c.isspace():
+            i += 1
+        elif c == '#':
+            break
+        elif c in '\'"':
+            # Quote closes only if followed by whitespace or end of line
+            j = i + 1
+            while j < n:
+                if line[j] == c and (j + 1 == n or line[j + 1].isspace()):
+                    break
+                j += 1
+            tokens.append(line[i:j + 1])
+            i = j + 1
+        else:
+            j = i
+            while j < n and not line[j].isspace():
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+
+def unquote(token: str) -> str:
+    """Remove quotes or text field markers from a token"""
+    if len(token) >= 2 and token[0] in '\'"' and token[-1] == token[0]:
+        return token[1:-1]
+    if token.startswith(';'):
+        return token[1:].rstrip('\n').rstrip(';').strip('\n')
+    return token
+
+
+def is_missing(token: str) -> bool:
+    """Check for CIF null values"""
+    return token in ('.', '?')
+
+
+def get_category(tag: str) -> str:
+    """_atom_site.id -> _atom_site"""
+    return tag.split('.', 1)[0].lower()
+
+
+def iter_cif_events(fh) -> Iterator[tuple]:
+    """
+    Stream through a text mmCIF file and yield (event, payload, lines)
+    tuples, where lines are the original lines of the event:
+
+    (DATA, block name, lines)
+    (ITEM, (tag, value token), lines)   non-looped key-value pair
+    (LOOP, list of tags, lines)         loop_ header
+    (ROWS, list of rows, lines)         complete loop rows as token lists
+    (OTHER, None, lines)                comments and empty lines
+
+    Only one loop row (or one text field) is kept in memory at a time.
+    """
+    tags = None         # tags of the current loop
+    header = []         # lines of the current loop_ header
+    in_body = False     # reading rows of the current loop
+    pending = []        # tokens of incomplete row
+    pending_lines = []  # lines of incomplete row/item
+    item_tag = None     # tag waiting for its value
+    text = None         # lines of the current semicolon text field
+
+    def start_body():
+        nonlocal in_body
+        in_body = True
+        return LOOP, tags, header
+
+    def complete_rows():
+        """yield pending tokens if they form complete rows"""
+        nonlocal pending, pending_lines
+        n = len(tags)
+        if len(pending) % n == 0:
+            rows = [pending[i:i + n] for i in range(0, len(pending), n)]
+            yield ROWS, rows, pending_lines
+            pending, pending_lines = [], []
+
+    def end_loop():
+        """finish current loop; yields header of an empty loop and
+        lines of an incomplete row"""
+        nonlocal tags, in_body, pending, pending_lines
+        if tags is not None and not in_body:
+            yield LOOP, tags, header
+        if pending:
+            yield OTHER, None, pending_lines
+        tags, in_body = None, False
+        pending, pending_lines = [], []
+
+    for line in fh:
+        # Semicolon text fields
+        if text is not None:
+            text.append(line)
+            if line.startswith(';'):
+                token = ''.join(text)
+                text = None
+                if item_tag is not None:
+                    yield ITEM, (item_tag, token), pending_lines + [token]
+                    item_tag, pending_lines = None, []
+                elif tags:
+                    pending.append(token)
+                    pending_lines.append(token)
+                    yield from complete_rows()
+                else:
+                    yield OTHER, None, [token]
+            continue
+
+        if line.startswith(';'):
+            text = [line]
+            if item_tag is None and tags is not None and not in_body:
+                yield start_body()
+            continue
+
+        tokens = split_line(line)
+        if len(tokens) == 0:
+            if tags is not None and not in_body:
+                header.append(line)
+            elif item_tag is not None or pending:
+                pending_lines.append(line)
+            else:
+                yield OTHER, None, [line]
+            continue
+
+        first = tokens[0].lower()
+        if first.startswith('data_'):
+            yield from end_loop()
+            yield DATA, tokens[0][5:], [line]
+        elif first == 'loop_':
+            yield from end_loop()
+            tags, header = [], [line]
+        elif first.startswith('_'):
+            if tags is not None and not in_body:
+                tags.append(tokens[0])
+                header.append(line)
+                continue
+            yield from end_loop()
+            if len(tokens) > 1:
+                yield ITEM, (tokens[0], tokens[1]), [line]
+            else:
+                item_tag, pending_lines = tokens[0], [line]
+        elif item_tag is not None:
+            yield ITEM, (item_tag, tokens[0]), pending_lines + [line]
+            item_tag, pending_lines = None, []
+        elif tags:
+            if not in_body:
+                yield start_body()
+            pending.extend(tokens)
+            pending_lines.append(line)
+            yield from complete_rows()
+        else:
+            yield OTHER, None, [line]
+
+    yield from end_loop()
+    if item_tag is not None or text is not None:
+        yield OTHER, None, pending_lines + (text or [])
@@ -0,0 +1,147 @@
+###################################
+# Script :
+# 1) Contains class for sequence
+# connectivity of coarse-grained
+# models
+#
+###################################
+from mmcif_io import GetInputInformation
+from array_model import get_sphere_table
+import numpy as np
+import logging
+
+# Largest gap (A) between surfaces of sequence-consecutive beads
+CONNECTIVITY_TOLERANCE = 2.
+
+# Largest number of coordinates of models evaluated at once
+MAX_BLOCK_SIZE = 1 << 24
+
+
+def get_consecutive_pairs(table: dict) -> np.ndarray:
+    """
+    (i, j) indices of sequence-consecutive beads, i.e. beads of the same
+    chain where j starts at the residue after the end of i, ordered by
+    chain and residue
+    """
+    asym_id = table['asym_id'].astype(str)
+    order = np.lexsort((table['seq_id_begin'], asym_id))
+    i, j = order[:-1], order[1:]
+    mask = (asym_id[i] == asym_id[j]) \
+        & (table['seq_id_begin'][j] == table['seq_id_end'][i] + 1)
+    return np.column_stack([i[mask], j[mask]]).astype(np.intp)
+
+
+def get_gaps(xyz: np.ndarray, radii: np.ndarray,
+             pairs: np.ndarray) -> np.ndarray:
+    """
+    (models, pairs) distances between surfaces of beads of pairs;
+    xyz is (models, beads, 3)
+    """
+    d = np.linalg.norm(xyz[:, pairs[:, 1]] - xyz[:, pairs[:, 0]], axis=2)
+    return d - radii[pairs].sum(axis=1)
+
+
+def get_chain_starts(chains: np.ndarray) -> np.ndarray:
+    """first indices of runs of the same chain"""
+    return np.flatnonzero(np.r_[True, chains[1:] != chains[:-1]])
+
+
+def get_empty_tables() -> (dict, dict):
+    """empty summary and outlier tables"""
+    summary = {'Model': [], 'Chain': [], 'Consecutive bead pairs': [],
+               'Outliers': [], 'Maximum gap (A)': []}
+    outliers = {'Model': [], 'Chain': [],
+                'Residue begin 1': [], 'Residue end 1': [],
+                'Residue begin 2': [], 'Residue end 2': [],
+                'Gap (A)': []}
+    return summary, outliers
+
+
+def add_block_results(summary: dict, outliers: dict, numbers: list,
+                      xyz: np.ndarray, table: dict,
+                      tolerance: float = CONNECTIVITY_TOLERANCE) -> None:
+    """
+    add results of models with the same beads to the summary and outlier
+    tables; xyz is (models, beads, 3) and table is the sphere table of
+    any of the models
+    """
+    pairs = get_consecutive_pairs(table)
+    if len(pairs) == 0:
+        return
+    gaps = get_gaps(xyz, table['radius'], pairs)
+    outlier = gaps > tolerance
+    chains = table['asym_id'][pairs[:, 0]]
+    starts = get_chain_starts(chains)
+    sizes = np.diff(np.r_[starts, len(pairs)])
+    counts = np.add.reduceat(outlier, starts, axis=1)
+    largest = np.maximum.reduceat(gaps, starts, axis=1)
+
+    models = len(numbers)
+    summary['Model'] += np.repeat(numbers, len(starts)).tolist()
+    summary['Chain'] += np.tile(chains[starts], models).tolist()
+    summary['Consecutive bead pairs'] += np.tile(sizes, models).tolist()
+    summary['Outliers'] += counts.ravel().tolist()
+    summary['Maximum gap (A)'] += np.round(largest.ravel(), 2).tolist()
+
+    m, k = np.nonzero(outlier)
+    i, j = pairs[k].T
+    outliers['Model'] += np.asarray(numbers)[m].tolist()
+    outliers['Chain'] += chains[k].tolist()
+    outliers['Residue begin 1'] += table['seq_id_begin'][i].tolist()
+    outliers['Residue end 1'] += table['seq_id_end'][i].tolist()
+    outliers['Residue begin 2'] += table['seq_id_begin'][j].tolist()
+    outliers['Residue end 2'] += table['seq_id_end'][j].tolist()
+    outliers['Gap (A)'] += np.round(gaps[m, k], 2).tolist()
+
+
+class GetSequenceConnectivity(GetInputInformation):
+    def __init__(self, mmcif_file, system=None,
+                 tolerance=CONNECTIVITY_TOLERANCE):
+        super().__init__(mmcif_file, system=system)
+        self.tolerance = tolerance
+
+    def iter_blocks(self):
+        """
+        yield (model numbers, coordinates (models, beads, 3), sphere table)
+        of consecutive models with the same beads (radii, chains and
+        residue ranges)
+        """
+        numbers, xyz, first = [], [], None
+        for ids, model in self.iter_models():
+            table = get_sphere_table(model)
+            same = first is not None and all(
+                np.array_equal(table[k], first[k])
+                for k in ('radius', 'asym_id', 'seq_id_begin', 'seq_id_end'))
+            if xyz and (not same or
+                        (len(xyz) + 1) * len(table['radius']) * 3 > MAX_BLOCK_SIZE):
+                yield numbers, np.stack(xyz), first
+                numbers, xyz = [], []
+            if not same:
+                first = table
+            numbers.append(ids['model_number'])
+            xyz.append(table['xyz'])
+        if xyz:
+            yield numbers, np.stack(xyz), first
+
+    def run_connectivity(self) -> (dict, dict):
+        """
+        summary per model and chain and table of outliers, i.e.
+        sequence-consecutive beads further apart than the sum of their
+        radii plus tolerance. Models with the same beads are evaluated
+        together with array operations
+        """
+        summary, outliers = get_empty_tables()
+        for numbers, xyz, table in self.iter_blocks():
+            add_block_results(summary, outliers, numbers, xyz, table,
+                              self.tolerance)
+
+        logging.info(f'Sequence connectivity: {len(outliers["Model"])} '
+                     f'outliers in {len(set(summary["Model"]))} models')
+        return summary, outliers
+
+    @staticmethod
+    def get_largest_outliers(outliers: dict, top: int = None) -> dict:
+        """outliers with the largest gaps first"""
+        order = np.argsort(np.negative(outliers['Gap (A)']),
+                           kind='stable')[:top]
+        return {k: [v[i] for i in order] for k, v in outliers.items()}
@@ -66,8 +66,8 @@ def get_hierarchy_from_model(model):
 
 
 class CxValidation(GetInputInformation):
-    def __init__(self, mmcif_file):
-        super().__init__(mmcif_file)
+    def __init__(self, mmcif_file, system=None):
+        super().__init__(mmcif_file, system=system)
         self.ID = self.get_id()
         self.ID_f = self.get_file_id()
         self.nos = self.get_number_of_models()
@@ -272,36 +272,24 @@ class CxValidation(GetInputInformation):
             self.raw_restraints.at[index, 'restraint_rtd'] = ertype_
 
     def get_measured_restraints(self):
+        """Measure restraints in each model. Models are streamed,
+        so only one model hierarchy is kept in memory at a time.
+        All models are measured, regardless of MAX_NUM_MODELS"""
         restraints = []
 
-        gistg = 0
-        gist = 0
-        gimg = 0
-        gim = 0
-        for istg, stg in enumerate(self.system.state_groups):
-            gistg += 1
-            for ist, st in enumerate(stg):
-                gist += 1
-                for img, mg in enumerate(st):
-                    gimg += 1
-                    for im, m in enumerate(mg):
-                        gim += 1
-                        m_ = self.models[gim]
-                        for index, row in self.raw_restraints.iterrows():
-                            d = self.measure_restraint(m_, row)
-
-                            ndata = {
-                                # Store as much information as we can
-                                'distance_euclidean': d,
-                                'model_number': gim,
-                                'model_group': gimg,
-                                'state': gist,
-                                'state_group': gistg,
-                            }
-
-                            nrow = row.to_dict()
-                            nrow.update(ndata)
-                            restraints.append(nrow)
+        for ids, m in self.iter_models(max_num_models=np.inf):
+            m_ = get_hierarchy_from_model(m)
+            for index, row in self.raw_restraints.iterrows():
+                d = self.measure_restraint(m_, row)
+
+                # Store as much information as we can
+                ndata = {'distance_euclidean': d}
+                ndata.update(ids)
+
+                nrow = row.to_dict()
+                nrow.update(ndata)
+                restraints.append(nrow)
+            del m_
 
         restraints = pd.DataFrame(restraints)
 
@@ -384,7 +372,6 @@ class CxValidation(GetInputInformation):
             self.rtdtypes = self.get_rtdtypes()
             self.assign_rtdtypes()
 
-            self.models = self.get_models()
             measured_restraints = self.get_measured_restraints()
 
             if len(measured_restraints) > 0:
@@ -8,47 +8,153 @@
 ###################################
 from pathlib import Path
 from mmcif_io import GetInputInformation
+from array_model import get_sphere_table, get_atom_table, spheres_to_table
+import exv_engine
+import utility
 import ihm
-import multiprocessing as mp
 import pandas as pd
 import numpy as np
-from scipy.spatial import KDTree
 import math
 import os
+import logging
 import csv
+import json
+from itertools import repeat
+from collections import deque
+from contextlib import ExitStack
 
 
 class GetExcludedVolume(GetInputInformation):
-    def __init__(self, mmcif_file, cache):
-        super().__init__(mmcif_file)
+    # Columns of the table of overlapping pairs of spheres
+    CLASH_COLUMNS = ['Model', 'Chain 1', 'Residue begin 1', 'Residue end 1',
+                     'Chain 2', 'Residue begin 2', 'Residue end 2',
+                     'Overlap (A)']
+
+    def __init__(self, mmcif_file, cache, system=None, workers=None,
+                 skin=None, rigid_bodies=False, clash_file=None,
+                 atoms=False):
+        super().__init__(mmcif_file, system=system)
         self.ID = self.get_id()
         self.ID_f = self.get_file_id()
         self.nos = self.get_number_of_models()
         self.cache = cache
+        # Number of worker processes; all available cores by default
+        self.workers = workers or exv_engine.get_available_cores()
+        # Skin distance of Verlet lists reused between consecutive models;
+        # None to evaluate each model from scratch
+        self.skin = skin
+        # Evaluate pairs within rigid bodies only once per entry
+        self.rigid_bodies = rigid_bodies
+        # Integer labels of chains (asym ids), the same in all models
+        self.chains = {}
+        # Violations per pair of chains, see get_chain_violations
+        self.chain_violations = None
+        # CSV file for all overlapping pairs of spheres; None to skip
+        self.clash_file = clash_file
+        # Summary of sampled evaluation, see run_exc_vol_sampled
+        self.sampling = None
+        # Include atoms of multi-resolution models, see get_model_spheres
+        self.atoms = atoms
 
     def get_all_spheres(self, filetemp=None):
-        """get information on all spheres for each model"""
+        """get sphere tables (coordinates, radii, chains) for each model"""
         if filetemp is None:
             model_object = [
                 b for i in self.system.state_groups for j in i for a in j for b in a]
-            model_dict = {i+1: j._spheres for i, j in enumerate(model_object)}
+            model_dict = {i+1: get_sphere_table(j) for i, j in enumerate(model_object)}
         else:
             system, = ihm.reader.read(filetemp,
-                                      model_class=ihm.model.Model)
+                                      model_class=self.model)
             model_object = [
                 b for i in system.state_groups for j in i for a in j for b in a]
-            model_dict = {i+1: j._spheres for i, j in enumerate(model_object)}
+            model_dict = {i+1: get_sphere_table(j) for i, j in enumerate(model_object)}
         return model_dict
 
-    def get_nCr(self, n, r):
+    def iter_spheres(self, rigid_bodies: bool = False):
+        """yield (model number, sphere table) one model at a time;
+        with rigid_bodies also rigid body labels of spheres"""
+        for ids, model in self.iter_models():
+            yield self.get_model_spheres(ids, model, rigid_bodies)
+
+    def get_model_spheres(self, ids: dict, model,
+                          rigid_bodies: bool = False) -> tuple:
+        """(model number, sphere table[, rigid body labels]) of a model;
+        with atoms, atoms are added to the table as spheres with van der
+        Waals radii, see add_atoms"""
+        table = get_sphere_table(model)
+        if self.atoms:
+            table = self.add_atoms(table, get_atom_table(model))
+        if rigid_bodies:
+            return (ids['model_number'], table,
+                    self.get_rigid_body_labels(model, table))
+        return ids['model_number'], table
+
+    @staticmethod
+    def add_atoms(spheres: dict, atoms: dict) -> dict:
+        """
+        sphere table of beads followed by atoms; atoms get van der Waals
+        radii and single residue ranges, and 'atom' marks them
+        """
+        return {
+            'xyz': np.concatenate([spheres['xyz'], atoms['xyz']]),
+            'radius': np.concatenate([
+                spheres['radius'],
+                exv_engine.get_vdw_radii(atoms['type_symbol'])]),
+            'asym_id': np.concatenate([spheres['asym_id'], atoms['asym_id']]),
+            'seq_id_begin': np.concatenate([spheres['seq_id_begin'],
+                                            atoms['seq_id']]),
+            'seq_id_end': np.concatenate([spheres['seq_id_end'],
+                                          atoms['seq_id']]),
+            'atom': np.concatenate([np.zeros(len(spheres['radius']), bool),
+                                    np.ones(len(atoms['xyz']), bool)]),
+        }
+
+    @staticmethod
+    def get_atom_columns(table: dict):
+        """(is atom, seq_id_begin, seq_id_end) of spheres for
+        exv_engine.select_atom_pairs; None without atoms"""
+        if not table.get('atom', np.zeros(0, bool)).any():
+            return None
+        return np.column_stack([table['atom'], table['seq_id_begin'],
+                                table['seq_id_end']]).astype(np.intp)
+
+    @staticmethod
+    def get_rigid_body_labels(model, table: dict) -> np.ndarray:
+        """
+        index of the rigid segment of model representation (the same
+        segments as in get_RB_flex_dict) for each sphere; -1 for
+        flexible spheres
+        """
+        labels = np.full(len(table['radius']), -1, dtype=np.int64)
+        if model.representation is None:
+            return labels
+        for k, el in enumerate(model.representation):
+            if not el.rigid:
+                continue
+            begin, end = el.asym_unit.seq_id_range
+            mask = (table['asym_id'] == el.asym_unit._id) \
+                & (table['seq_id_begin'] >= begin) & (table['seq_id_end'] <= end)
+            labels[mask] = k
+        return labels
+
+    def get_chain_labels(self, table: dict) -> np.ndarray:
+        """integer label of the chain of each sphere"""
+        ids, inverse = np.unique(table['asym_id'].astype(str),
+                                 return_inverse=True)
+        labels = np.array([self.chains.setdefault(i, len(self.chains))
+                           for i in ids], dtype=np.intp)
+        return labels[inverse]
+
+    @staticmethod
+    def get_nCr(n, r):
         """get all combinations"""
-        f = math.factorial
-        return (f(n)/(f(r)*f(n-r)))
+        return float(math.comb(n, r))
 
-    def get_violation_percentage(self, models_spheres_df: pd.DataFrame, viols: dict) -> float:
+    @staticmethod
+    def get_violation_percentage(models_spheres_df: pd.DataFrame, viols: dict) -> float:
         """get information on all spheres for each model"""
         number_of_violations = sum(viols.values())
-        number_of_combinations = self.get_nCr(models_spheres_df.shape[1], 2)
+        number_of_combinations = GetExcludedVolume.get_nCr(models_spheres_df.shape[1], 2)
         return (1-number_of_violations/number_of_combinations)*100
 
     def get_violation_normalized(self, models_spheres_df: pd.DataFrame, viols: dict) -> float:
@@ -60,72 +166,54 @@ class GetExcludedVolume(GetInputInformation):
             models_spheres_df.shape[1], 10)
         return (1-number_of_violations/normalization_constant)*100
 
-    def get_xyzr(self, spheres: pd.DataFrame) -> pd.DataFrame:
-        """ get X,Y, Z coords from sphere objects"""
-        # model_spheres={i+1:[j.x,j.y,j.z,j.radius] for i,j in enumerate(spheres)}
-        # model_spheres_df=pd.DataFrame(model_spheres, index=['X','Y','Z','R'])
-        model_spheres_df = pd.DataFrame.from_records([(j.x, j.y, j.z, j.radius)
-                                                      for i, j in enumerate(spheres)], columns=['X', 'Y', 'Z', 'R'])
+    @staticmethod
+    def as_sphere_table(spheres) -> dict:
+        """ accept sphere table or list of sphere objects"""
+        if isinstance(spheres, dict):
+            return spheres
+        return spheres_to_table(spheres)
+
+    @staticmethod
+    def get_xyzr(spheres) -> pd.DataFrame:
+        """ get X,Y, Z coords from sphere table"""
+        table = GetExcludedVolume.as_sphere_table(spheres)
+        model_spheres_df = pd.DataFrame(
+            np.column_stack([table['xyz'], table['radius']]),
+            columns=['X', 'Y', 'Z', 'R'])
         model_spheres_df.index += 1
         return model_spheres_df.T
 
-    def get_xyzr_complete(self, model_ID, spheres: list) -> pd.DataFrame:
-        """ get X,Y,Z,R, chain and model ID from sphere objects"""
-
-        # model_spheres={i+1:[j.x,j.y,j.z,j.radius,j.asym_unit._id,model_ID] for i,j in enumerate(spheres)}
-        # model_spheres_df=pd.DataFrame(model_spheres, index=['X','Y','Z','R','Chain_ID','Model_ID'])
-        model_spheres_df = pd.DataFrame.from_records([(j.x, j.y, j.z, j.radius, j.asym_unit._id, model_ID)
-                                                      for i, j in enumerate(spheres)], columns=['X', 'Y', 'Z', 'R',
-                                                                                                'Chain_ID', 'Model_ID'])
+    def get_xyzr_complete(self, model_ID, spheres) -> pd.DataFrame:
+        """ get X,Y,Z,R, chain and model ID from sphere table"""
+        table = self.as_sphere_table(spheres)
+        model_spheres_df = pd.DataFrame(
+            np.column_stack([table['xyz'], table['radius']]),
+            columns=['X', 'Y', 'Z', 'R'])
+        model_spheres_df['Chain_ID'] = table['asym_id']
+        model_spheres_df['Model_ID'] = model_ID
         model_spheres_df.index += 1
         return model_spheres_df
 
-    def get_violation_dict(self, model_spheres_df: pd.DataFrame) -> dict:
-        """ get violation from model_sphere df"""
-        viols = {}
-
-        # Get coordinates
+    @staticmethod
+    def get_violation_dict(model_spheres_df: pd.DataFrame) -> dict:
+        """ get violation from model_sphere df; number of overlaps
+        of each sphere with spheres of higher index"""
         xyz = model_spheres_df.T[['X', 'Y', 'Z']].to_numpy()
-        # Get radii
-        radii = model_spheres_df.T[['R']].to_numpy()
-        # Get maximum radius
-        maxr = np.max(radii)
-        # Build tree
-        t = KDTree(xyz)
-
-        # The enumeration is done to preveserve
-        # compatibility as it's a drop-in replacement
-        for indx, i in enumerate(range(len(xyz) - 1), 1):
-            viols_ = 0.
-            # Get neighours in R1+R2 radius, where
-            # R1 is particle's i radius
-            # and R2 is the maxium radius
-            # Thus it's a greedy search
-            nb = t.query_ball_point(xyz[i], radii[i] + maxr)
-
-            # Check each neighbour
-            for j in nb:
-                # Only check pairs in a triangle
-                if j > i:
-                    # np.linalg.norm is slow, but convenient
-                    d = np.linalg.norm(xyz[i] - xyz[j])
-                    if d < (radii[i] + radii[j]):
-                        viols_ += 1.
-
-            viols[indx] = viols_
-
-        return viols
+        radii = model_spheres_df.T['R'].to_numpy()
+        viols = exv_engine.get_violations_per_sphere(xyz, radii)
+        # The last sphere has no pairs of higher index
+        return {indx: float(v) for indx, v in enumerate(viols[:-1], 1)}
 
     def get_exc_vol_for_models(self, model_dict: dict) -> dict:
         excluded_volume = {
             'Models': [], 'Excluded Volume Satisfaction (%)': [], 'Number of violations': []}
         for indx, model in model_dict.items():
             excluded_volume['Models'].append(indx)
-            df = self.get_xyzr(model)
+            satisfaction, violations = self.get_exc_vol_given_sphere_parallel(
+                model)
             excluded_volume['Excluded Volume Satisfaction (%)'].append(
-                round(self.get_violation_percentage(df, self.get_violation_dict(df)), 2))
-            excluded_volume['Number of violations'].append(
-                sum(self.get_violation_dict(df).values()))
+                satisfaction)
+            excluded_volume['Number of violations'].append(violations)
         # open(os.path.join(os.getcwd(), self.resultpath, self.ID+'exv.txt'), 'w+')
         return excluded_volume
 
@@ -143,38 +231,305 @@ class GetExcludedVolume(GetInputInformation):
                 round(satisfaction, 2))
         return excluded_volume
 
-    def get_exc_vol_given_sphere_parallel(self, sphere_list: list) -> (float, int):
+    @staticmethod
+    def get_exc_vol_given_sphere_parallel(sphere_list) -> (float, int):
         """
         get violations from cart coords
         """
-        df = self.get_xyzr(sphere_list)
-        violation_dict = self.get_violation_dict(df)
+        table = GetExcludedVolume.as_sphere_table(sphere_list)
+        violations = exv_engine.count_violations(table['xyz'], table['radius'])
         satisfaction = round(
-            self.get_violation_percentage(df, violation_dict), 2)
-        violations = sum(violation_dict.values())
-        return (satisfaction, violations)
-
-    def run_exc_vol_parallel(self, model_dict: dict) -> dict:
-        """ get exc vol info in parallel """
-        # list_of_sphere_list=list(model_dict.values())
-        filename = str(Path(self.cache, self.ID_f + '_exv.txt'))
-        if os.path.exists(filename):
-            return self.process_exv(filename)
-
-        pool = mp.Pool(processes=min(4, len(model_dict.keys())))
-        complete_list = pool.map(
-            self.get_exc_vol_given_sphere_parallel, list(model_dict.values()))
-        excluded_volume = {'Models': list(model_dict.keys()),
-                           'Excluded Volume Satisfaction (%)': [i[0] for i in complete_list],
-                           'Number of violations': [i[1] for i in complete_list]}
+            exv_engine.get_satisfaction(len(table['radius']), violations), 2)
+        # Float as returned by the original per-sphere loop
+        return (satisfaction, float(violations))
+
+    def run_exc_vol_parallel(self, model_dict: dict = None) -> dict:
+        """
+        get exc vol info in parallel. Models are copied in chunks
+        to shared memory, which worker processes read without copying.
+        Without model_dict models are streamed from the system; then
+        in rigid body mode violations within rigid bodies and other
+        violations are also reported separately. Violations per pair
+        of chains are stored in chain_violations. With clash_file,
+        overlapping pairs are written there one model at a time
+        """
+        rigid = self.rigid_bodies and model_dict is None
+        filename = self.get_cache_filename('_exv_rb' if rigid else '_exv')
+        if self.is_cached(filename):
+            return self.read_cached(filename)
+
+        if model_dict is None:
+            models = self.iter_spheres(rigid_bodies=rigid)
+        else:
+            models = iter(model_dict.items())
+
+        excluded_volume = self.evaluate_models(models, rigid, skin=self.skin)
+        self.write_cache(filename, excluded_volume)
+        return excluded_volume
+
+    def run_exc_vol_sampled(self, max_models: int = None,
+                            tolerance: float = None, strategy: str = 'random',
+                            seed: int = 0, confidence: float = 0.95,
+                            batch: int = 10) -> dict:
+        """
+        get exc vol info for a sample of at most max_models models, drawn
+        with exv_engine.get_sample_order. With tolerance, sampling stops
+        early once the confidence interval of the mean satisfaction is
+        narrower than tolerance (percentage points); this is checked every
+        batch models (one model per stratum in stratified sampling).
+        Rows are sorted by model number; the summary is stored in sampling
+        """
+        rigid = self.rigid_bodies
+        models = list(self.iter_models())
+        total = len(models)
+        max_models = min(max_models or total, total)
+        filename = self.get_cache_filename(
+            f'_exv_sample_{strategy}_{seed}_{max_models}_{tolerance}_{confidence}_{batch}'
+            + ('_rb' if rigid else ''))
+        summary_filename = filename.replace('.txt', '_summary.json')
+        if self.is_cached(filename) and os.path.exists(summary_filename):
+            with open(summary_filename) as f:
+                self.sampling = json.load(f)
+            return self.read_cached(filename)
+
+        order = exv_engine.get_sample_order(total, strategy, seed, strata=batch)
+
+        def iter_sample():
+            for k in order[:max_models]:
+                yield self.get_model_spheres(*models[k], rigid_bodies=rigid)
+
+        def stop(excluded_volume: dict) -> bool:
+            satisfaction = excluded_volume['Excluded Volume Satisfaction (%)']
+            if tolerance is None or len(satisfaction) % batch:
+                return False
+            low, high = exv_engine.get_confidence_interval(
+                satisfaction, total, confidence)
+            return high - low < tolerance
 
+        excluded_volume = self.evaluate_models(iter_sample(), rigid, stop=stop)
+
+        order = np.argsort(excluded_volume['Models'], kind='stable')
+        excluded_volume = {k: [v[i] for i in order]
+                           for k, v in excluded_volume.items()}
+        satisfaction = excluded_volume['Excluded Volume Satisfaction (%)']
+        low, high = exv_engine.get_confidence_interval(satisfaction, total,
+                                                       confidence)
+        self.sampling = {
+            'Sampling': strategy,
+            'Seed': seed,
+            'Evaluated models': len(satisfaction),
+            'Total models': total,
+            'Stopped early': len(satisfaction) < max_models,
+            'Mean satisfaction (%)': round(float(np.mean(satisfaction)), 2)
+            if satisfaction else None,
+            f'{confidence * 100:g}% confidence interval (%)':
+                f'{low:.2f}-{high:.2f}' if np.isfinite(high - low) else utility.NA,
+            'Minimum satisfaction (%)': min(satisfaction, default=None),
+            'Maximum satisfaction (%)': max(satisfaction, default=None),
+        }
+        logging.info(f'Excluded volume evaluated for {len(satisfaction)} '
+                     f'of {total} sampled models')
+
+        self.write_cache(filename, excluded_volume)
+        with open(summary_filename, 'w') as f:
+            json.dump(self.sampling, f)
+        return excluded_volume
+
+    def get_cache_filename(self, suffix: str) -> str:
+        if self.atoms:
+            suffix += '_atoms'
+        return str(Path(self.cache, self.ID_f + suffix + '.txt'))
+
+    def is_cached(self, filename: str) -> bool:
+        return os.path.exists(filename) and (
+            self.clash_file is None or os.path.exists(self.clash_file))
+
+    def read_cached(self, filename: str) -> dict:
+        """cached results and chain violations, if any"""
+        chains_filename = filename.replace('.txt', '_chains.csv')
+        if os.path.exists(chains_filename):
+            self.chain_violations = pd.read_csv(
+                chains_filename, dtype={'Chain 1': str, 'Chain 2': str},
+                keep_default_na=False).to_dict(orient='list')
+        return self.process_exv(filename)
+
+    def write_cache(self, filename: str, excluded_volume: dict) -> None:
         with open(filename, "w+") as file:
             write_file = csv.writer(file)
             for key, val in excluded_volume.items():
                 write_file.writerow([key, val])
+        pd.DataFrame(self.chain_violations).to_csv(
+            filename.replace('.txt', '_chains.csv'), index=False)
+
+    def evaluate_models(self, models, rigid: bool = False, skin: float = None,
+                        stop=None) -> dict:
+        """
+        exc vol table of (model number, spheres[, rigid body labels])
+        of models in order; stop(excluded_volume) is called after each
+        model and ends the evaluation if True
+        """
+        excluded_volume = {'Models': [],
+                           'Excluded Volume Satisfaction (%)': [],
+                           'Number of violations': []}
+        if rigid:
+            excluded_volume['Intra-rigid-body violations'] = []
+            excluded_volume['Flexible and inter-body violations'] = []
+        if self.atoms:
+            for kind in exv_engine.PAIR_KINDS:
+                excluded_volume[f'{kind.capitalize()} violations'] = []
+        chain_violations = {'Models': [], 'Chain 1': [], 'Chain 2': [],
+                            'Number of violations': []}
+
+        # (model number, sphere table) of models sent to the workers
+        sent = deque()
+
+        def iter_arrays():
+            for indx, spheres, *bodies in models:
+                table = self.as_sphere_table(spheres)
+                sent.append((indx, table))
+                yield (table['xyz'], table['radius'],
+                       bodies[0] if bodies else None,
+                       self.get_chain_labels(table),
+                       self.get_atom_columns(table))
+
+        clashes = self.clash_file is not None
+        if rigid:
+            results = exv_engine.iter_rigid_body_violations(
+                iter_arrays(), workers=self.workers, details=True,
+                clashes=clashes)
+        else:
+            results = exv_engine.iter_violations_parallel(
+                iter_arrays(), workers=self.workers, skin=skin,
+                details=True, clashes=clashes)
 
+        with ExitStack() as stack:
+            # Release workers and shared memory if stopped early
+            stack.callback(results.close)
+            if clashes:
+                clash_fh = stack.enter_context(open(self.clash_file, 'w'))
+                clash_fh.write(','.join(self.CLASH_COLUMNS) + '\n')
+            for result in results:
+                indx, table = sent.popleft()
+                self.add_model_results(excluded_volume, chain_violations,
+                                       indx, table, result)
+                if clashes:
+                    parts = result if rigid else (result,)
+                    self.write_clashes(
+                        clash_fh, indx, table,
+                        np.concatenate([r['pairs'] for r in parts]),
+                        np.concatenate([r['overlap'] for r in parts]))
+                if stop is not None and stop(excluded_volume):
+                    break
+
+        self.chain_violations = chain_violations
         return excluded_volume
 
+    def add_model_results(self, excluded_volume: dict, chain_violations: dict,
+                          indx, table: dict, result) -> None:
+        """add engine results of a model to the tables"""
+        n = len(table['radius'])
+        # Bonded pairs of atoms are not tested, so they are not counted
+        # as satisfied either
+        bonded = exv_engine.get_bonded_pair_count(
+            self.get_chain_labels(table), self.get_atom_columns(table))
+        rigid = isinstance(result, tuple)
+        if rigid:
+            violations = result[0]['violations'] + result[1]['violations']
+            matrix = (result[0]['chain_pairs']
+                      + result[1]['chain_pairs']).tocoo()
+        else:
+            violations, matrix = result['violations'], result['chain_pairs']
+        excluded_volume['Models'].append(indx)
+        excluded_volume['Excluded Volume Satisfaction (%)'].append(
+            round(exv_engine.get_satisfaction(n, violations, bonded), 2))
+        # Float as returned by the original per-sphere loop
+        excluded_volume['Number of violations'].append(float(violations))
+        if rigid:
+            excluded_volume['Intra-rigid-body violations'].append(
+                float(result[0]['violations']))
+            excluded_volume['Flexible and inter-body violations'].append(
+                float(result[1]['violations']))
+        if self.atoms:
+            parts = result if rigid else (result,)
+            for kind in exv_engine.PAIR_KINDS:
+                excluded_volume[f'{kind.capitalize()} violations'].append(
+                    float(sum(r.get('pair_kinds', {'bead-bead': r['violations']})
+                              .get(kind, 0) for r in parts)))
+        self.add_chain_violations(chain_violations, indx, matrix)
+
+    @staticmethod
+    def get_csv_field(value) -> str:
+        """value quoted for CSV if needed"""
+        value = str(value)
+        if any(c in value for c in ',"\n\r'):
+            return '"' + value.replace('"', '""') + '"'
+        return value
+
+    @staticmethod
+    def write_clashes(fh, model_ID, table: dict, pairs: np.ndarray,
+                      overlap: np.ndarray) -> None:
+        """
+        write overlapping pairs of spheres of a model, in index order,
+        as CSV rows. Chain and residue range fields are formatted once
+        per sphere in pairs rather than once per pair
+        """
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        # Spheres in pairs and positions of pair members among them
+        spheres, inverse = np.unique(pairs[order], return_inverse=True)
+        i, j = inverse.reshape(-1, 2).T
+        asym_id = table['asym_id'][spheres].tolist()
+        names = {a: GetExcludedVolume.get_csv_field(a) for a in set(asym_id)}
+        labels = np.array([f'{names[a]},{b},{e}' for a, b, e in zip(
+            asym_id, table['seq_id_begin'][spheres].tolist(),
+            table['seq_id_end'][spheres].tolist())] or [''], dtype=object)
+        model = GetExcludedVolume.get_csv_field(model_ID)
+        overlap = np.round(overlap[order].astype(np.float64), 3)
+        fh.write(''.join([f'{model},{a},{b},{o}\n' for a, b, o in zip(
+            labels[i].tolist(), labels[j].tolist(), overlap.tolist())]))
+
+    def add_chain_violations(self, chain_violations: dict, model_ID,
+                             matrix) -> None:
+        """add nonzero entries of a sparse chain pair matrix to the table"""
+        names = np.empty(len(self.chains), dtype=object)
+        for name, label in self.chains.items():
+            names[label] = name
+        order = np.lexsort((matrix.col, matrix.row))
+        chain_violations['Models'].extend([model_ID] * len(order))
+        chain_violations['Chain 1'].extend(names[matrix.row[order]])
+        chain_violations['Chain 2'].extend(names[matrix.col[order]])
+        chain_violations['Number of violations'].extend(
+            int(v) for v in matrix.data[order])
+
+    def get_chain_violations(self) -> dict:
+        """
+        violations within (Chain 1 == Chain 2) and between pairs of chains
+        for each model, only for pairs with violations; available after
+        run_exc_vol_parallel
+        """
+        return self.chain_violations
+
+    @staticmethod
+    def get_chain_violation_summary(chain_violations: dict, models: int,
+                                    top: int = None) -> dict:
+        """
+        violations per pair of chains over all models, pairs with
+        most violations first
+        """
+        df = pd.DataFrame(chain_violations,
+                          columns=['Models', 'Chain 1', 'Chain 2',
+                                   'Number of violations'])
+        grouped = df.groupby(['Chain 1', 'Chain 2'])['Number of violations']
+        summary = pd.DataFrame({
+            'Models with violations': grouped.size(),
+            'Mean number of violations': (grouped.sum() / max(models, 1)).round(2),
+            'Maximum number of violations': grouped.max()}).reset_index()
+        summary = summary.sort_values(
+            ['Mean number of violations', 'Chain 1', 'Chain 2'],
+            ascending=[False, True, True])
+        if top is not None:
+            summary = summary.head(top)
+        return summary.to_dict(orient='list')
+
     def process_exv(self, filename: str) -> dict:
         '''
         function to format exv file, if exv has already been evaluated
@@ -0,0 +1,674 @@
+###################################
+# Script :
+# 1) Contains vectorized excluded
+# volume calculation on arrays of
+# sphere coordinates and radii
+#
+###################################
+
+import os
+import math
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+from itertools import islice
+from collections import deque
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy import stats
+
+# Largest ratio of radii of spheres in the same radius class
+RADIUS_CLASS_RATIO = 2.
+
+# Van der Waals radii of elements (Bondi, 1964); other elements get
+# DEFAULT_VDW_RADIUS
+VDW_RADII = {'H': 1.20, 'C': 1.70, 'N': 1.55, 'O': 1.52, 'F': 1.47,
+             'P': 1.80, 'S': 1.80, 'CL': 1.75, 'BR': 1.85, 'I': 1.98,
+             'SE': 1.90, 'NA': 2.27, 'K': 2.75, 'MG': 1.73, 'ZN': 1.39,
+             'CU': 1.40, 'FE': 1.94}
+DEFAULT_VDW_RADIUS = 1.70
+
+# Atoms overlap only if their van der Waals spheres overlap by at least
+# this much (A), as for MolProbity clashes
+ATOM_OVERLAP_TOLERANCE = 0.4
+
+# Number of columns of each element of a model tuple
+# (xyz, radii, bodies, chains, atoms) in shared memory
+MODEL_COLUMNS = (3, 1, 1, 1, 3)
+
+# Types of overlapping pairs in models with atoms and beads
+PAIR_KINDS = ('atom-atom', 'atom-bead', 'bead-bead')
+
+
+def get_number_of_pairs(n: int) -> int:
+    """number of unique pairs of n spheres"""
+    return math.comb(n, 2) if n > 1 else 0
+
+
+def get_radius_classes(radii: np.ndarray, ratio: float = RADIUS_CLASS_RATIO) -> list:
+    """
+    indices of spheres grouped in classes, where radii within
+    a class differ by less than a factor of ratio
+    """
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+    if len(radii) == 0:
+        return []
+    positive = radii[radii > 0]
+    base = positive.min() if len(positive) else 1.
+    k = np.floor(np.log(np.maximum(radii, base) / base) / np.log(ratio))
+    return [np.flatnonzero(k == c) for c in np.unique(k)]
+
+
+def get_class_trees(xyz: np.ndarray, radii: np.ndarray, index: np.ndarray,
+                    ratio: float = RADIUS_CLASS_RATIO) -> list:
+    """(indices, KD-tree, largest radius) of each radius class of spheres in index"""
+    if ratio is None:
+        classes = [index]
+    else:
+        classes = [index[c] for c in get_radius_classes(radii[index], ratio)]
+    return [(c, cKDTree(xyz[c]), radii[c].max()) for c in classes if len(c)]
+
+
+def query_class_trees(trees_a: list, trees_b: list = None,
+                      skin: float = 0.) -> np.ndarray:
+    """
+    (k, 2) array of pairs i < j closer than the sum of the largest radii
+    of their radius classes plus skin. Pairs are searched within trees_a,
+    or between trees_a and trees_b of disjoint sets of spheres.
+    """
+    same = trees_b is None
+    trees_b = trees_a if same else trees_b
+    pairs = []
+    for a, (ca, ta, ra) in enumerate(trees_a):
+        for b in range(a if same else 0, len(trees_b)):
+            cb, tb, rb = trees_b[b]
+            cutoff = ra + rb + skin
+            if cutoff <= 0:
+                continue
+            if same and a == b:
+                p = ta.query_pairs(cutoff, output_type='ndarray')
+                i, j = ca[p[:, 0]], ca[p[:, 1]]
+            else:
+                m = ta.sparse_distance_matrix(tb, cutoff, output_type='ndarray')
+                i, j = ca[m['i']], cb[m['j']]
+            pairs.append(np.column_stack([np.minimum(i, j), np.maximum(i, j)]))
+    if len(pairs) == 0:
+        return np.empty((0, 2), dtype=np.intp)
+    return np.concatenate(pairs)
+
+
+def get_candidate_pairs(xyz: np.ndarray, radii: np.ndarray,
+                        ratio: float = RADIUS_CLASS_RATIO,
+                        skin: float = 0.) -> np.ndarray:
+    """
+    (k, 2) array of pairs i < j closer than the sum of the largest radii
+    of their radius classes plus skin. One KD-tree query is done per pair
+    of classes, so a few large spheres do not inflate the cutoff of small
+    spheres. Without ratio all spheres are in one class.
+    """
+    if len(xyz) < 2:
+        return np.empty((0, 2), dtype=np.intp)
+    trees = get_class_trees(xyz, radii, np.arange(len(xyz)), ratio)
+    return query_class_trees(trees, skin=skin)
+
+
+def get_overlapping_pairs(xyz: np.ndarray, radii: np.ndarray,
+                          ratio: float = RADIUS_CLASS_RATIO) -> np.ndarray:
+    """
+    (k, 2) array of pairs i < j (in no particular order) of overlapping
+    spheres, i.e. distance < radius_i + radius_j. Candidate pairs are found
+    with KD-tree queries per pair of radius classes and tested with
+    array operations.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+    if len(xyz) < 2:
+        return np.empty((0, 2), dtype=np.intp)
+
+    return select_overlapping(xyz, radii, get_candidate_pairs(xyz, radii, ratio))
+
+
+def select_overlapping(xyz: np.ndarray, radii: np.ndarray,
+                       pairs: np.ndarray) -> np.ndarray:
+    """candidate pairs of overlapping spheres"""
+    if len(pairs) == 0:
+        return pairs
+    i, j = pairs[:, 0], pairs[:, 1]
+    d = np.linalg.norm(xyz[i] - xyz[j], axis=1)
+    return pairs[d < radii[i] + radii[j]]
+
+
+def count_violations(xyz: np.ndarray, radii: np.ndarray,
+                     ratio: float = RADIUS_CLASS_RATIO) -> int:
+    """number of overlapping pairs of spheres"""
+    return len(get_overlapping_pairs(xyz, radii, ratio))
+
+
+class VerletList(object):
+    """
+    Candidate pairs reused between consecutive, similar models
+    (e.g. sampling trajectories). Pairs closer than the search cutoff
+    plus skin are kept; the list is rebuilt only if a sphere moved
+    by more than skin / 2 since the last build or the spheres changed.
+    No pair outside the list can overlap, so the results are equal
+    to a computation from scratch.
+    """
+
+    def __init__(self, skin: float = 2., ratio: float = RADIUS_CLASS_RATIO):
+        self.skin = skin
+        self.ratio = ratio
+        self.xyz = self.radii = self.pairs = None
+        self.builds = 0
+
+    def needs_rebuild(self, xyz: np.ndarray, radii: np.ndarray) -> bool:
+        if self.xyz is None or len(xyz) != len(self.xyz) \
+                or not np.array_equal(radii, self.radii):
+            return True
+        displacement = np.sqrt(((xyz - self.xyz) ** 2).sum(axis=1))
+        return len(xyz) > 0 and displacement.max() > self.skin / 2
+
+    def get_overlapping_pairs(self, xyz: np.ndarray,
+                              radii: np.ndarray) -> np.ndarray:
+        """same as get_overlapping_pairs for the next model"""
+        xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+        if self.needs_rebuild(xyz, radii):
+            self.xyz, self.radii = xyz.copy(), radii.copy()
+            self.pairs = get_candidate_pairs(xyz, radii, self.ratio, self.skin)
+            self.builds += 1
+        return select_overlapping(xyz, radii, self.pairs)
+
+    def count_violations(self, xyz: np.ndarray, radii: np.ndarray) -> int:
+        return len(self.get_overlapping_pairs(xyz, radii))
+
+
+def get_body_index(bodies: np.ndarray) -> (np.ndarray, list):
+    """indices of flexible spheres (label < 0) and of spheres of each rigid body"""
+    bodies = np.asarray(bodies).reshape(-1)
+    flexible = np.flatnonzero(bodies < 0)
+    rigid = np.flatnonzero(bodies >= 0)
+    labels, inverse = np.unique(bodies[rigid], return_inverse=True)
+    if len(labels) == 0:
+        return flexible, []
+    order = np.argsort(inverse, kind='stable')
+    split = np.cumsum(np.bincount(inverse, minlength=len(labels)))[:-1]
+    return flexible, np.split(rigid[order], split)
+
+
+def get_intra_body_pairs(xyz: np.ndarray, radii: np.ndarray, bodies: np.ndarray,
+                         ratio: float = RADIUS_CLASS_RATIO) -> np.ndarray:
+    """overlapping pairs of spheres in the same rigid body"""
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+    flexible, rigid = get_body_index(bodies)
+    pairs = [np.empty((0, 2), dtype=np.intp)]
+    for body in rigid:
+        if len(body) > 1:
+            pairs.append(query_class_trees(
+                get_class_trees(xyz, radii, body, ratio)))
+    return select_overlapping(xyz, radii, np.concatenate(pairs))
+
+
+def count_intra_body_violations(xyz: np.ndarray, radii: np.ndarray,
+                                bodies: np.ndarray,
+                                ratio: float = RADIUS_CLASS_RATIO) -> int:
+    """number of overlapping pairs of spheres in the same rigid body"""
+    return len(get_intra_body_pairs(xyz, radii, bodies, ratio))
+
+
+def get_pairs_between(xyz: np.ndarray, radii: np.ndarray, a: np.ndarray,
+                      b: np.ndarray, ratio: float = RADIUS_CLASS_RATIO,
+                      max_brute_force: int = 1 << 16) -> np.ndarray:
+    """
+    candidate pairs between disjoint sets of spheres a and b; small sets
+    are compared all against all, larger ones with KD-trees
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.empty((0, 2), dtype=np.intp)
+    if len(a) * len(b) > max_brute_force:
+        return query_class_trees(get_class_trees(xyz, radii, a, ratio),
+                                 get_class_trees(xyz, radii, b, ratio))
+    # Loose test; the exact one is done by select_overlapping
+    d = np.linalg.norm(xyz[a][:, None] - xyz[b][None, :], axis=2)
+    i, j = np.nonzero(d <= radii[a][:, None] + radii[b][None, :] + 1e-6)
+    i, j = a[i], b[j]
+    return np.column_stack([np.minimum(i, j), np.maximum(i, j)])
+
+
+def get_bounding_spheres(xyz: np.ndarray, radii: np.ndarray,
+                         groups: list) -> (np.ndarray, np.ndarray):
+    """centres and radii of spheres bounding each group of spheres"""
+    centers = np.array([xyz[g].mean(axis=0) for g in groups]).reshape(-1, 3)
+    extents = np.array([(np.linalg.norm(xyz[g] - c, axis=1) + radii[g]).max()
+                        for g, c in zip(groups, centers)])
+    return centers, extents
+
+
+def get_close_groups(centers: np.ndarray, extents: np.ndarray) -> np.ndarray:
+    """(k, 2) array of pairs of groups whose bounding spheres overlap"""
+    if len(centers) < 2:
+        return np.empty((0, 2), dtype=np.intp)
+    close = cKDTree(centers).query_pairs(2 * extents.max(),
+                                         output_type='ndarray')
+    d = np.linalg.norm(centers[close[:, 0]] - centers[close[:, 1]], axis=1)
+    return close[d <= extents[close[:, 0]] + extents[close[:, 1]]]
+
+
+def get_contact_zone(xyz: np.ndarray, radii: np.ndarray, index: np.ndarray,
+                     center: np.ndarray, extent: float) -> np.ndarray:
+    """spheres of index which reach into a bounding sphere"""
+    d = np.linalg.norm(xyz[index] - center, axis=1)
+    return index[d <= extent + radii[index]]
+
+
+def get_pairs_between_groups(xyz: np.ndarray, radii: np.ndarray, groups: list,
+                             ratio: float = RADIUS_CLASS_RATIO,
+                             spheres: tuple = None) -> np.ndarray:
+    """
+    candidate pairs of spheres in different groups. Only groups with
+    overlapping bounding spheres are compared, and only spheres in the
+    contact zone (reaching into the bounding sphere of the other group)
+    """
+    centers, extents = spheres or get_bounding_spheres(xyz, radii, groups)
+    pairs = [np.empty((0, 2), dtype=np.intp)]
+    for a, b in get_close_groups(centers, extents):
+        pairs.append(get_pairs_between(
+            xyz, radii,
+            get_contact_zone(xyz, radii, groups[a], centers[b], extents[b]),
+            get_contact_zone(xyz, radii, groups[b], centers[a], extents[a]),
+            ratio))
+    return np.concatenate(pairs)
+
+
+def get_inter_body_pairs(xyz: np.ndarray, radii: np.ndarray, bodies: np.ndarray,
+                         ratio: float = RADIUS_CLASS_RATIO) -> np.ndarray:
+    """
+    overlapping pairs of spheres, except pairs within the same rigid body.
+    Rigid bodies are only compared with flexible spheres and other bodies
+    which reach into their bounding spheres.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64).reshape(-1, 3)
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+    flexible, rigid = get_body_index(bodies)
+
+    pairs = [np.empty((0, 2), dtype=np.intp)]
+    if len(flexible) > 1:
+        pairs.append(query_class_trees(
+            get_class_trees(xyz, radii, flexible, ratio)))
+
+    if len(rigid):
+        centers, extents = get_bounding_spheres(xyz, radii, rigid)
+        pairs.append(get_pairs_between_groups(xyz, radii, rigid, ratio,
+                                              (centers, extents)))
+        if len(flexible):
+            for body, c, e in zip(rigid, centers, extents):
+                near = get_contact_zone(xyz, radii, flexible, c, e)
+                pairs.append(get_pairs_between(xyz, radii, near, body, ratio))
+
+    return select_overlapping(xyz, radii, np.concatenate(pairs))
+
+
+def count_inter_body_violations(xyz: np.ndarray, radii: np.ndarray,
+                                bodies: np.ndarray,
+                                ratio: float = RADIUS_CLASS_RATIO) -> int:
+    """number of overlapping pairs of flexible spheres and rigid bodies"""
+    return len(get_inter_body_pairs(xyz, radii, bodies, ratio))
+
+
+def get_chain_pair_violations(pairs: np.ndarray, chains: np.ndarray,
+                              n_chains: int = None) -> coo_matrix:
+    """
+    sparse upper triangular matrix of numbers of overlapping pairs
+    between (and on the diagonal, within) chains, which are labelled
+    with non-negative integers
+    """
+    chains = np.asarray(chains).reshape(-1).astype(np.intp)
+    n_chains = n_chains or (chains.max() + 1 if len(chains) else 0)
+    a, b = chains[pairs[:, 0]], chains[pairs[:, 1]]
+    matrix = coo_matrix((np.ones(len(pairs), dtype=np.int64),
+                         (np.minimum(a, b), np.maximum(a, b))),
+                        shape=(n_chains, n_chains))
+    matrix.sum_duplicates()
+    return matrix
+
+
+def get_violations_per_sphere(xyz: np.ndarray, radii: np.ndarray) -> np.ndarray:
+    """number of overlaps of each sphere with spheres of higher index"""
+    pairs = get_overlapping_pairs(xyz, radii)
+    return np.bincount(pairs[:, 0], minlength=len(radii))
+
+
+def get_satisfaction(n: int, violations: int, bonded: int = 0) -> float:
+    """percentage of non-overlapping pairs of n spheres; bonded pairs
+    are never tested (see get_bonded_pair_count), so they are not counted"""
+    pairs = get_number_of_pairs(n) - bonded
+    if pairs <= 0:
+        return 100.
+    return (1 - violations / pairs) * 100
+
+
+def get_sample_order(n: int, strategy: str = 'random', seed: int = 0,
+                     strata: int = 10) -> np.ndarray:
+    """
+    Order in which n models are sampled. 'random' is a seeded random
+    permutation. 'stratified' splits models into strata of consecutive
+    models (e.g. states and model groups) and takes one random model
+    from each stratum in turn, so that each round of strata models is
+    a stratified sample
+    """
+    rng = np.random.default_rng(seed)
+    if strategy == 'random':
+        return rng.permutation(n)
+    if strategy != 'stratified':
+        raise ValueError(f'Unknown sampling strategy {strategy}')
+    # Position of each model in the random order within its stratum
+    rounds = np.empty(n, dtype=np.intp)
+    for stratum in np.array_split(np.arange(n), min(strata, n)):
+        rounds[stratum] = rng.permutation(len(stratum))
+    return np.lexsort((np.arange(n), rounds))
+
+
+def get_confidence_interval(values, population: int = None,
+                            confidence: float = 0.95) -> (float, float):
+    """
+    Student t confidence interval of the mean of values sampled without
+    replacement from a population of the given size
+    """
+    values = np.asarray(values, dtype=np.float64)
+    m = len(values)
+    if m == 0:
+        return -np.inf, np.inf
+    mean = values.mean()
+    if population is not None and m >= population:
+        # Exact
+        return mean, mean
+    if m < 2:
+        return -np.inf, np.inf
+    sem = values.std(ddof=1) / math.sqrt(m)
+    if population is not None:
+        # Finite population correction
+        sem *= math.sqrt((population - m) / (population - 1))
+    h = stats.t.ppf((1 + confidence) / 2, m - 1) * sem
+    return mean - h, mean + h
+
+
+def get_available_cores() -> int:
+    """number of cores available to this process"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Shared memory block attached in a worker process: name -> (block, array)
+_attached = {}
+# Verlet list of a worker process, reused between its tasks
+_counter = None
+
+
+def _init_worker(skin: float = None) -> None:
+    """pool initializer; one Verlet list per worker process with skin"""
+    global _counter
+    _counter = VerletList(skin) if skin else None
+
+
+def get_vdw_radii(type_symbol) -> np.ndarray:
+    """van der Waals radii of atoms of the given elements"""
+    return np.array([VDW_RADII.get(str(t).upper(), DEFAULT_VDW_RADIUS)
+                     for t in type_symbol], dtype=np.float64)
+
+
+def select_atom_pairs(xyz: np.ndarray, radii: np.ndarray, pairs: np.ndarray,
+                      chains: np.ndarray, atoms: np.ndarray,
+                      tolerance: float = ATOM_OVERLAP_TOLERANCE) -> np.ndarray:
+    """
+    overlapping pairs of a model with atoms and beads; atoms is a (n, 3)
+    array of (1 for atoms and 0 for beads, seq_id_begin, seq_id_end).
+    Pairs with atoms in the same or consecutive residues of a chain are
+    covalently bonded, so they are skipped. Atoms overlap if their
+    van der Waals spheres overlap by at least tolerance
+    """
+    i, j = pairs[:, 0], pairs[:, 1]
+    is_atom = atoms[:, 0] > 0
+    begin, end = atoms[:, 1], atoms[:, 2]
+    bonded = (is_atom[i] | is_atom[j]) & (chains[i] == chains[j]) \
+        & (begin[i] <= end[j] + 1) & (begin[j] <= end[i] + 1)
+    both = is_atom[i] & is_atom[j]
+    d = np.linalg.norm(xyz[i] - xyz[j], axis=1)
+    clash = ~both | (radii[i] + radii[j] - d >= tolerance)
+    return pairs[~bonded & clash]
+
+
+def get_bonded_pair_count(chains: np.ndarray, atoms: np.ndarray) -> int:
+    """
+    number of pairs that select_atom_pairs skips as covalently bonded:
+    an atom and another sphere of the same chain in the same or
+    consecutive residues; atoms as in select_atom_pairs or None
+    """
+    if atoms is None:
+        return 0
+    is_atom = atoms[:, 0] > 0
+    count = 0
+    for chain in np.unique(chains[is_atom]):
+        in_chain = chains == chain
+        seq = np.sort(atoms[in_chain & is_atom, 1]).astype(np.int64)
+        # Atoms of the same residue and of consecutive residues
+        residues, counts = np.unique(seq, return_counts=True)
+        count += int((counts * (counts - 1) // 2).sum())
+        following = np.searchsorted(residues, residues + 1)
+        found = following < len(residues)
+        found[found] = residues[following[found]] == residues[found] + 1
+        count += int((counts[found] * counts[following[found]]).sum())
+        # Atoms within a residue of the range of a bead
+        beads = atoms[in_chain & ~is_atom]
+        count += int((np.searchsorted(seq, beads[:, 2] + 1, 'right')
+                      - np.searchsorted(seq, beads[:, 1] - 1, 'left')).sum())
+    return count
+
+
+def get_pair_kinds(pairs: np.ndarray, atoms: np.ndarray) -> dict:
+    """numbers of atom-atom, atom-bead and bead-bead pairs"""
+    n = (atoms[pairs[:, 0], 0] > 0).astype(np.intp) \
+        + (atoms[pairs[:, 1], 0] > 0)
+    counts = np.bincount(n, minlength=3)
+    return {'atom-atom': int(counts[2]), 'atom-bead': int(counts[1]),
+            'bead-bead': int(counts[0])}
+
+
+def get_model_atoms(model: tuple):
+    """atoms column of a model or None"""
+    return model[4] if len(model) > 4 else None
+
+
+def get_model_pairs(model: tuple, counter=None) -> np.ndarray:
+    """
+    overlapping pairs of (xyz, radii[, bodies[, chains[, atoms]]]);
+    pairs within the same rigid body are skipped if bodies are given;
+    with atoms see select_atom_pairs. counter is an optional VerletList
+    """
+    xyz = np.asarray(model[0], dtype=np.float64).reshape(-1, 3)
+    radii = np.asarray(model[1], dtype=np.float64).reshape(-1)
+    if len(model) > 2 and model[2] is not None:
+        pairs = get_inter_body_pairs(xyz, radii, model[2])
+    elif counter is not None:
+        pairs = counter.get_overlapping_pairs(xyz, radii)
+    else:
+        pairs = get_overlapping_pairs(xyz, radii)
+    if get_model_atoms(model) is not None:
+        pairs = select_atom_pairs(xyz, radii, pairs, model[3], model[4])
+    return pairs
+
+
+def get_model_details(model: tuple, pairs: np.ndarray,
+                      clashes: bool = False) -> dict:
+    """
+    number of violations and, for models with chains, chain pair matrix
+    and, for models with atoms, get_pair_kinds; with clashes also the overlapping pairs (int32) and their overlap
+    depths, radius_i + radius_j - distance (float32)
+    """
+    details = {'violations': len(pairs)}
+    if len(model) > 3 and model[3] is not None:
+        details['chain_pairs'] = get_chain_pair_violations(pairs, model[3])
+    if get_model_atoms(model) is not None:
+        details['pair_kinds'] = get_pair_kinds(pairs, model[4])
+    if clashes:
+        xyz = np.asarray(model[0], dtype=np.float64).reshape(-1, 3)
+        radii = np.asarray(model[1], dtype=np.float64).reshape(-1)
+        i, j = pairs[:, 0], pairs[:, 1]
+        d = np.linalg.norm(xyz[i] - xyz[j], axis=1)
+        details['pairs'] = pairs.astype(np.int32)
+        details['overlap'] = (radii[i] + radii[j] - d).astype(np.float32)
+    return details
+
+
+def count_model_violations(model: tuple, counter=None, details: bool = False,
+                           clashes: bool = False):
+    """number of violations of a model or, with details, get_model_details"""
+    pairs = get_model_pairs(model, counter)
+    if details or clashes:
+        return get_model_details(model, pairs, clashes)
+    return len(pairs)
+
+
+def _count_violations_shared(task: tuple) -> list:
+    """
+    count violations of consecutive models in a shared array; task is
+    (block name, shape, model indices, numbers of beads, details, clashes).
+    The Verlet list of the worker is kept between tasks
+    """
+    name, shape, ks, ns, details, clashes = task
+    if name not in _attached:
+        # Detach from the previous block; the array has to go first
+        while _attached:
+            _, (block, array) = _attached.popitem()
+            del array
+            block.close()
+        block = shared_memory.SharedMemory(name=name)
+        _attached[name] = (block, np.ndarray(shape, dtype=np.float64,
+                                             buffer=block.buf))
+    violations = []
+    for k, n in zip(ks, ns):
+        model = _attached[name][1][k, :n]
+        # Columns: x, y, z, radius and optionally rigid body, chain and
+        # atom (is atom, seq_id_begin, seq_id_end) as in MODEL_COLUMNS;
+        # -1 for flexible spheres and models without atoms
+        columns = [model[:, :3], model[:, 3]]
+        if shape[2] > 4:
+            bodies = model[:, 4]
+            columns.append(bodies if (bodies >= 0).any() else None)
+        if shape[2] > 5:
+            columns.append(model[:, 5].astype(np.intp))
+        if shape[2] > 6:
+            atoms = model[:, 6:9].astype(np.intp)
+            columns.append(atoms if (atoms[:, 0] > 0).any() else None)
+        violations.append(count_model_violations(columns, _counter, details,
+                                                 clashes))
+    return violations
+
+
+def iter_violations_parallel(models, workers: int = None,
+                             chunk_size: int = None, skin: float = None,
+                             details: bool = False, clashes: bool = False):
+    """
+    Yield number of violations for each (xyz, radii[, bodies[, chains]])
+    of models in order, or get_model_details with details or clashes.
+    Pairs within the same rigid body are skipped if bodies are given
+    (not None). Columns of a chunk of models are copied to a single
+    shared memory array (models x beads x columns), which worker
+    processes read without copying. Models are consumed one chunk at a time.
+    With skin, each worker gets a run of consecutive models of each chunk
+    and keeps its Verlet list between runs, so the list is rebuilt only
+    when models move by more than the skin.
+    """
+    workers = workers or get_available_cores()
+    if workers == 1:
+        counter = VerletList(skin) if skin else None
+        for model in models:
+            yield count_model_violations(model, counter, details, clashes)
+        return
+
+    chunk_size = chunk_size or (8 if skin else 2) * workers
+    models = iter(models)
+    block, shape = None, None
+    # Workers have to share the tracker of shared memory blocks with
+    # this process; otherwise each of them would start its own and
+    # unlink the blocks on exit
+    resource_tracker.ensure_running()
+    try:
+        with mp.Pool(processes=workers, initializer=_init_worker,
+                     initargs=(skin,)) as pool:
+            while True:
+                chunk = list(islice(models, chunk_size))
+                if len(chunk) == 0:
+                    break
+                beads = max(len(model[1]) for model in chunk)
+                columns = sum(MODEL_COLUMNS[:len(chunk[0])])
+                if block is None or shape[1] < beads or shape[2] != columns:
+                    # (Re)allocate for the largest model so far
+                    if block is not None:
+                        block.close()
+                        block.unlink()
+                    shape = (chunk_size, max(beads, 1), columns)
+                    block = shared_memory.SharedMemory(
+                        create=True, size=int(np.prod(shape)) * 8)
+                array = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+                ns = []
+                for k, model in enumerate(chunk):
+                    ns.append(len(model[1]))
+                    c = 0
+                    for width, values in zip(MODEL_COLUMNS, model):
+                        array[k, :ns[-1], c:c + width] = -1 \
+                            if values is None else np.reshape(values, (-1, width))
+                        c += width
+                del array
+                if skin:
+                    runs = np.array_split(np.arange(len(chunk)), workers)
+                else:
+                    runs = [[k] for k in range(len(chunk))]
+                tasks = [(block.name, shape, list(ks), [ns[k] for k in ks],
+                          details, clashes)
+                         for ks in runs if len(ks) > 0]
+                for violations in pool.map(_count_violations_shared, tasks,
+                                           chunksize=1):
+                    yield from violations
+    finally:
+        if block is not None:
+            block.close()
+            block.unlink()
+
+
+def iter_rigid_body_violations(models, workers: int = None,
+                               chunk_size: int = None, details: bool = False,
+                               clashes: bool = False):
+    """
+    Yield (intra-rigid-body, other) violations for each
+    (xyz, radii, bodies[, chains[, atoms]]) of models in order, as numbers or with
+    details or clashes as get_model_details. Relative positions of spheres in a rigid
+    body do not change between models, so pairs within rigid bodies are
+    evaluated only for the first model (and again if bodies or radii
+    change); flexible and inter-body pairs are evaluated for each model.
+    """
+    # Intra-rigid-body results of models sent to the workers
+    intra = deque()
+    last = {'radii': None, 'bodies': None, 'pairs': None}
+
+    def iter_models():
+        for model in models:
+            xyz, radii, bodies = model[:3]
+            if not (np.array_equal(radii, last['radii'])
+                    and np.array_equal(bodies, last['bodies'])):
+                pairs = get_intra_body_pairs(xyz, radii, bodies)
+                if get_model_atoms(model) is not None:
+                    pairs = select_atom_pairs(np.asarray(xyz), radii, pairs,
+                                              model[3], model[4])
+                last.update(radii=radii, bodies=bodies, pairs=pairs)
+            if details or clashes:
+                intra.append(get_model_details(model, last['pairs'], clashes))
+            else:
+                intra.append(len(last['pairs']))
+            yield model
+
+    results = iter_violations_parallel(iter_models(), workers, chunk_size,
+                                       details=details, clashes=clashes)
+    for violations in results:
+        yield intra.popleft(), violations
@@ -29,8 +29,8 @@ silence(EMPTY_LAYOUT, True)
 MAXPLOTS = 256
 
 class Plots(GetInputInformation):
-    def __init__(self, mmcif, imageDirName, driver):
-        super().__init__(mmcif)
+    def __init__(self, mmcif, imageDirName, driver, system=None):
+        super().__init__(mmcif, system=system)
         self.ID = self.get_id()
         self.ID_f = self.get_file_id()
         self.dirname = os.path.dirname(os.path.abspath(__file__))
@@ -20,6 +20,7 @@ import logging
 from pathlib import Path
 import utility
 from report import WriteReport
+from mmcif_io import get_file_stem
 from distutils.util import strtobool
 
 # from validation.WKhtmlToPdf import  wkhtmltopdf
@@ -35,7 +36,7 @@ parser.add_argument('-v', dest='verbose', action='store_true',
 parser.add_argument('-p', type=str, default='No',
                     help="Physical principles used in modeling yes/no?")
 parser.add_argument('-f', default='PDBDEV_00000001.cif',
-                    help="Input mmcif file")
+                    help="Input mmCIF file (.cif, .cif.gz, .bcif or .bcif.gz)")
 parser.add_argument('--databases-root', type=str, default='.', required=False,
                     help="Path to a local copy of SASBDB and EMDB databases")
 parser.add_argument('--cache-root', type=str,
@@ -44,6 +45,44 @@ parser.add_argument('--cache-root', type=str,
                     help="Path to a local copy of SASBDB and EMDB databases")
 parser.add_argument('--nocache', action='store_true', default=False,
                     help="Ignore cached assesment results")
+parser.add_argument('--cache-max-size', type=float, default=10,
+                    help="Maximum total size of the parsed systems and MolProbity "
+                    "caches in GB")
+parser.add_argument('--nprocs', type=int, default=None,
+                    help="Number of worker processes. Default is the number of available cores")
+parser.add_argument('--exv-skin', type=float, default=None,
+                    help="Skin distance (in A) of neighbour lists reused between consecutive "
+                    "models in excluded volume calculation. Default is to evaluate each model from scratch")
+parser.add_argument('--exv-rigid-bodies', action='store_true', default=False,
+                    help="Assume rigid bodies are rigid in all models and evaluate excluded volume "
+                    "within rigid bodies only once")
+parser.add_argument('--exv-clashes', action='store_true', default=False,
+                    help="Write all overlapping pairs of beads to the csv directory")
+parser.add_argument('--exv-sample', type=int, default=None,
+                    help="Evaluate excluded volume for a sample of at most this many models")
+parser.add_argument('--exv-sample-tolerance', type=float, default=None,
+                    help="Stop sampling models once the 95%% confidence interval of the mean "
+                    "excluded volume satisfaction is narrower than this (in percentage points)")
+parser.add_argument('--exv-sample-strategy', type=str, default='random',
+                    choices=['random', 'stratified'],
+                    help="Sample models at random or one from each stratum of consecutive models in turn")
+parser.add_argument('--exv-sample-seed', type=int, default=0,
+                    help="Seed of the random number generator for sampling models")
+parser.add_argument('--molprobity-split', dest='molprobity_split',
+                    action='store_true', default=False,
+                    help="Run MolProbity tools on each model of a multi-model entry separately "
+                    "and in parallel, with results attributed to models exactly. "
+                    "Without it, outliers are assigned to models by splitting the output "
+                    "of a single run equally")
+parser.add_argument('--no-molprobity-split', dest='molprobity_split',
+                    action='store_false',
+                    help="Run MolProbity tools once on all models (default)")
+parser.add_argument('--molprobity-archive', action='store_true', default=False,
+                    help="Keep gzipped raw outputs of MolProbity tools in the cache "
+                    "directory for debugging, when the tools are run")
+parser.add_argument('--connectivity-tolerance', type=float, default=2.,
+                    help="Largest gap (in A) between surfaces of sequence-consecutive beads "
+                    "in the sequence connectivity check")
 parser.add_argument('--output-root', type=str, default=str(Path(Path(__file__).parent.resolve(), 'Validation')),
                     help="Path to a directory where the output will be written")
 parser.add_argument('--output-prefix', type=str, default=None,
@@ -230,17 +269,33 @@ if __name__ == "__main__":
     logging.info("Clean up temporary files")
     utility.clean_all()
 
+    exv_sampling = None
+    if args.exv_sample is not None or args.exv_sample_tolerance is not None:
+        exv_sampling = {'max_models': args.exv_sample,
+                        'tolerance': args.exv_sample_tolerance,
+                        'strategy': args.exv_sample_strategy,
+                        'seed': args.exv_sample_seed}
+
     report = WriteReport(args.f,
                          db=args.databases_root,
                          cache=args.cache_root,
-                         nocache=args.nocache)
+                         nocache=args.nocache,
+                         cache_max_size=int(args.cache_max_size * 1024 ** 3),
+                         nprocs=args.nprocs,
+                         exv_skin=args.exv_skin,
+                         exv_rigid_bodies=args.exv_rigid_bodies,
+                         exv_clashes=args.exv_clashes,
+                         exv_sampling=exv_sampling,
+                         connectivity_tolerance=args.connectivity_tolerance,
+                         molprobity_split=args.molprobity_split,
+                         molprobity_archive=args.molprobity_archive)
 
     logging.info("Entry composition")
     template_dict = report.run_entry_composition(Template_Dict)
 
     output_root = args.output_root
 
-    output_prefix = Path(args.f).stem
+    output_prefix = get_file_stem(args.f)
     if args.output_prefix is not None:
         output_prefix = args.output_prefix
 
@@ -372,5 +427,7 @@ if __name__ == "__main__":
     else:
         shutil.rmtree(dirNames['root_html'])
 
+    logging.info(f"Input file was parsed {report.get_parse_count()} time(s)")
+
     logging.info("Final cleanup")
     utility.clean_all(report=report)
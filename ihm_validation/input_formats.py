@@ -0,0 +1,53 @@
+###################################
+# Script :
+# 1) Contains detection of input
+# file formats and compression
+#
+###################################
+
+import gzip
+from pathlib import Path
+from typing import Final
+
+# Supported input formats: suffix -> (python-ihm format, compression)
+INPUT_FORMATS: Final = {
+    '.cif': ('mmCIF', None),
+    '.cif.gz': ('mmCIF', 'gzip'),
+    '.bcif': ('BCIF', None),
+    '.bcif.gz': ('BCIF', 'gzip'),
+}
+
+
+def get_input_format(fname) -> (str, str):
+    """Detect file format and compression from the file name.
+    Unknown suffixes are treated as plain-text mmCIF"""
+    name = str(fname).lower()
+    for suffix in sorted(INPUT_FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return INPUT_FORMATS[suffix]
+    return ('mmCIF', None)
+
+
+def get_file_stem(fname) -> str:
+    """Stem of the file name without format and compression suffixes"""
+    name = Path(fname).name
+    for suffix in sorted(INPUT_FORMATS, key=len, reverse=True):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return Path(fname).stem
+
+
+def open_input(fname, encoding='utf8', errors='strict'):
+    """
+    Open input file for reading. Compressed files are decompressed
+    on the fly; BinaryCIF files are opened in binary mode
+    """
+    fmt, compression = get_input_format(fname)
+    if fmt == 'BCIF':
+        if compression == 'gzip':
+            return gzip.open(fname, 'rb')
+        return open(fname, 'rb')
+
+    if compression == 'gzip':
+        return gzip.open(fname, 'rt', encoding=encoding, errors=errors)
+    return open(fname, 'r', encoding=encoding, errors=errors)
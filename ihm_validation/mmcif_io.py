@@ -12,11 +12,21 @@
 
 import ihm
 import ihm.reader
+import ihm.dumper
 import os
 import re
+from io import StringIO
+import functools
 from collections import defaultdict
 from itertools import chain
 import utility
+import pandas as pd
+from system_cache import SystemCache, DEFAULT_MAX_SIZE
+from cif_index import CategoryIndex
+from input_formats import (INPUT_FORMATS, get_input_format,  # noqa: F401
+                           get_file_stem, open_input)
+from array_model import (ArrayModel, get_number_of_spheres,
+                         get_number_of_atoms, get_atom_table)
 
 import logging
 from typing import Final
@@ -62,27 +72,188 @@ if IHMV_MODE == IHMVAvailableModes.DEVELOPMENT:
 MAX_NUM_MODELS: Final = __max_num_models  # Set constant for maximum number of models in a file
 
 
+#########################
+# Parse input files
+#########################
+
+# Number of times an input file was parsed by python-ihm in this process
+_parse_count = 0
+
+
+def open_categories(mmcif_file, categories=None, exclude_categories=None,
+                    encoding='utf8', errors='strict'):
+    """
+    Open text mmCIF file with only selected categories, using
+    the byte-offset category index. Other formats are opened as is
+    """
+    fmt, compression = get_input_format(mmcif_file)
+    if fmt != 'mmCIF' or compression is not None:
+        logging.info('Selective loading is supported only for '
+                     'uncompressed mmCIF files; reading all categories')
+        return open_input(mmcif_file, encoding=encoding, errors=errors)
+
+    index = CategoryIndex(mmcif_file)
+    text = index.read(categories=categories, exclude=exclude_categories)
+    return StringIO(text.decode(encoding, errors=errors))
+
+
+def read_system(mmcif_file, model_class=ArrayModel,
+                cache_root=None, nocache=False,
+                cache_max_size=DEFAULT_MAX_SIZE,
+                categories=None, exclude_categories=None) -> (ihm.System, str):
+    """
+    Parse mmCIF file with python-ihm; returns system and encoding.
+    If cache_root is set, parsed systems are looked up in/stored to
+    the persistent system cache. nocache skips the lookup, but still
+    refreshes the cache entry.
+    categories/exclude_categories restrict parsing to a subset of
+    categories, e.g. exclude_categories=['_atom_site'] for metadata.
+    """
+    global _parse_count
+
+    selective = categories is not None or exclude_categories is not None
+    if selective:
+        def open_(encoding, errors='strict'):
+            return open_categories(mmcif_file, categories, exclude_categories,
+                                   encoding=encoding, errors=errors)
+        # Subsets are cached separately from the full system
+        variant = f'categories={sorted(categories or [])};' \
+                  f'exclude={sorted(exclude_categories or [])}'
+    else:
+        def open_(encoding, errors='strict'):
+            return open_input(mmcif_file, encoding=encoding, errors=errors)
+        variant = ''
+
+    cache = None
+    if cache_root is not None:
+        cache = SystemCache(cache_root, max_size=cache_max_size)
+        key = cache.get_key(mmcif_file, model_class=model_class,
+                            variant=variant)
+        if not nocache:
+            entry = cache.load(key)
+            if entry is not None:
+                return entry
+
+    fmt, compression = get_input_format(mmcif_file)
+    encoding = 'utf8'
+    try:
+        with open_(encoding) as fh:
+            system, = ihm.reader.read(fh, model_class=model_class, format=fmt)
+    except UnicodeDecodeError:
+        # Only text mmCIF is decoded
+        encoding = 'ascii'
+        with open_(encoding, errors='ignore') as fh:
+            system, = ihm.reader.read(fh, model_class=model_class, format=fmt)
+
+    _parse_count += 1
+    logging.debug(f'Parsed {mmcif_file} ({_parse_count} parse(s) so far)')
+
+    if cache is not None:
+        cache.store(key, system, encoding)
+
+    return system, encoding
+
+
+def get_parse_count() -> int:
+    """Number of times input files were parsed in this process"""
+    return _parse_count
+
+
+#########################
+# Memoize derived tables
+#########################
+
+def get_system_signature(system: ihm.System) -> tuple:
+    """Cheap fingerprint of the system; changes if top-level lists
+    are modified"""
+    return (len(system.state_groups),
+            len(system.orphan_assemblies),
+            len(system.orphan_datasets),
+            len(system.orphan_protocols),
+            len(system.software),
+            len(system.ensembles),
+            len(system.restraints))
+
+
+def memoized(func):
+    """
+    Compute derived table once per system. Cached values are
+    dropped if the system changes. Tables are dicts of lists of
+    plain values; callers get a copy of the lists, so they can
+    modify the result.
+    """
+    @functools.wraps(func)
+    def wrapper(self):
+        signature = get_system_signature(self.system)
+        memo = self.__dict__.setdefault('_memo', {})
+        if memo.get('system') is not self.system \
+                or memo.get('signature') != signature:
+            memo.clear()
+            memo['system'] = self.system
+            memo['signature'] = signature
+        if func.__name__ not in memo:
+            memo[func.__name__] = func(self)
+        value = memo[func.__name__]
+        if isinstance(value, dict):
+            value = {k: list(v) if isinstance(v, list) else v
+                     for k, v in value.items()}
+        return value
+    return wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def _read_references(fname: str, mtime: float) -> (dict, dict):
+    """Parse references.csv; cached until the file is modified"""
+    ref_link = dict()
+    ref_cit = dict()
+
+    with open(fname, 'r') as f:
+        allref = [_.strip().split('|') for _ in f.readlines()]
+
+    for line in allref:
+        ref_link[line[0].lower().rstrip()] = line[1].rstrip().lstrip()
+        ref_cit[line[0].lower()] = line[2]
+
+    return ref_link, ref_cit
+
+
 #########################
 # Get information from IHM reader
 #########################
 
 class GetInputInformation(object):
-    def __init__(self, mmcif_file):
+    def __init__(self, mmcif_file, system=None, encoding=None,
+                 cache_root=None, nocache=False,
+                 cache_max_size=DEFAULT_MAX_SIZE,
+                 categories=None, exclude_categories=None):
+        """
+        Entry context. Parses mmcif_file unless an already parsed
+        system is given. Analyzers should get the parsed system
+        from the report object instead of parsing the file again.
+        With cache_root set, parsed systems are kept in a persistent cache.
+        categories/exclude_categories load only a subset of the file.
+        """
         self.mmcif_file = mmcif_file
         self.encoding = None
         self.datasets = {}
         self.entities = {}
-        self.model = ihm.model.Model
-        encoding = 'utf8'
-        try:
-            with open(self.mmcif_file, encoding=encoding) as fh:
-                self.system, = ihm.reader.read(fh, model_class=self.model)
-        except UnicodeDecodeError:
-            encoding = 'ascii'
-            with open(self.mmcif_file, encoding=encoding, errors='ignore') as fh:
-                self.system, = ihm.reader.read(fh, model_class=self.model)
-
+        self.model = ArrayModel
+        if system is None:
+            system, encoding = read_system(self.mmcif_file,
+                                           model_class=self.model,
+                                           cache_root=cache_root,
+                                           nocache=nocache,
+                                           cache_max_size=cache_max_size,
+                                           categories=categories,
+                                           exclude_categories=exclude_categories)
+
+        self.system = system
         self.encoding = encoding
+        self._memo = {}
+
+    def invalidate_cache(self) -> None:
+        """Drop memoized tables, e.g. after modifying the system in place"""
+        self._memo = {}
 
     def get_databases(self):
         """ get all datasets from the mmcif file"""
@@ -239,13 +410,20 @@ class GetInputInformation(object):
     def check_sphere(self) -> int:
         """check resolution of structure,
         returns 0 if its atomic and 1 if the model is multires"""
-        spheres = [len(b._spheres) for i in self.system.state_groups
+        spheres = [get_number_of_spheres(b) for i in self.system.state_groups
                    for j in i for a in j for b in a]
         if 0 not in spheres:
             return 1
         else:
             return 0
 
+    def check_atoms(self) -> int:
+        """returns 1 if any model has atoms, e.g. multi-resolution
+        models with atomic and coarse-grained parts, and 0 otherwise"""
+        atoms = [get_number_of_atoms(b) for i in self.system.state_groups
+                 for j in i for a in j for b in a]
+        return int(any(atoms))
+
     def get_assembly_ID_of_models(self) -> list:
         """Assembly info i.e. model assemblies in the file """
         assembly_id = [
@@ -298,6 +476,29 @@ class GetInputInformation(object):
             for j in i for a in j for b in a]
         return len(models)
 
+    def iter_models(self, max_num_models: int = MAX_NUM_MODELS):
+        """
+        Yield models one at a time as (ids, model), where ids holds
+        global 1-based model_number, model_group, state and state_group.
+        Stops after max_num_models models.
+        """
+        gistg = gist = gimg = gim = 0
+        for stg in self.system.state_groups:
+            gistg += 1
+            for st in stg:
+                gist += 1
+                for mg in st:
+                    gimg += 1
+                    for m in mg:
+                        if gim >= max_num_models:
+                            logging.warning(
+                                f'Only {max_num_models} models are processed')
+                            return
+                        gim += 1
+                        ids = {'model_number': gim, 'model_group': gimg,
+                               'state': gist, 'state_group': gistg}
+                        yield ids, m
+
     def get_residues(self, asym):
         """Get residues per chain """
         if asym.seq_id_range[0] is not None:
@@ -306,6 +507,7 @@ class GetInputInformation(object):
             residues = utility.NA
         return residues
 
+    @memoized
     def get_composition(self) -> dict:
         """Get composition dictionary"""
         entry_comp = {'Model ID': [], 'Subunit number': [], 'Subunit ID': [],
@@ -344,6 +546,7 @@ class GetInputInformation(object):
         """ number of protocols/methods used to create model"""
         return len(self.system.orphan_protocols)
 
+    @memoized
     def get_sampling(self) -> dict:
         """ sampling composition/details """
         sampling_comp = {'Step number': [], 'Protocol ID': [],
@@ -463,6 +666,7 @@ class GetInputInformation(object):
         else:
             return len(lists)
 
+    @memoized
     def get_software_comp(self) -> dict:
         """get software composition to write out as a table"""
         software_comp = {'ID': [], 'Software name': [], 'Software version': [
@@ -526,23 +730,19 @@ class GetInputInformation(object):
 
 
     def read_all_references(self) -> None:
-        self.ref_link = dict()
-        self.ref_cit = dict()
-
         template_path = Path(Path(__file__).parent.parent.resolve(), 'templates')
         reference_filename = str(Path(template_path, 'references.csv'))
 
-        with open(reference_filename, 'r') as f:
-            allref = [_.strip().split('|') for _ in f.readlines()]
-
-        for line in allref:
-            self.ref_link[line[0].lower().rstrip()] = line[1].rstrip().lstrip()
-            self.ref_cit[line[0].lower()] = line[2]
+        ref_link, ref_cit = _read_references(
+            reference_filename, os.path.getmtime(reference_filename))
+        self.ref_link = dict(ref_link)
+        self.ref_cit = dict(ref_cit)
 
     def check_ensembles(self) -> int:
         """check if ensembles exist"""
         return len(self.system.ensembles)
 
+    @memoized
     def get_ensembles(self):
         """details on ensembles, if it exists"""
         if len(self.system.ensembles) > 0:
@@ -599,6 +799,7 @@ class GetInputInformation(object):
         else:
             return len(lists)
 
+    @memoized
     def get_dataset_comp(self) -> dict:
         """detailed dataset composition"""
         dataset_comp = {'ID': [], 'Dataset type': [],
@@ -648,6 +849,7 @@ class GetInputInformation(object):
                         dataset_dic[str(i._id)] = 'None'
         return dataset_dic
 
+    @memoized
     def get_restraints(self) -> dict:
         """ get restraints table from cif file"""
         r = self.system.restraints
@@ -721,6 +923,7 @@ class GetInputInformation(object):
                 '''
         return restraints_comp
 
+    @memoized
     def get_dataset_details(self) -> dict:
         """get information on dataset and databases"""
         dataset_comp = {'ID': [], 'Dataset type': [],
@@ -832,11 +1035,21 @@ class GetInputInformation(object):
         else:
             return False
 
+    def open_text(self, encoding='utf8'):
+        """Open the input as text mmCIF. BinaryCIF input is
+        dumped from the parsed system into memory"""
+        if get_input_format(self.mmcif_file)[0] == 'BCIF':
+            fh = StringIO()
+            ihm.dumper.write(fh, [self.system])
+            fh.seek(0)
+            return fh
+        return open_input(self.mmcif_file, encoding=encoding)
+
     def mmcif_get_lists(self, filetemp=None) -> (list, dict, dict, list):
         """function to help re-write mmcif file for molprobity
         this function reads the atom_site dictionary terms and returns a list"""
         if filetemp is None:
-            file = open(self.mmcif_file, 'r', encoding='latin1')
+            file = self.open_text(encoding='latin1')
         else:
             file = filetemp
             filetemp.seek(0)
@@ -844,6 +1057,8 @@ class GetInputInformation(object):
         for i, j in enumerate(file.readlines()):
             all_lines.append(j.strip().split())
         atom_site = {}
+        # Set of tags to avoid quadratic lookups in atom_site.values()
+        atom_site_tags = set()
         atoms = {}
         before_atom_site = []
         after_atom = []
@@ -852,20 +1067,25 @@ class GetInputInformation(object):
                 if len(before_atom_site) == 0:
                     before_atom_site = all_lines[:i+1]
                 atom_site[i] = j[0]
-            elif ('_atom_site.B_iso_or_equiv' not in list(atom_site.values())) and len(list(atom_site.values())) > 0:
+            elif len(atom_site) == 0:
+                continue
+            elif '_atom_site.B_iso_or_equiv' not in atom_site_tags:
                 atom_site[i] = '_atom_site.B_iso_or_equiv'
-            elif ('_atom_site.occupancy' not in list(atom_site.values())) and len(list(atom_site.values())) > 0:
+            elif '_atom_site.occupancy' not in atom_site_tags:
                 atom_site[i] = '_atom_site.occupancy'
-
-            elif ('_atom_site.label_seq_id' not in list(atom_site.values())) and len(list(atom_site.values())) > 0:
+            elif '_atom_site.label_seq_id' not in atom_site_tags:
                 atom_site[i] = '_atom_site.label_seq_id'
+            else:
+                continue
+            atom_site_tags.add(atom_site[i])
 
         total_list = list(atom_site.values())
         index_biso = total_list.index('_atom_site.B_iso_or_equiv')
         index_occu = total_list.index('_atom_site.occupancy')
         index_label_seq = total_list.index('_atom_site.label_seq_id')
+        last_tag = list(atom_site.keys())[-1]
         for i, j in enumerate(all_lines):
-            if len(j) > 0 and ('ATOM' in j[0] or 'HETATM' in j[0]) and (i > list(atom_site.keys())[-1]):
+            if len(j) > 0 and ('ATOM' in j[0] or 'HETATM' in j[0]) and (i > last_tag):
                 if len(j) <= index_occu:
                     j.extend(['1'])
                 elif j[index_occu] == '.':
@@ -879,7 +1099,7 @@ class GetInputInformation(object):
                 elif j[index_label_seq] == '.':
                     j[index_label_seq] = str(i)
                 atoms[i] = j
-            elif len(j) > 0 and (i > list(atom_site.keys())[-1]):
+            elif len(j) > 0 and (i > last_tag):
                 if len(after_atom) == 0:
                     after_atom = all_lines[i:]
         return before_atom_site, atom_site, atoms, after_atom
@@ -941,31 +1161,49 @@ class GetInputInformation(object):
         return reprs
 
     def get_auth_label_map(self, system=None) -> dict:
-        """get map between auth_seq_id and label_seq_id"""
+        """get map between auth_seq_id and label_seq_id.
+        Models with the same assembly and representation have
+        the same residues, so only one of them is scanned"""
 
         logging.info('Building auth <-> label map')
         if system is None:
             system = self.system
 
+        asyms = {a._id: a for a in system.asym_units}
+
         emap = {}
+        conflicts = 0
+        seen = set()
         for st in system.state_groups:
             for s in st:
                 for mg in s:
                     for m in mg:
-                        for a in m.get_atoms():
-                            label_asym_id = a.asym_unit.id
-                            auth_asym_id = a.asym_unit.strand_id
+                        key = (id(m.assembly), id(m.representation))
+                        if key in seen:
+                            continue
+                        seen.add(key)
 
-                            label_seq_id = str(a.seq_id)
-                            auth_seq_id = str(a.asym_unit.residue(a.seq_id).auth_seq_id)
+                        atoms = get_atom_table(m)
+                        # Unique residues in the order of appearance
+                        residues = pd.DataFrame(
+                            {'asym_id': atoms['asym_id'],
+                             'seq_id': atoms['seq_id']}).drop_duplicates()
 
-                            key = (auth_asym_id, auth_seq_id)
-                            val = (label_asym_id, label_seq_id)
+                        for asym_id, seq_id in zip(residues['asym_id'],
+                                                   residues['seq_id']):
+                            asym = asyms[asym_id]
+                            auth_seq_id = asym.residue(seq_id).auth_seq_id
+
+                            key = (asym.strand_id, str(auth_seq_id))
+                            val = (asym_id, str(seq_id))
 
                             if key not in emap:
                                 emap[key] = val
-                            else:
-                                if emap[key] != val:
-                                    logging.warning(f"Conflicting residue ids. auth, label1, label2 {key}, {emap[key]}, {val}. Keeping first {key} -> {emap[key]}")
+                            elif emap[key] != val:
+                                conflicts += 1
+                                logging.debug(f"Conflicting residue ids. auth, label1, label2 {key}, {emap[key]}, {val}. Keeping first {key} -> {emap[key]}")
+
+        if conflicts > 0:
+            logging.warning(f'{conflicts} conflicting auth <-> label residue ids. Keeping first occurrences')
 
         return emap
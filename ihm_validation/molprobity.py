@@ -7,34 +7,244 @@
 # ganesans@salilab.org
 ###################################
 import logging
-import pickle
 import os
 from pathlib import Path
 import subprocess
-from subprocess import run
-from mmcif_io import GetInputInformation, MAX_NUM_MODELS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from mmcif_io import GetInputInformation, MAX_NUM_MODELS, get_file_stem
 import ihm
 import ihm.reader
+import numpy as np
+from array_model import get_atom_table
+from exv_engine import get_available_cores
+from molprobity_cache import MolprobityCache
+from molprobity_tables import (parse_rama, parse_rota, parse_clash,
+                               get_evaluation_summary, get_outlier_details,
+                               get_clash_summary, get_clash_details)
+from cif_tokenizer import (iter_cif_events, get_category, is_missing,
+                           LOOP, ROWS, ITEM, DATA)
+import tempfile
 import collections
+import contextlib
+import gzip
 import pandas as pd
 import csv
 import re
 import string
 
+# Values for missing _atom_site columns; atoms with zero occupancy
+# would be ignored by MolProbity, so missing occupancies are full
+ATOM_SITE_DEFAULTS = {
+    '_atom_site.occupancy': '1.00',
+    '_atom_site.B_iso_or_equiv': '0.00',
+}
+
+# Loops dropped from MolProbity input
+SKIPPED_CATEGORIES = ('_flr',)
+
+# Coarse-grained coordinate loops, also dropped for multi-resolution
+# models, so that MolProbity gets only their atoms
+COARSE_GRAINED_CATEGORIES = ('_ihm_sphere_obj_site', '_ihm_gaussian_obj_site')
+
+# Tools run on each model separately in split mode and keys of results
+MODEL_TOOLS = {'clash': 'molprobity.clashscore',
+               'rama': 'molprobity.ramalyze',
+               'rota': 'molprobity.rotalyze'}
+
+# Arguments of molprobity.molprobity
+MOLPROBITY_ARGS = (
+    # "disable_uc_volume_vs_n_atoms_check=True",
+    # This is a legacy option and causes extremely
+    # large memory consumption with recent
+    # molprobity versions on PDB-IHM entries
+    "coot=False",
+)
+
+# Keep printable ASCII characters only
+_NONPRINTABLE = {i: None for i in range(128)
+                 if chr(i) not in string.printable}
+
+
+def to_printable(line: str) -> str:
+    """drop characters molprobity can't read"""
+    if line.isascii():
+        return line.translate(_NONPRINTABLE)
+    return ''.join(c for c in line if c in string.printable)
+
+
+def format_row(row: list) -> str:
+    """join loop row tokens; text fields start on a new line"""
+    out = ''
+    for token in row:
+        if token.startswith(';'):
+            out += ('\n' if out else '') + token
+        else:
+            out += (' ' if out and not out.endswith('\n') else '') + token
+    return out if out.endswith('\n') else out + '\n'
+
+
+def rows_with_defaults(rows: list, columns: list, extra: list):
+    """replace missing values in columns and append extra values"""
+    for row in rows:
+        for i, default in columns:
+            if is_missing(row[i]):
+                row[i] = default
+        yield row + extra
+
+
+def write_molprobity_cif(fin, fout, fix_occupancy=False, fix_biso=False,
+                         atoms_only=False) -> None:
+    """
+    Rewrite mmCIF in a single streaming pass:
+    drop _flr loops (and coarse-grained coordinate loops with atoms_only),
+    keep printable ASCII characters only and
+    fill missing occupancies/B-factors in _atom_site if requested
+    """
+    fixes = []
+    if fix_occupancy:
+        fixes.append('_atom_site.occupancy')
+    if fix_biso:
+        fixes.append('_atom_site.B_iso_or_equiv')
+
+    skipped = SKIPPED_CATEGORIES
+    if atoms_only:
+        skipped += COARSE_GRAINED_CATEGORIES
+
+    skip = False
+    fill = None
+    for event, payload, lines in iter_cif_events(fin):
+        if event in (LOOP, ITEM, DATA):
+            skip = False
+            fill = None
+
+        if event == LOOP:
+            category = get_category(payload[0]) if payload else ''
+            if category.startswith(skipped):
+                skip = True
+            elif category == '_atom_site' and fixes:
+                # Fill missing values in existing columns, add absent columns
+                tags = [t.lower() for t in payload]
+                columns = [(tags.index(t.lower()), ATOM_SITE_DEFAULTS[t])
+                           for t in fixes if t.lower() in tags]
+                extra = [t for t in fixes if t.lower() not in tags]
+                lines = lines + [f'{t}\n' for t in extra]
+                fill = (columns, [ATOM_SITE_DEFAULTS[t] for t in extra])
+
+        if skip and event in (LOOP, ROWS):
+            continue
+
+        if event == ROWS and fill is not None:
+            lines = [format_row(row)
+                     for row in rows_with_defaults(payload, *fill)]
+
+        for line in lines:
+            fout.write(to_printable(line))
+
+
+def get_model_column(tags: list):
+    """index of the model id column of _atom_site tags or None"""
+    tags = [t.lower() for t in tags]
+    for tag in ('_atom_site.ihm_model_id', '_atom_site.pdbx_pdb_model_num'):
+        if tag in tags:
+            return tags.index(tag)
+    return None
+
+
+def split_molprobity_cif(fname: str, dirname: str,
+                         max_models: int = None) -> list:
+    """
+    Write each of the first max_models models of a molprobity input file
+    to its own mmCIF file in dirname; other categories are copied to
+    every file. Returns file names in order of first appearance of the
+    models, or [fname] if atoms have no model ids
+    """
+    # First pass: everything except atoms
+    common, header, column = [], [], None
+    with open(fname, 'r', encoding='utf-8') as fh:
+        atoms = False
+        for event, payload, lines in iter_cif_events(fh):
+            if event in (LOOP, ITEM, DATA):
+                atoms = event == LOOP and bool(payload) \
+                    and get_category(payload[0]) == '_atom_site'
+                if atoms:
+                    header, column = lines, get_model_column(payload)
+            if not atoms:
+                common.extend(lines)
+    if column is None:
+        return [fname]
+
+    # Second pass: rows of atoms to the file of their model
+    fnames = {}
+    current, out = None, None
+    try:
+        with open(fname, 'r', encoding='utf-8') as fh:
+            atoms = False
+            for event, payload, lines in iter_cif_events(fh):
+                if event in (LOOP, ITEM, DATA):
+                    atoms = event == LOOP and bool(payload) \
+                        and get_category(payload[0]) == '_atom_site'
+                if not atoms or event != ROWS:
+                    continue
+                for row in payload:
+                    model = row[column]
+                    if model != current:
+                        if out is not None:
+                            out.close()
+                        current, out = model, None
+                        if model in fnames:
+                            out = open(fnames[model], 'a', encoding='utf-8')
+                        elif max_models is None or len(fnames) < max_models:
+                            fnames[model] = str(Path(dirname,
+                                                     f'model_{len(fnames) + 1}.cif'))
+                            out = open(fnames[model], 'w', encoding='utf-8')
+                            out.writelines(common + ['#\n'] + header)
+                    if out is not None:
+                        out.write(''.join(lines) if len(payload) == 1
+                                  else format_row(row))
+    finally:
+        if out is not None:
+            out.close()
+    return list(fnames.values())
+
+
+def merge_clash_outputs(outputs: list) -> list:
+    """
+    clashscore outputs of single models as the output of a multi-model
+    run: lists of clashes of each model followed by clashscores of all
+    models, with models numbered in order
+    """
+    merged, scores = [], []
+    for k, line in enumerate(outputs, 1):
+        start = next((i for i, el in enumerate(line) if 'Bad Clashes' in el),
+                     None)
+        score = [(i, m) for i, m in enumerate(
+            re.search(r'clashscore\s*=\s*(\d+\.\d+)', el) for el in line)
+            if m and (start is None or i > start)]
+        end = score[0][0] if score else None
+        merged.append(f'Bad Clashes >= 0.4 Angstrom MODEL {k}:')
+        if start is not None:
+            merged.extend(line[start + 1:end])
+        scores.append(
+            f'MODEL {k} clashscore = {score[0][1].group(1) if score else "0.00"}')
+    return merged + scores
+
+
 class GetMolprobityInformation(GetInputInformation):
     _tempfiles = []
 
-    def __init__(self, mmcif_file, cache):
-        super().__init__(mmcif_file)
+    def __init__(self, mmcif_file, cache, system=None, archive=False):
+        super().__init__(mmcif_file, system=system)
         self.verify_molprobity_installation()
         self.version = self.get_version()
-        self.ID = Path(mmcif_file).stem
+        self.ID = get_file_stem(mmcif_file)
         self.nos = min(self.get_number_of_models(), MAX_NUM_MODELS)
         if not Path(cache).is_dir():
             os.makedirs(cache)
             logging.info(f'Created cache directory {cache}')
 
         self.cache = cache
+        # Keep compressed raw outputs of tools for debugging
+        self.archive = archive
 
         self._tempcif = str(Path(self.cache, 'temp.cif'))
         if Path(self._tempcif).is_file():
@@ -101,124 +311,41 @@ class GetMolprobityInformation(GetInputInformation):
         else:
             raise OSError('Molprobity core.php module is missing')
 
-    def check_for_molprobity(self, fname: str) -> bool:
-        """ Check the biso and occupancy columns for mmcif files"""
-        out = False
-        if fname is not None:
-
-            encoding = 'utf8'
-            try:
-                with open(fname, 'r', encoding=encoding) as fh:
-                    system, = ihm.reader.read(fh)
-            except UnicodeDecodeError:
-                encoding = 'ascii'
-                with open(fname, 'r', encoding=encoding, errors='ignore') as fh:
-                    system, = ihm.reader.read(fh)
-
-            models = [
-                b for i in system.state_groups for j in i for a in j for b in a]
-        else:
-            """check if file is in the right format for molprobity analysis """
-            models = [
-                b for i in self.system.state_groups for j in i for a in j for b in a]
-
-        if models[0]._atoms[0].biso is None or models[0]._atoms[0].occupancy is None:
-            logging.info("File is not in the appropriate format for molprobity")
-            logging.info("Trying to rescue the file")
-            out = False
-        else:
-            out = True
-
-        return out
+    def get_molprobity_fixes(self) -> (bool, bool):
+        """ Check parsed models for missing occupancies and B-factors"""
+        fix_occupancy = fix_biso = False
+        for ids, m in self.iter_models():
+            atoms = get_atom_table(m)
+            fix_occupancy = fix_occupancy or bool(np.isnan(atoms['occupancy']).any())
+            fix_biso = fix_biso or bool(np.isnan(atoms['biso']).any())
+            if fix_occupancy and fix_biso:
+                break
+        return fix_occupancy, fix_biso
 
     def rewrite_mmcif(self, outfn='temp.cif'):
         '''Workaround to generate molprobity-compliant mmCIF'''
-        fn = self.mmcif_file
         if Path(outfn).is_file():
             os.remove(outfn)
-        encoding = 'utf-8'
-        try:
-            with open(fn, 'r', encoding=encoding) as f:
-                raw = f.readlines()
-        except:
-            encoding = 'latin-1'
-            with open(fn, 'r', encoding=encoding) as f:
-                raw = f.readlines()
 
-        loop_lines = []
-        loop = False
-        out = []
-        skip_loop = False
-        for line in raw:
-            loop_break = False
-            if re.match('loop_', line):
-                if loop and not skip_loop:
-                       out.extend(loop_lines)
-
-                loop = True
-                skip_loop = False
-                loop_lines = [line]
-
-            elif loop:
-                loop_lines.append(line)
-
-                if re.match('_flr', line):
-                    skip_loop = True
-            else:
-                out.append(line)
-
-        if loop and not skip_loop:
-                out.extend(loop_lines)
-
-        # Filter non-ascii characters for molprobity
-        printable = set(string.printable)
-        out = [''.join(filter(lambda x: x in printable, s)) for s in out]
-
-        # Hack to avoid . for B-factors and other values
-        if not self.check_for_molprobity(fn):
-            atomsite = False
-            atomsite_start = None
-            atomsite_header_end = None
-            atomsite_occupancy = False
-
-            for i, line in enumerate(out):
-                if atomsite and re.match('(ATOM|HETATM)', line):
-                    # 20 symbols to skip _atom_site.alt_id
-                    out[i] = line[:20] + re.sub(' \. ', ' 0 ', line[20:])
-
-                elif re.match('^loop_', line):
-                    if re.match('^_atom_site', out[i + 1]):
-                        atomsite = True
-                        atomsite_start = i + 1
-
-                        j = atomsite_start
-                        line_ = out[j]
-
-                        while re.match('^_atom_site', line_):
-                            if re.match('^_atom_site.occupancy$', line):
-                                atomsite_occupancy = True
-                            j += 1
-                            line_ = out[j]
-                        atomsite_header_end = j
-
-                    else:
-                        atomsite = False
-
-            # Add missing occupancy
-            if not atomsite_occupancy:
-                out.insert(atomsite_header_end, '_atom_site.occupancy\n')
-
-                for i, line in enumerate(out[atomsite_header_end:], atomsite_header_end):
-                    if re.match('(ATOM|HETATM)', line):
-                        if re.match('(ATOM|HETATM)', out[i - 1]) or re.match('(ATOM|HETATM)', out[i + 1]):
-                            out[i] = f'{out[i].strip()} 0.0\n'
-                        elif re.match('(ATOM|HETATM)', out[i - 2]) or re.match('(ATOM|HETATM)', out[i + 2]):
-                            out[i + 1] = f'{out[i + 1].strip()} 0.0\n'
+        # Reuse the already parsed system to decide what to fix
+        fix_occupancy, fix_biso = self.get_molprobity_fixes()
+        if fix_occupancy or fix_biso:
+            logging.info("File is not in the appropriate format for molprobity")
+            logging.info("Trying to rescue the file")
 
-        with open(outfn, 'w', encoding='utf-8') as f:
-            f.write(''.join(out))
+        # Molprobity reads only text mmCIF; BinaryCIF input is dumped.
+        # Every byte is valid latin-1; non-ASCII characters
+        # are dropped by the rewriter anyway
+        fin = self.open_text(encoding='latin-1')
 
+        # MolProbity evaluates only the atoms of multi-resolution models
+        atoms_only = self.check_sphere() > 0 and self.check_atoms() > 0
 
+        with fin, open(outfn, 'w', encoding='utf-8') as fout:
+            write_molprobity_cif(fin, fout,
+                                 fix_occupancy=fix_occupancy,
+                                 fix_biso=fix_biso,
+                                 atoms_only=atoms_only)
 
     def check_molprobity_processing(self, output_dict: dict) -> bool:
         """check if molprobity output tables have the same number of lines """
@@ -227,104 +354,151 @@ class GetMolprobityInformation(GetInputInformation):
             return True
         return False
 
-    def run_ramalyze(self, d: dict):
-        """run ramalyze to get outliers """
-        f_name = str(Path(self.cache, self.ID+'_temp_rama.txt'))
-        self._tempfiles.append(f_name)
-
-        with open(f_name, 'w+') as f:
-            run(['molprobity.ramalyze', self._tempcif],
-                stdout=f,
-                cwd=self.cache)
+    def run_tool(self, tool: str, args: tuple = (), cif: str = None,
+                 archive: str = None) -> list:
+        """
+        run a molprobity tool on cif (temp.cif by default); returns
+        stripped output lines read from a pipe as the tool writes them.
+        With archive, the raw output is also written to that gzipped file.
+        Raises CalledProcessError with the captured stderr if the tool
+        fails and ValueError if it prints nothing.
+        Each run gets its own working directory, so that tools can run
+        concurrently without sharing files such as molprobity.out
+        """
+        line = []
+        # stderr goes to a file, so that a full stderr pipe can not
+        # block the tool while stdout is read
+        with tempfile.TemporaryDirectory(dir=self.cache) as cwd, \
+                tempfile.TemporaryFile('w+', dir=cwd) as err, \
+                (gzip.open(archive, 'wt') if archive
+                 else contextlib.nullcontext()) as raw:
+            with subprocess.Popen([tool, os.path.abspath(cif or self._tempcif),
+                                   *args],
+                                  stdout=subprocess.PIPE, stderr=err, cwd=cwd,
+                                  text=True) as proc:
+                for el in proc.stdout:
+                    if raw is not None:
+                        raw.write(el)
+                    line.append(el.strip())
+            err.seek(0)
+            stderr = err.read()
+
+        if proc.returncode:
+            logging.error(f'{tool} failed with exit status '
+                          f'{proc.returncode}: {stderr.strip()}')
+            raise subprocess.CalledProcessError(proc.returncode, proc.args,
+                                                stderr=stderr)
+        if stderr.strip():
+            logging.warning(f'{tool}: {stderr.strip()}')
+        # All tools print at least a summary
+        if not line:
+            raise ValueError(f'{tool} printed no output')
+        return line
 
-        with open(f_name, 'r') as f:
-            line = [_.strip() for _ in f.readlines()]
+    def get_archive_name(self, key: str, model: int = None) -> str:
+        """name of the archive of raw output of a tool, if archived"""
+        if not self.archive:
+            return None
+        suffix = '' if model is None else f'_{model}'
+        return str(Path(self.cache, f'{self.ID}_{key}{suffix}.txt.gz'))
 
-        d['rama'] = line
-        f_name = str(Path(self.cache, self.ID + '_temp_rama.pickle'))
+    def run_all(self, d: dict, workers: int = None,
+                split: bool = False) -> dict:
+        """
+        run molprobity, clashscore, ramalyze and rotalyze concurrently;
+        each tool is a single-threaded external process, so at most
+        workers of them run at a time (all available cores by default).
+        Results are stored in d as the tools finish: output lines of
+        molprobity, tables of ramalyze, rotalyze and clashscore and
+        clashscores of models. With split, models of multi-model entries
+        are evaluated separately, see run_split
+        """
+        workers = workers or get_available_cores()
+        if split and self.nos > 1:
+            return self.run_split(d, workers)
+        if self.nos > 1:
+            logging.warning('Molprobity: outliers are assigned to models by '
+                            'splitting the output equally, which is not exact '
+                            'if models differ in size')
+        # Slowest first, so it starts first if there are fewer workers
+        runners = [self.run_molprobity, self.run_clashscore,
+                   self.run_ramalyze, self.run_rotalyze]
+        workers = min(len(runners), workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(f, d): f.__name__ for f in runners}
+            for future in as_completed(futures):
+                future.result()
+                logging.info(f'Molprobity: {futures[future]} finished')
+        return d
+
+    def run_split(self, d: dict, workers: int) -> dict:
+        """
+        run clashscore, ramalyze and rotalyze on each model in its own
+        file, so that results are attributed to models exactly and the
+        runtime scales with workers; molprobity reports bond and angle
+        outliers of all models together, so it runs once on temp.cif
+        alongside. Clashscore outputs are merged with merge_clash_outputs
+        """
+        outputs = collections.defaultdict(dict)
+        with tempfile.TemporaryDirectory(dir=self.cache) as dirname:
+            fnames = split_molprobity_cif(self._tempcif, dirname, self.nos)
+            if len(fnames) < 2:
+                logging.warning('Models can not be split for molprobity')
+                return self.run_all(d, workers)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(self.run_molprobity, d): (None, None)}
+                for k, cif in enumerate(fnames, 1):
+                    for key, tool in MODEL_TOOLS.items():
+                        futures[pool.submit(
+                            self.run_tool, tool, cif=cif,
+                            archive=self.get_archive_name(key, k))] = (key, k)
+                for future in as_completed(futures):
+                    key, k = futures[future]
+                    line = future.result()
+                    if key is not None:
+                        outputs[key][k] = line
+        logging.info(f'Molprobity: {len(fnames)} models evaluated separately')
+
+        d['rama'] = self.get_rama_table(dict(sorted(outputs['rama'].items())))
+        d['rota'] = self.get_rota_table(dict(sorted(outputs['rota'].items())))
+        d['clash'], d['clashscores'] = self.get_clash_table(merge_clash_outputs(
+            [line for k, line in sorted(outputs['clash'].items())]))
+        return d
+
+    def get_cache_key(self, cache: MolprobityCache, split: bool = False) -> str:
+        """key of results of run_all in the MolProbity cache"""
+        args = {'molprobity': list(MOLPROBITY_ARGS), 'split': bool(split),
+                'models': self.nos, 'output': 'tables'}
+        return cache.get_key(self._tempcif, self.version, args)
 
-        with open(f_name, 'wb') as f:
-            pickle.dump(d['rama'], f)
+    def run_ramalyze(self, d: dict):
+        """run ramalyze to get outliers """
+        d['rama'] = self.get_rama_table(self.run_tool(
+            'molprobity.ramalyze', archive=self.get_archive_name('rama')))
 
     def run_molprobity(self, d: dict):
         """run molprobity"""
-        f_name = str(Path(
-            self.cache, self.ID + '_temp_mp.txt'))
-        self._tempfiles.append(f_name)
-
-        with open(f_name, 'w+') as f:
-            run(['molprobity.molprobity', self._tempcif,
-                 # "disable_uc_volume_vs_n_atoms_check=True",
-                 # This is a legacy option and causes extremely
-                 # large memory consumption with recent
-                 # molprobity versions on PDB-IHM entries
-                 "coot=False"],
-                stdout=f,
-                cwd=self.cache)
-            try:
-                os.remove(str(Path(self.cache, 'molprobity.out')))
-            except OSError:
-                logging.error("Couldn't delete molprobity.out")
-
-        with open(f_name, 'r') as f:
-            line = [_.strip() for _ in f.readlines()]
-
-        d['molprobity'] = line
-        f_name = str(Path(self.cache, self.ID + '_temp_mp.pickle'))
-
-        with open(f_name, 'wb') as f:
-            pickle.dump(d['molprobity'], f)
+        d['molprobity'] = self.run_tool(
+            'molprobity.molprobity', MOLPROBITY_ARGS,
+            archive=self.get_archive_name('mp'))
 
     def run_clashscore(self, d: dict):
         """run clashscore to get information on steric clashes"""
-        f_name = str(Path(
-            self.cache, self.ID + '_temp_clash.txt'))
-        self._tempfiles.append(f_name)
-
-        with open(f_name, 'w+') as f:
-            run(['molprobity.clashscore', self._tempcif],
-                stdout=f,
-                cwd=self.cache)
-
-        with open(f_name, 'r') as f:
-            line = [_.strip() for _ in f.readlines()]
-
-        d['clash'] = line
-
-        f_name = str(Path(
-            self.cache, self.ID + '_temp_clash.pickle'))
-
-        with open(f_name, 'wb') as f:
-            pickle.dump(d['clash'], f)
+        d['clash'], d['clashscores'] = self.get_clash_table(self.run_tool(
+            'molprobity.clashscore', archive=self.get_archive_name('clash')))
 
     def run_rotalyze(self, d: dict):
         """run rotalyZe to get rotameric outliers"""
-        f_name = str(self.ID)+'_temp_rota.txt'
-        self._tempfiles.append(f_name)
-
-        with open(f_name, 'w+') as f:
-            run(['molprobity.rotalyze', self._tempcif],
-                stdout=f,
-                cwd=self.cache)
-
-        with open(f_name, 'r') as f:
-            line = [_.strip() for _ in f.readlines()]
-
-        d['rota'] = line
-        f_name = str(Path(self.cache, self.ID+'_temp_rota.pickle'))
-
-        with open(f_name, 'wb') as f:
-            pickle.dump(d['rota'], f)
-
-    def write_all_lines(self, file_handle) -> list:
-        """print all lines from file to list """
-        with open(file_handle.name, 'r') as f:
-            line = [_.strip() for _ in f.readlines()]
-        return line
+        d['rota'] = self.get_rota_table(self.run_tool(
+            'molprobity.rotalyze', archive=self.get_archive_name('rota')))
 
     def process_rama(self, line: list) -> dict:
         """ reading and processing molprobity output from rama outliers.
-        Outputs information specific to models """
+        Outputs information specific to models. Output of a single run
+        on all models is split equally between models; output of
+        separate runs (see run_split) is already per model """
+        if isinstance(line, dict):
+            return {k: v[1:-3] for k, v in line.items()}
         line_new = line[1:-3]
         count = 1
         models = {_: [] for _ in range(1, self.nos+1)}
@@ -757,61 +931,11 @@ class GetMolprobityInformation(GetInputInformation):
         else:
             return "Your molprobity processing is incorrect, please check the code", 0
 
-    @staticmethod
-    def get_model_id_str(line: str) -> str:
-        """ extract MODEL X substring """
-        m = re.search('MODEL\s*(?P<model_id>\d+)', line, re.IGNORECASE)
-
-        mid = None
-
-        if m:
-            g = m.groupdict()
-            mid = g['model_id']
-
-        return mid
-
-
-    def process_clash(self, line: list) -> dict:
-        """ process clash files to extract relevant information """
-        count = [i for i, j in enumerate(line) if 'Bad Clashes' in j]
-        if self.nos > 1:
-            clashes = {f'Model {self.get_model_id_str(j)}':[]
-                    for i, j in enumerate(line) if 'Bad Clashes' in j}
-        else:
-            clashes = {'Model 1': []}
-        count.append(self.find_clashscore_records(line))
-
-        for ind in range(0, len(clashes.keys())):
-            output_line = [j for k, j in enumerate(line) if k > int(
-                count[ind]) and k < int(count[ind+1])]
-            clashes[list(clashes.keys())[ind]].append(output_line)
-
-        return clashes
-
-    @staticmethod
-    def find_clashscore_records(line: list) -> int:
-        """ look for the beginning of clashscore records in clash data.
-        searches for strings like 'MODEL 1 clashscore = 42.58'
-        """
-        found = False
-        q = re.compile('clashscore')
-        for i, line_ in enumerate(line):
-            if q.search(line_):
-                found = True
-                break
-
-        if not found:
-            logging.warning('Could not find clashscore records')
-
-        if found:
-            out = i
-        else:
-            out = None
-
-        return out
-
     def process_rota(self, line: list) -> dict:
-        """ process rota files to extract relevant information """
+        """ process rota files to extract relevant information;
+        see process_rama """
+        if isinstance(line, dict):
+            return {k: v[1:-1] for k, v in line.items()}
         line_new = line[1:-1]
         count = 1
         models = {_: [] for _ in range(1, self.nos+1)}
@@ -827,322 +951,61 @@ class GetMolprobityInformation(GetInputInformation):
                 models[count].append(el)
         return models
 
-    def rama_summary_table(self, models: dict) -> dict:
-        """ write out summary table from rama, clash and other tables"""
-        f_rama = open(str(Path(self.cache, self.ID+'_rama_summary.txt')), 'w+')
-        dict1 = {'Model ID': [], 'Analyzed': [],
-                 'Favored': [], 'Allowed': [], 'Outliers': []}
-        for ind, el in models.items():
-            dict1['Model ID'].append(ind)
-            F = []
-            A = []
-            U = []
-            for line in el:
-                if line.strip().split()[-2] == 'or':
-                    subline = ':'.join(line.strip().split()[-3:])
-                else:
-                    subline = line.strip().split()[-1]
-                if subline.split(':')[4] == 'Favored':
-                    F.append(subline.split(':')[4])
-                elif subline.split(':')[4] == 'Allowed':
-                    A.append(subline.split(':')[4])
-                else:
-                    U.append(subline.split(':')[4])
-            dict1['Analyzed'].append(len(F)+len(A)+len(U))
-            dict1['Favored'].append(len(F))
-            dict1['Allowed'].append(len(A))
-            dict1['Outliers'].append(len(U))
-        print(dict1['Model ID'], file=f_rama)
-        print(dict1['Analyzed'], file=f_rama)
-        print(dict1['Favored'], file=f_rama)
-        print(dict1['Allowed'], file=f_rama)
-        print(dict1['Outliers'], file=f_rama)
+    def get_rama_table(self, line) -> pd.DataFrame:
+        """ parse ramalyze output of all models into a table """
+        return parse_rama(self.process_rama(line))
+
+    def get_rota_table(self, line) -> pd.DataFrame:
+        """ parse rotalyze output of all models into a table """
+        return parse_rota(self.process_rota(line))
+
+    def get_clash_table(self, line: list) -> (pd.DataFrame, dict):
+        """ parse clashscore output into a table of clashes and
+        clashscores of models """
+        return parse_clash(line, self.nos)
+
+    def write_columns(self, table: dict, suffix: str) -> None:
+        """ write columns of a table to a text file in the cache """
+        with open(str(Path(self.cache, self.ID + suffix)), 'w+') as f:
+            for val in table.values():
+                print(val, file=f)
+
+    def rama_summary_table(self, table: pd.DataFrame) -> dict:
+        """ summary of ramachandran evaluations of models """
+        dict1 = get_evaluation_summary(table)
+        self.write_columns(dict1, '_rama_summary.txt')
         return dict1
 
-    def clash_summary_table(self, line: list) -> (dict, int):
-        """ format clash data to print to file """
-        def get_clash_score(line: str) -> str:
-            """ parse clash line """
-            m = re.search(
-                'clashscore\s+=\s+(?P<clashscore>\d+\.\d+)',
-                line,
-                re.IGNORECASE
-            )
-
-            g = m.groupdict()
-
-            return g['clashscore']
-
-        with open(
-            str(Path(self.cache,  self.ID+'_clash_summary.txt')), 'w+') as f_clash:
-
-            dict1 = {'Model ID': [], 'Clash score': [], 'Number of clashes': []}
-            clashes = self.process_clash(line)
-
-            # Find the beginning of clashscore records
-            cs_start = self.find_clashscore_records(line)
-
-            if cs_start is not None:
-                # Extract only X models
-                if self.nos == 1:
-                    clashscore_list = ['Model 1 ' + (line[len(line)-self.nos:])[0]]
-                else:
-                    clashscore_list = line[cs_start:cs_start + self.nos]
-
-                for clashval in clashscore_list:
-                    mid = self.get_model_id_str(clashval)
-                    clashscore = get_clash_score(clashval)
-                    dict1['Model ID'].append(mid)
-                    dict1['Clash score'].append(clashscore)
-
-            else:
-                # Hack if clashes are empty
-                for mid in range(1, self.nos + 1):
-                    dict1['Model ID'].append(mid)
-                    dict1['Clash score'].append(0.0)
-
-
-            for model_id in dict1['Model ID']:
-                dict1['Number of clashes'].append(len(clashes[f'Model {model_id}'][0]))
-            clash_total = (sum(dict1['Number of clashes']))
-            dict1 = self.orderclashdict(dict1)
-            print(dict1['Model ID'], file=f_clash)
-            print(dict1['Clash score'], file=f_clash)
-            print(dict1['Number of clashes'], file=f_clash)
-
+    def clash_summary_table(self, table: pd.DataFrame,
+                            clashscores: dict) -> (dict, int):
+        """ clashscores and numbers of clashes of models and the total
+        number of clashes """
+        dict1, clash_total = get_clash_summary(table, clashscores, self.nos)
+        self.write_columns(dict1, '_clash_summary.txt')
         return dict1, clash_total
 
-    def orderclashdict(self, modeldict: dict) -> dict:
-        """molprobity returns output in lexicographic order
-        this is to change it to number order
-         """
-        df = pd.DataFrame(modeldict)
-        df['ID'] = df['Model ID'].apply(lambda x: int(x))
-        df = df.sort_values(by='ID')
-        df = df.drop(['ID'], axis=1)
-        df_dict = df.to_dict()
-        ordered_dict = {key: list(val.values())
-                        for key, val in df_dict.items()}
-        return ordered_dict
-
-    def rota_summary_table(self, models: dict) -> dict:
-        """ format rota data to print to file """
-        dict1 = {'Model ID': [], 'Analyzed': [],
-                 'Favored': [], 'Allowed': [], 'Outliers': []}
-        f_rota = open(str(Path(self.cache, self.ID+'_rota_summary.txt')), 'w+')
-        for ind, el in models.items():
-            dict1['Model ID'].append(ind)
-            F = []
-            A = []
-            U = []
-            for line in el:
-                if line.strip().split()[-1].split(':')[-2] == 'Favored':
-                    F.append(line.strip().split()[-1].split(':')[-2])
-                elif line.strip().split()[-1].split(':')[-2] == 'Allowed':
-                    A.append(line.strip().split()[-1].split(':')[-2])
-                else:
-                    U.append(line.strip().split()[-1].split(':')[-2])
-            dict1['Analyzed'].append(len(F)+len(A)+len(U))
-            dict1['Favored'].append(len(F))
-            dict1['Allowed'].append(len(A))
-            dict1['Outliers'].append(len(U))
-        print(dict1['Model ID'], file=f_rota)
-        print(dict1['Analyzed'], file=f_rota)
-        print(dict1['Favored'], file=f_rota)
-        print(dict1['Allowed'], file=f_rota)
-        print(dict1['Outliers'], file=f_rota)
+    def rota_summary_table(self, table: pd.DataFrame) -> dict:
+        """ summary of rotamer evaluations of models """
+        dict1 = get_evaluation_summary(table)
+        self.write_columns(dict1, '_rota_summary.txt')
         return dict1
 
-    def rama_detailed_table(self, models: dict, chains: list, chains_map: dict) -> dict:
-        """ format rama information to print to file"""
-        dict1 = {'Model ID': [], 'Chain': [],
-                 'Residue ID': [], 'Residue type': []}
-        f_rama_D = open(str(Path(self.cache, self.ID+'_rama_detail.txt')), 'w+')
-        for ind, el in models.items():
-            for line in el:
-                if line.strip().split()[-2] == 'or':
-                    subline = ':'.join(line.strip().split()[-3:])
-                else:
-                    subline = line.strip().split()[-1]
-
-                if re.search('OUTLINE', line):
-                    dict1['Model ID'].append(ind)
-                    dict1['Residue type'].append(subline.split(':')[0])
-                    temp = line.strip().split()[0]
-                    if len(temp) > 2:
-                        if temp[:1] in chains:
-                            val1 = temp[:1]
-                            val2 = temp[1:]
-                            try:
-                                chid, resid = chains_map[(val1, val2)]
-                            except KeyError:
-                                logging.warning(f'Skipping line: {line}')
-                                continue
-
-                            dict1['Chain'].append(chid)
-                            dict1['Residue ID'].append(resid)
-                        elif temp[:2] in chains:
-                            val1 = temp[:2]
-                            val2 = temp[2:]
-                            try:
-                                chid, resid = chains_map[(val1, val2)]
-                            except KeyError:
-                                logging.warning(f'Skipping line: {line}')
-                                continue
-                            dict1['Chain'].append(chid)
-                            dict1['Residue ID'].append(resid)
-                        elif temp[:3] in chains:
-                            val1 = temp[:3]
-                            val2 = temp[3:]
-                            try:
-                                chid, resid = chains_map[(val1, val2)]
-                            except KeyError:
-                                logging.warning(f'Skipping line: {line}')
-                                continue
-                            dict1['Chain'].append(chid)
-                            dict1['Residue ID'].append(resid)
-                    else:
-                        val1 = line.strip().split()[0]
-                        val2 = line.strip().split()[1]
-                        try:
-                            chid, resid = chains_map[(val1, val2)]
-                        except KeyError:
-                            logging.warning(f'Skipping line: {line}')
-                            continue
-                        dict1['Chain'].append(chid)
-                        dict1['Residue ID'].append(resid)
-
-        print(dict1['Model ID'], file=f_rama_D)
-        print(dict1['Chain'], file=f_rama_D)
-        print(dict1['Residue ID'], file=f_rama_D)
-        print(dict1['Residue type'], file=f_rama_D)
+    def rama_detailed_table(self, table: pd.DataFrame, chains_map: dict) -> dict:
+        """ ramachandran outliers with label residue ids """
+        dict1 = get_outlier_details(table, chains_map)
+        self.write_columns(dict1, '_rama_detail.txt')
         return dict1
 
-    def clash_detailed_table(self, line: list, chains_map: dict) -> dict:
-        """process molprobity clash information and format to table"""
-        f_clash_D = open(str(Path(self.cache, self.ID+'_clash_detailed.txt')), 'w+')
-        dict1 = {'Model ID': [], 'Atom-1': [],
-                 'Atom-2': [], 'Clash overlap (&#8491)': []}
-        clashes = self.process_clash(line)
-        for ind, el in clashes.items():
-            for line in el[0]:
-                subline = [_ for _ in line.split(' ') if _ not in '']
-                if len(subline) < 9 and len(subline[0]) > 2:
-                    val1 = subline[0]
-                    val2 = subline[1]
-                    try:
-                        chid, resid = chains_map[(val1, val2)]
-                    except KeyError:
-                        logging.warning(f'Skipping line: {line}')
-                        continue
-                    out = f'{chid}:{resid}:{subline[2]}'
-                    dict1['Atom-1'].append(out)
-                else:
-                    val1 = subline[0]
-                    val2 = subline[1]
-                    try:
-                        chid, resid = chains_map[(val1, val2)]
-                    except KeyError:
-                        logging.warning(f'Skipping line: {line}')
-                        continue
-                    out = f'{chid}:{resid}:{subline[2]}:{subline[3]}'
-                    dict1['Atom-1'].append(out)
-                if len(subline) < 9 and len(subline[3]) > 4:
-                    val1 = subline[3]
-                    val2 = subline[4]
-                    try:
-                        chid, resid = chains_map[(val1, val2)]
-                    except KeyError:
-                        logging.warning(f'Skipping line: {line}')
-                        continue
-                    out = f'{chid}:{resid}:' + ':'.join(subline[5:-1])
-                    dict1['Atom-2'].append(out)
-                else:
-                    val1 = subline[4]
-                    val2 = subline[5]
-                    try:
-                        chid, resid = chains_map[(val1, val2)]
-                    except KeyError:
-                        logging.warning(f'Skipping line: {line}')
-                        continue
-                    out = f'{chid}:{resid}:' + ':'.join(subline[6:-1])
-                    dict1['Atom-2'].append(out)
-
-                dict1['Model ID'].append(self.get_model_id_str(ind))
-                dict1['Clash overlap (&#8491)'].append(
-                    subline[-1].replace(':', ''))
-
-        print(dict1['Model ID'], file=f_clash_D)
-        print(dict1['Atom-1'], file=f_clash_D)
-        print(dict1['Atom-2'], file=f_clash_D)
-        print(dict1['Clash overlap (&#8491)'], file=f_clash_D)
+    def clash_detailed_table(self, table: pd.DataFrame, chains_map: dict) -> dict:
+        """ clashes with label residue ids of atoms """
+        dict1 = get_clash_details(table, chains_map)
+        self.write_columns(dict1, '_clash_detailed.txt')
         return dict1
 
-    def rota_detailed_table(self, models: dict, chains: list, chains_map: dict) -> dict:
-        """process molprobity rotamers information and format to table"""
-        f_rota_D = open(str(Path(self.cache,
-                                     self.ID+'_rota_detailed.txt')), 'w+')
-        dict1 = {'Model ID': [], 'Chain': [],
-                 'Residue ID': [], 'Residue type': []}
-        for ind, el in models.items():
-            for line in el:
-                if re.search('OUTLIER', line):
-                    temp = line.strip().split()[0]
-                    if len(temp) > 2:
-                        if temp[:1] in chains:
-                            val1 = temp[:1]
-                            val2 = temp[1:]
-                            try:
-                                chid, resid = chains_map[(val1, val2)]
-                            except KeyError:
-                                logging.warning(f'Skipping line: {line}')
-                                continue
-
-                            dict1['Chain'].append(chid)
-                            dict1['Residue ID'].append(resid)
-
-                        elif temp[:2] in chains:
-                            val1 = temp[:2]
-                            val2 = temp[2:]
-                            try:
-                                chid, resid = chains_map[(val1, val2)]
-                            except KeyError:
-                                logging.warning(f'Skipping line: {line}')
-                                continue
-
-                            dict1['Chain'].append(chid)
-                            dict1['Residue ID'].append(resid)
-
-                        elif temp[:3] in chains:
-                            val1 = temp[:3]
-                            val2 = temp[3:]
-                            try:
-                                chid, resid = chains_map[(val1, val2)]
-                            except KeyError:
-                                logging.warning(f'Skipping line: {line}')
-                                continue
-                            dict1['Chain'].append(chid)
-                            dict1['Residue ID'].append(resid)
-
-                    else:
-                        val1 = line.strip().split()[0]
-                        val2 = line.strip().split()[1]
-                        try:
-                            chid, resid = chains_map[(val1, val2)]
-                        except KeyError:
-                            logging.warning(f'Skipping line: {line}')
-                            continue
-                        dict1['Chain'].append(chid)
-                        dict1['Residue ID'].append(resid)
-
-                    dict1['Model ID'].append(ind)
-                    dict1['Residue type'].append(
-                        line.strip().split()[-1].split(':')[0])
-
-        print(dict1['Model ID'], file=f_rota_D)
-        print(dict1['Chain'], file=f_rota_D)
-        print(dict1['Residue ID'], file=f_rota_D)
-        print(dict1['Residue type'], file=f_rota_D)
+    def rota_detailed_table(self, table: pd.DataFrame, chains_map: dict) -> dict:
+        """ rotamer outliers with label residue ids """
+        dict1 = get_outlier_details(table, chains_map)
+        self.write_columns(dict1, '_rota_detailed.txt')
         return dict1
 
     def get_data_for_quality_at_glance(self, clash: list, rota: list, rama: list) -> dict:
@@ -0,0 +1,92 @@
+###################################
+# Script :
+# 1) Contains class for a persistent
+# cache of MolProbity results
+#
+###################################
+
+import os
+import gzip
+import json
+import hashlib
+import logging
+import tempfile
+import pandas as pd
+from system_cache import SystemCache, get_file_hash
+from molprobity_tables import table_to_json, table_from_json
+
+
+class MolprobityCache(SystemCache):
+    """
+    Content-addressed cache of MolProbity results.
+    Entries are keyed by the hash of the rewritten input file (temp.cif),
+    the MolProbity version and the tool arguments. Results of all tools
+    of an entry (parsed tables and output lines of molprobity) are stored
+    together as one gzipped JSON file, written atomically. Hits and
+    misses are counted per process.
+    """
+    subdir = 'molprobity'
+    suffix = '.json.gz'
+    hits = misses = 0
+
+    def get_key(self, fname: str, version: str, args) -> str:
+        """cache key for the rewritten input file; args are any
+        JSON-serializable tool arguments"""
+        h = hashlib.sha256()
+        h.update(get_file_hash(fname).encode())
+        h.update(str(version).encode())
+        h.update(json.dumps(args, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def count(self, hit: bool) -> None:
+        if hit:
+            MolprobityCache.hits += 1
+        else:
+            MolprobityCache.misses += 1
+        logging.info(f'MolProbity cache {"hit" if hit else "miss"} '
+                     f'({self.hits} hits, {self.misses} misses)')
+
+    def load(self, key: str):
+        """return cached results of tools or None"""
+        fname = self.get_filename(key)
+        if not fname.is_file():
+            self.count(False)
+            return None
+
+        try:
+            with gzip.open(fname, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, EOFError, ValueError) as e:
+            logging.warning(f'Discarding broken MolProbity cache entry {fname}: {e}')
+            self.remove(fname)
+            self.count(False)
+            return None
+
+        # Tables, and values per model with integer keys
+        for key_, value in entry.items():
+            if isinstance(value, dict) and 'columns' in value:
+                entry[key_] = table_from_json(value)
+            elif isinstance(value, dict):
+                entry[key_] = {int(k): v for k, v in value.items()}
+
+        # Mark as recently used
+        os.utime(fname)
+        self.count(True)
+        return entry
+
+    def store(self, key: str, results: dict) -> None:
+        """store results of all tools; write is atomic"""
+        fname = self.get_filename(key)
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        os.close(fd)
+        try:
+            with gzip.open(tmpname, 'wt', encoding='utf-8') as f:
+                json.dump({k: table_to_json(v) if isinstance(v, pd.DataFrame)
+                           else v for k, v in results.items()}, f)
+            os.replace(tmpname, fname)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Couldn't cache MolProbity results: {e}")
+            self.remove(tmpname)
+            return
+
+        self.evict()
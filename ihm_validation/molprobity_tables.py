@@ -0,0 +1,392 @@
+###################################
+# Script :
+# 1) Contains functions to parse
+# outputs of MolProbity tools into
+# tables and to summarize them
+#
+###################################
+
+import re
+import logging
+import numpy as np
+import pandas as pd
+
+# Outputs are parsed as arrays of bytes: fields are located by
+# vectorized searches for separators and fixed widths, instead of
+# splitting each line in Python. Splitting with pandas string methods
+# is about four times slower for outputs of large ensembles (see
+# benchmarks/bench_molprobity_tables.py)
+SPACE, NEWLINE, COLON = b' \n:'
+
+RESIDUE_COLUMNS = ['model', 'chain', 'resseq', 'icode', 'altloc', 'resname']
+
+RAMA_COLUMNS = RESIDUE_COLUMNS + ['score', 'phi', 'psi', 'evaluation', 'type']
+
+ROTA_COLUMNS = RESIDUE_COLUMNS + ['evaluation', 'rotamer']
+
+CLASH_COLUMNS = ['model'] + [
+    name + k for k in ('1', '2')
+    for name in RESIDUE_COLUMNS[1:] + ['atom']] + ['overlap']
+
+# Bad Clashes >= 0.4 Angstrom[ MODEL n]:
+CLASH_HEADER = re.compile(r'Bad Clashes.*?(?:MODEL\s*(\d+))?\s*:?\s*$',
+                          re.IGNORECASE)
+
+# [MODEL n ]clashscore = x
+CLASH_SCORE = re.compile(r'(?:MODEL\s*(\d+)\s+)?clashscore\s*=\s*(\d+\.\d+)',
+                         re.IGNORECASE)
+
+
+def get_model_column(models: dict) -> (list, pd.Series):
+    """
+    all lines of {model: lines} and the model of each line; models
+    without lines are kept as categories
+    """
+    lines = [el for v in models.values() for el in v]
+    model = pd.Categorical(
+        np.repeat(np.array(list(models), dtype=int),
+                  [len(v) for v in models.values()]),
+        categories=list(models))
+    return lines, pd.Series(model)
+
+
+def join_lines(lines: list) -> (np.ndarray, np.ndarray, np.ndarray):
+    """bytes of lines joined by newlines, and offsets of starts and ends
+    of lines"""
+    buf = np.frombuffer(('\n'.join(lines) + '\n').encode(), dtype=np.uint8)
+    ends = np.flatnonzero(buf == NEWLINE)
+    starts = np.r_[0, ends[:-1] + 1]
+    return buf, starts, ends
+
+
+def get_bytes(buf: np.ndarray, begin: np.ndarray,
+              end: np.ndarray) -> np.ndarray:
+    """bytes from begin to end of each row without leading and trailing
+    spaces"""
+    begin = np.minimum(begin, end)
+    last = len(buf) - 1
+    while True:
+        lead = (begin < end) & (buf[np.minimum(begin, last)] == SPACE)
+        begin = begin + lead
+        trail = (begin < end) & (buf[np.maximum(end - 1, 0)] == SPACE)
+        end = end - trail
+        if not (lead.any() or trail.any()):
+            break
+    width = max(int((end - begin).max(initial=0)), 1)
+    offsets = begin[:, None] + np.arange(width)
+    chars = np.where(offsets < end[:, None],
+                     buf[np.minimum(offsets, last)], np.uint8(0))
+    return np.ascontiguousarray(chars).view(f'S{width}').ravel()
+
+
+def to_categorical(values: np.ndarray) -> pd.Categorical:
+    """strings of bytes; each distinct value is decoded once. Values of
+    up to eight bytes are hashed as integers"""
+    if values.dtype.kind == 'S' and values.dtype.itemsize <= 8:
+        codes, uniques = pd.factorize(values.astype('S8').view(np.uint64))
+        uniques = np.asarray(uniques, dtype=np.uint64).view('S8')
+    else:
+        codes, uniques = pd.factorize(values.astype(object))
+    return pd.Categorical.from_codes(codes, [v.decode() for v in uniques])
+
+
+def get_numbers(buf: np.ndarray, begin: np.ndarray,
+                end: np.ndarray) -> np.ndarray:
+    """numbers from begin to end of each row; NaN if not a number"""
+    values = get_bytes(buf, begin, end)
+    try:
+        return values.astype(float)
+    except ValueError:
+        return pd.to_numeric(values.astype(str), errors='coerce')
+
+
+def get_colons(buf: np.ndarray,
+               starts: np.ndarray) -> (np.ndarray, np.ndarray):
+    """offsets of colons and index of the first colon of each line"""
+    colons = np.r_[np.flatnonzero(buf == COLON), len(buf)]
+    return colons, np.searchsorted(colons, starts)
+
+
+def get_field_ends(colons: np.ndarray, index: np.ndarray,
+                   starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """offsets of colons of index of each line, or of line ends"""
+    pos = colons[np.clip(index, 0, len(colons) - 1)]
+    return np.where((pos >= starts) & (pos < ends), pos, ends)
+
+
+def get_residue_ids(buf: np.ndarray, starts: np.ndarray,
+                    stops: np.ndarray) -> dict:
+    """
+    {column: bytes} of chain, resseq, icode, altloc and resname of residue
+    ids ("%2s%4s%1s%1s%3s") from starts to stops of lines. Fields are of
+    fixed width from the end; chain ids may be longer
+    """
+    def field(begin: int, end: int) -> np.ndarray:
+        return get_bytes(buf, np.maximum(stops - begin, starts),
+                         np.maximum(stops - end, starts))
+
+    return {'chain': get_bytes(buf, starts, np.maximum(stops - 9, starts)),
+            'resseq': field(9, 5),
+            'icode': field(5, 4),
+            'altloc': field(4, 3),
+            'resname': field(3, 0)}
+
+
+def get_table(model: pd.Series, columns: dict) -> pd.DataFrame:
+    """table of models and {column: bytes or numbers}; bytes are decoded
+    to categoricals"""
+    table = pd.DataFrame({'model': model})
+    for name, values in columns.items():
+        table[name] = to_categorical(values) \
+            if values.dtype.kind in 'SO' else values
+    return table
+
+
+def parse_rama(models: dict) -> pd.DataFrame:
+    """
+    table of ramalyze residues of {model: lines} without headers and
+    summaries. Lines are id:score:phi:psi:evaluation:type
+    """
+    lines, model = get_model_column(models)
+    if not lines:
+        return pd.DataFrame({'model': model}, columns=RAMA_COLUMNS)
+    buf, starts, ends = join_lines(lines)
+    colons, first = get_colons(buf, starts)
+    bounds = [starts - 1] + [get_field_ends(colons, first + k, starts, ends)
+                             for k in range(5)] + [ends]
+    columns = get_residue_ids(buf, starts, bounds[1])
+    for k, name in enumerate(('score', 'phi', 'psi'), 1):
+        columns[name] = get_numbers(buf, bounds[k] + 1, bounds[k + 1])
+    columns['evaluation'] = get_bytes(buf, bounds[4] + 1, bounds[5])
+    columns['type'] = get_bytes(buf, bounds[5] + 1, bounds[6])
+    return get_table(model, columns)
+
+
+def parse_rota(models: dict) -> pd.DataFrame:
+    """
+    table of rotalyze residues of {model: lines} without headers and
+    summaries. Lines are id:...:evaluation:rotamer; the number of fields
+    in between depends on the version
+    """
+    lines, model = get_model_column(models)
+    if not lines:
+        return pd.DataFrame({'model': model}, columns=ROTA_COLUMNS)
+    buf, starts, ends = join_lines(lines)
+    colons, first = get_colons(buf, starts)
+    last = np.searchsorted(colons, ends) - 1
+    bounds = [get_field_ends(colons, last - k, starts, ends)
+              for k in (1, 0)]
+    columns = get_residue_ids(
+        buf, starts, get_field_ends(colons, first, starts, ends))
+    columns['evaluation'] = get_bytes(buf, bounds[0] + 1, bounds[1])
+    columns['rotamer'] = get_bytes(buf, bounds[1] + 1, ends)
+    return get_table(model, columns)
+
+
+def split_clash_tokens(tokens: list):
+    """
+    chain, resseq, resname and atom name of both atoms and overlap of
+    whitespace-separated tokens of a clash. Chain and residue number of an
+    atom may be merged ("%2s%4s": chain A and residue 1000 are A1000).
+    None if unknown
+    """
+    out, rest = [], tokens[:-1]
+    for _ in range(2):
+        if len(rest) >= 4 and re.match(r'-?\d', rest[1]):
+            out += rest[:4]
+            rest = rest[4:]
+        elif len(rest) >= 3 and len(rest[0]) > 4:
+            k = 5 if rest[0][-1].isalpha() else 4
+            out += [rest[0][:-k], rest[0][-k:]] + rest[1:3]
+            rest = rest[3:]
+        else:
+            return None
+    return None if rest else out + [tokens[-1].lstrip(':')]
+
+
+def parse_clash_lines(lines: list) -> dict:
+    """
+    {column: bytes or numbers} of atoms and overlaps of clashes. Lines
+    are two atoms ("%2s%4s%1s%1s%3s %4s": residue id and atom name)
+    separated by a space and followed by " :overlap". Lines in other
+    layouts are split into tokens with split_clash_tokens; atoms of
+    unknown lines are empty
+    """
+    buf, starts, ends = join_lines(lines)
+    colons, _ = get_colons(buf, starts)
+    c = get_field_ends(colons, np.searchsorted(colons, ends) - 1,
+                       starts, ends)
+    # Separators of fixed-width atoms
+    fixed = (c - 32 >= starts) & (c < ends)
+    for k in (1, 6, 18, 23):
+        fixed &= buf[np.maximum(c - k, 0)] == SPACE
+
+    columns = {}
+    for k, (begin, end) in ((1, (np.maximum(c - 34, starts), c - 18)),
+                            (2, (c - 17, c - 1))):
+        for name, values in get_residue_ids(buf, begin, end - 5).items():
+            columns[name + str(k)] = values
+        columns['atom' + str(k)] = get_bytes(buf, end - 4, end)
+    columns['overlap'] = get_numbers(buf, c + 1, ends)
+
+    other = np.flatnonzero(~fixed)
+    if len(other):
+        for name, values in columns.items():
+            if name != 'overlap':
+                columns[name] = values.astype(object)
+                columns[name][other] = b''
+        columns['overlap'][other] = np.nan
+        names = ['chain1', 'resseq1', 'resname1', 'atom1',
+                 'chain2', 'resseq2', 'resname2', 'atom2']
+        for i in other:
+            tokens = split_clash_tokens(lines[i].split())
+            if tokens is not None:
+                for name, token in zip(names, tokens):
+                    columns[name][i] = token.encode()
+                columns['overlap'][i] = float(tokens[-1])
+    return columns
+
+
+def parse_clash(line: list, nos: int = 1) -> (pd.DataFrame, dict):
+    """
+    table of clashes and {model: clashscore} of clashscore output.
+    Clashes (see parse_clash_lines) follow a 'Bad Clashes' header of each
+    model and are followed by clashscores of all models
+    """
+    headers = [(i, CLASH_HEADER.search(el)) for i, el in enumerate(line)
+               if 'Bad Clashes' in el]
+    headers = [(i, m) for i, m in headers if m]
+    start = headers[-1][0] + 1 if headers else 0
+    scores = [(i, CLASH_SCORE.search(el)) for i, el in enumerate(line)
+              if i >= start and 'clashscore' in el.lower()]
+    scores = [(i, m) for i, m in scores if m]
+    end = scores[0][0] if scores else len(line)
+    clashscores = {int(m.group(1)) if m.group(1) else 1: m.group(2)
+                   for _, m in scores}
+
+    bounds = [i for i, _ in headers[1:]] + [end]
+    blocks, numbers = [], []
+    for k, ((i, m), j) in enumerate(zip(headers, bounds), 1):
+        blocks.append([el for el in line[i + 1:j] if el])
+        numbers.append(int(m.group(1)) if m.group(1) and nos > 1 else k)
+
+    lines, model = get_model_column(dict(zip(numbers, blocks)))
+    if not lines:
+        return pd.DataFrame({'model': model}, columns=CLASH_COLUMNS), \
+            clashscores
+    table = get_table(model, parse_clash_lines(lines))
+    unparsed = int(table['atom1'].eq('').sum())
+    if unparsed:
+        logging.warning(f'{unparsed} clashes in unknown format')
+
+    return table, clashscores
+
+
+def get_evaluation_summary(table: pd.DataFrame) -> dict:
+    """numbers of analyzed, favored, allowed and outlier residues per model"""
+    favored = table['evaluation'].eq('Favored')
+    allowed = table['evaluation'].eq('Allowed')
+    counts = pd.DataFrame({
+        'model': table['model'],
+        'Analyzed': 1,
+        'Favored': favored,
+        'Allowed': allowed,
+        'Outliers': ~(favored | allowed)}).groupby(
+            'model', observed=False).sum().astype(int)
+    out = {'Model ID': counts.index.tolist()}
+    out.update({k: v.tolist() for k, v in counts.items()})
+    return out
+
+
+def map_rows(table: pd.DataFrame, f) -> np.ndarray:
+    """f(*row) of each row of table, evaluated once per distinct row"""
+    out = np.empty(len(table), dtype=object)
+    if len(table):
+        codes = table.groupby(list(table), observed=True, sort=False,
+                              dropna=False).ngroup().to_numpy()
+        _, first = np.unique(codes, return_index=True)
+        rows = table.iloc[first]
+        values = np.empty(len(first), dtype=object)
+        for i, row in enumerate(zip(*(rows[k].tolist() for k in rows))):
+            values[i] = f(*row)
+        out[:] = values[codes]
+    return out
+
+
+def get_outlier_details(table: pd.DataFrame, chains_map: dict) -> dict:
+    """outlier residues with label ids; residues missing from chains_map
+    are skipped"""
+    outliers = table[table['evaluation'].eq('OUTLIER')]
+    labels = map_rows(outliers[['chain', 'resseq', 'icode']],
+                      lambda chain, resseq, icode:
+                      chains_map.get((chain, resseq + icode)))
+    found = pd.notna(labels)
+    if not found.all():
+        logging.warning(f'Skipping {(~found).sum()} outliers of '
+                        f'unknown residues')
+    return {'Model ID': outliers['model'].to_numpy()[found].tolist(),
+            'Chain': [k[0] for k in labels[found]],
+            'Residue ID': [k[1] for k in labels[found]],
+            'Residue type': outliers['resname'].to_numpy()[found].tolist()}
+
+
+def get_clash_summary(table: pd.DataFrame, clashscores: dict,
+                      nos: int = 1) -> (dict, int):
+    """
+    clashscores and numbers of clashes per model in number order, and
+    the total number of clashes. Without any clashscores, all models
+    have a clashscore of 0.0
+    """
+    if clashscores:
+        numbers = sorted(clashscores)
+        values = [clashscores[k] for k in numbers]
+    else:
+        numbers = list(range(1, nos + 1))
+        values = [0.0] * nos
+    counts = table.groupby('model', observed=False).size().reindex(
+        numbers, fill_value=0)
+    out = {'Model ID': [str(k) for k in numbers],
+           'Clash score': values,
+           'Number of clashes': counts.astype(int).tolist()}
+    return out, int(counts.sum())
+
+
+def get_clash_details(table: pd.DataFrame, chains_map: dict) -> dict:
+    """clashes with label ids of atoms; clashes of unknown residues
+    are skipped"""
+    def get_residue(chain, resseq, icode):
+        ids = chains_map.get((chain, resseq + icode))
+        return None if ids is None else f'{ids[0]}:{ids[1]}:'
+
+    residues = [map_rows(table[['chain' + k, 'resseq' + k, 'icode' + k]],
+                         get_residue) for k in ('1', '2')]
+    found = pd.notna(residues[0]) & pd.notna(residues[1])
+    if not found.all():
+        logging.warning(f'Skipping {(~found).sum()} clashes of '
+                        f'unknown residues')
+    atoms = [residues[i][found]
+             + table['resname' + k].to_numpy(dtype=object)[found] + ':'
+             + table['atom' + k].to_numpy(dtype=object)[found]
+             for i, k in enumerate(('1', '2'))]
+    overlaps = map_rows(table[['overlap']], '{:.3f}'.format)
+    return {'Model ID': table['model'].astype(str).to_numpy()[found].tolist(),
+            'Atom-1': atoms[0].tolist(),
+            'Atom-2': atoms[1].tolist(),
+            'Clash overlap (&#8491)': overlaps[found].tolist()}
+
+
+def table_to_json(table: pd.DataFrame) -> dict:
+    """JSON-serializable table with dtypes and categories of its columns"""
+    return {'dtypes': {k: str(v.dtype) for k, v in table.items()
+                       if not isinstance(v.dtype, pd.CategoricalDtype)},
+            'categories': {k: v.cat.categories.tolist() for k, v in table.items()
+                           if isinstance(v.dtype, pd.CategoricalDtype)},
+            'columns': {k: v.tolist() for k, v in table.items()}}
+
+
+def table_from_json(entry: dict) -> pd.DataFrame:
+    """table of table_to_json"""
+    table = pd.DataFrame(entry['columns']).astype(entry['dtypes'])
+    for name, categories in entry['categories'].items():
+        table[name] = pd.Categorical(table[name], categories=categories)
+    return table
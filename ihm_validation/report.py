@@ -9,17 +9,20 @@
 ###################################
 
 import os
+import subprocess
 from pathlib import Path
 import logging
-from mmcif_io import GetInputInformation
+from mmcif_io import GetInputInformation, get_parse_count, MAX_NUM_MODELS
+from system_cache import DEFAULT_MAX_SIZE
+from molprobity_cache import MolprobityCache
 import excludedvolume
+import connectivity
 import molprobity
 import get_plots, sas, sas_plots
 import cx
 import utility
-import pickle
+import csv
 import json
-from multiprocessing import Manager
 from collections import Counter
 import numpy as np
 from selenium import webdriver
@@ -27,14 +30,40 @@ from selenium import webdriver
 REPORT_VERSION = '1.2.1'
 
 class WriteReport(object):
-    def __init__(self, mmcif_file, db, cache, nocache=False):
+    def __init__(self, mmcif_file, db, cache, nocache=False,
+                 cache_max_size=DEFAULT_MAX_SIZE, nprocs=None, exv_skin=None,
+                 exv_rigid_bodies=False, exv_clashes=False, exv_sampling=None,
+                 connectivity_tolerance=connectivity.CONNECTIVITY_TOLERANCE,
+                 molprobity_split=False, molprobity_archive=False):
         self.mmcif_file = mmcif_file
         self.db = db
-        self.input = GetInputInformation(self.mmcif_file)
+        self.input = GetInputInformation(self.mmcif_file,
+                                         cache_root=cache,
+                                         nocache=nocache,
+                                         cache_max_size=cache_max_size)
         # Webdriver for figures
         self.driver = self.create_webdriver()
         self.cache = cache
         self.nocache = nocache
+        self.cache_max_size = cache_max_size
+        # Number of worker processes; all available cores by default
+        self.nprocs = nprocs
+        # Skin distance of Verlet lists for excluded volume of ensembles
+        self.exv_skin = exv_skin
+        # Evaluate pairs within rigid bodies once per entry
+        self.exv_rigid_bodies = exv_rigid_bodies
+        # Write all overlapping pairs of beads to the csv directory
+        self.exv_clashes = exv_clashes
+        # Keyword arguments of GetExcludedVolume.run_exc_vol_sampled
+        # to evaluate excluded volume for a sample of models; None for all
+        self.exv_sampling = exv_sampling
+        # Largest gap (A) between surfaces of sequence-consecutive beads
+        self.connectivity_tolerance = connectivity_tolerance
+        # Run molprobity tools on each model of an ensemble separately,
+        # so that outliers are attributed to models exactly
+        self.molprobity_split = molprobity_split
+        # Keep gzipped raw outputs of molprobity tools in the cache
+        self.molprobity_archive = molprobity_archive
         self.report_version = REPORT_VERSION
 
     def create_webdriver(self) -> webdriver.Firefox:
@@ -49,6 +78,10 @@ class WriteReport(object):
         if self.driver:
             self.driver.quit()
 
+    def get_parse_count(self) -> int:
+        '''number of times the input file was parsed during this run'''
+        return get_parse_count()
+
     def run_entry_composition(self, Template_Dict: dict) -> dict:
         '''
         get entry composition, relies on IHM library
@@ -129,6 +162,13 @@ class WriteReport(object):
             logging.info("File rewritten...")
             logging.info("Molprobity analysis is being calculated...")
 
+    @staticmethod
+    def check_number_of_models(Template_Dict: dict, n: int, source: str) -> None:
+        '''warn if an analysis evaluated a different number of models'''
+        if n != Template_Dict['NumModels']:
+            logging.warning(f'{source} evaluated {n} models, '
+                            f'expected {Template_Dict["NumModels"]}')
+
     def check_disclaimer_warning(self, exv_data: dict, Template_Dict: dict) -> dict:
         '''
         set a disclaimer if model quality can not be determined
@@ -151,59 +191,53 @@ class WriteReport(object):
         exception: models with DNA--we need a way to assess models with DNA
         '''
         Template_Dict['molprobity_version'] = None
-
-        if self.input.check_sphere() < 1:
+        exv_data = molprobity_dict = None
+        # multi-resolution models with atoms and spheres get both MolProbity
+        # (atoms only) and excluded volume (atoms and spheres)
+        sphere = self.input.check_sphere() > 0
+        mixed = sphere and self.input.check_atoms() > 0
+        Template_Dict['mixed'] = int(mixed)
+        # Models evaluated by MolProbity and excluded volume
+        Template_Dict['NumModels'] = min(self.input.get_number_of_models(),
+                                         MAX_NUM_MODELS)
+
+        if not sphere or mixed:
             # if there are no spheres, wed have atoms, so go ahead and set exv to 0/none
             # global clashscore; global rama; global sidechain;
-            exv_data = None
             I_mp = molprobity.GetMolprobityInformation(self.mmcif_file,
-                                                       cache = self.cache)
+                                                       cache=self.cache,
+                                                       system=self.input.system,
+                                                       archive=self.molprobity_archive)
             Template_Dict['molprobity_version'] = I_mp.get_version()
-            key = Path(self.mmcif_file).stem
-            filename = str(Path(
-                self.cache, key + '_temp_mp.pickle'))
-            # check if molprobity for this entry has already been detetmined
-            if os.path.exists(filename) and not self.nocache:
-                d_mp = {}
-                logging.info("Molprobity analysis file already exists...\n...assuming clashscores, \
-                        Ramachandran and rotamer outliers have already been calculated")
-                with open(filename, 'rb') as fp:
-                    d_mp['molprobity'] = pickle.load(fp)
-
-                f_rota = str(Path(
-                    self.cache, key + '_temp_rota.pickle'))
-                with open(f_rota, 'rb') as fp:
-                    d_mp['rota'] = pickle.load(fp)
-
-                f_rama = str(Path(
-                    self.cache, key + '_temp_rama.pickle'))
-                with open(f_rama, 'rb') as fp:
-                    d_mp['rama'] = pickle.load(fp)
-
-                f_clash = str(Path(
-                    self.cache, key + '_temp_clash.pickle'))
-                with open(f_clash, 'rb') as fp:
-                    d_mp['clash'] = pickle.load(fp)
-
+            # MolProbity results are keyed by the content of the rewritten
+            # file, the MolProbity version and the tool arguments
+            mp_cache = MolprobityCache(self.cache, max_size=self.cache_max_size)
+            key = I_mp.get_cache_key(mp_cache, split=self.molprobity_split)
+            d_mp = None if self.nocache else mp_cache.load(key)
+            if d_mp is not None:
+                logging.info("Molprobity results found in cache...")
             else:
                 # if molprobity for these entries have not yet been determined, go ahead and set them up to run
                 # we rewrite all files into a format that is suitable for molprobity
                 logging.info("Molprobity analysis is being calculated...")
+                d_mp = {}
                 try:
-                    manager = Manager()
-                    d_mp = manager.dict()
-                    # utility.runInParallel(
-                    I_mp.run_clashscore(d_mp)
-                    I_mp.run_ramalyze(d_mp)
-                    I_mp.run_rotalyze(d_mp)
-                    I_mp.run_molprobity(d_mp)
-                    # Cleanup
-                    I_mp.cleanup()
+                    # The four tools run concurrently, each in its own
+                    # working directory
+                    d_mp = I_mp.run_all({}, workers=self.nprocs,
+                                        split=self.molprobity_split)
 
                 # if by any chance the rewrite doens't help, and we are unable to run molprobity,
                 # step out and print an error
-                except (TypeError, KeyError, ValueError):
+                except (TypeError, KeyError, ValueError, OSError,
+                        subprocess.CalledProcessError):
                     logging.error("Molprobity cannot be calculated...")
+                    d_mp = {}
+                # Only results of runs where all tools succeeded are cached
+                if d_mp:
+                    mp_cache.store(key, d_mp)
+            # Cleanup
+            I_mp.cleanup()
 
             # at this stage, we should have all our dictionary terms
             if d_mp:
@@ -264,33 +298,39 @@ class WriteReport(object):
                     Template_Dict['molp_b_csv'], htmlDirName, table_filename='bond_outliers.html')
 
                 # after anle and bond outliers, we move onto processing rotamers, ramachandran outliers, and clashlists
+                # outputs are parsed into tables as the tools run; summary
+                # and detailed tables are derived from them
+                rota, rama = d_mp['rota'], d_mp['rama']
+                clashes, clashscores = d_mp['clash'], d_mp['clashscores']
                 Template_Dict['rotascore'] = utility.dict_to_JSlist(
-                    I_mp.rota_summary_table(I_mp.process_rota(d_mp['rota'])))
+                    I_mp.rota_summary_table(rota))
                 Template_Dict['rotalist'] = utility.dict_to_JSlist(
-                    I_mp.rota_detailed_table(I_mp.process_rota(d_mp['rota']), Template_Dict['ChainL'], Template_Dict['ChainLMap']))
+                    I_mp.rota_detailed_table(rota, Template_Dict['ChainLMap']))
                 Template_Dict['ramascore'] = utility.dict_to_JSlist(
-                    I_mp.rama_summary_table(I_mp.process_rama(d_mp['rama'])))
+                    I_mp.rama_summary_table(rama))
                 Template_Dict['ramalist'] = utility.dict_to_JSlist(
-                    I_mp.rama_detailed_table(I_mp.process_rama(d_mp['rama']), Template_Dict['ChainL'], Template_Dict['ChainLMap']))
+                    I_mp.rama_detailed_table(rama, Template_Dict['ChainLMap']))
                 clashscores, Template_Dict['tot'] = I_mp.clash_summary_table(
-                    d_mp['clash'])
+                    clashes, clashscores)
                 Template_Dict['clashscore_list'] = utility.dict_to_JSlist(
                     clashscores)
                 Template_Dict['clashlist'] = utility.dict_to_JSlist(I_mp.clash_detailed_table(
-                    d_mp['clash'], Template_Dict['ChainLMap']))
+                    clashes, Template_Dict['ChainLMap']))
                 Template_Dict['assess_excluded_volume'] = 'Not applicable'
                 molprobity_dict = I_mp.get_data_for_quality_at_glance(Template_Dict['clashscore_list'],
                                                                       Template_Dict['rotascore'], Template_Dict['ramascore'])
                 Template_Dict['assess_atomic_segments'] = utility.mp_readable_format(
                     molprobity_dict)
-                Template_Dict['NumModels'] = len(molprobity_dict['Names'])
-
-        else:
-            Template_Dict['bond'] = Template_Dict['angle'] = 0
-            Template_Dict['total_bonds'] = Template_Dict['total_angles'] = 1
+                self.check_number_of_models(
+                    Template_Dict, len(molprobity_dict['Names']), 'MolProbity')
+
+        if sphere:
+            if not mixed:
+                Template_Dict['bond'] = Template_Dict['angle'] = 0
+                Template_Dict['total_bonds'] = Template_Dict['total_angles'] = 1
+                # set the appropriate flag for assessing atomic segments
+                Template_Dict['assess_atomic_segments'] = None
             # if there are spheres, wed have coarse grained beadas, so we go ahead and calculate excluded volume
-            # set the appropriate flag for assessing atomic segments
-            Template_Dict['assess_atomic_segments'] = None
             # check if exv has already been evaluated
             file = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..',
                                                 'Validation', 'results', str(Template_Dict['ID'])+'exv.txt'))
@@ -302,13 +342,30 @@ class WriteReport(object):
                 exv_data = {
                     'Models': line[0], 'Excluded Volume Satisfaction (%)':
                     line[1], 'Number of violations': line[2]}
+                chain_violations = sampling = None
+                Template_Dict['exv_clashes'] = False
             else:
                 logging.info("Excluded volume is being calculated...")
-                I_ev = excludedvolume.GetExcludedVolume(self.mmcif_file, cache=self.cache)
-                model_dict = I_ev.get_all_spheres()
-                exv_data = I_ev.run_exc_vol_parallel(model_dict)
+                clash_file = None
+                if self.exv_clashes:
+                    clash_file = str(Path(csvDirName, 'exv_clashes.csv'))
+                I_ev = excludedvolume.GetExcludedVolume(self.mmcif_file,
+                                                        cache=self.cache,
+                                                        system=self.input.system,
+                                                        workers=self.nprocs,
+                                                        skin=self.exv_skin,
+                                                        rigid_bodies=self.exv_rigid_bodies,
+                                                        clash_file=clash_file,
+                                                        atoms=mixed)
+                # Models are streamed to the workers through shared memory
+                if self.exv_sampling:
+                    exv_data = I_ev.run_exc_vol_sampled(**self.exv_sampling)
+                else:
+                    exv_data = I_ev.run_exc_vol_parallel()
+                chain_violations = I_ev.get_chain_violations()
+                sampling = I_ev.sampling
+                Template_Dict['exv_clashes'] = clash_file is not None
 
-            Template_Dict['NumModels'] = len(exv_data['Models'])
             viol_percent = np.asarray(exv_data['Excluded Volume Satisfaction (%)'], dtype=float)
             min_viol_percent = min(viol_percent)
             max_viol_percent = max(viol_percent)
@@ -316,7 +373,35 @@ class WriteReport(object):
             # let's update template dict with appropriate terms
             Template_Dict['excluded_volume'] = utility.dict_to_JSlist(exv_data)
             Template_Dict['assess_excluded_volume'] = f'Satisfaction: {min_viol_percent:.2f}-{max_viol_percent:.2f}%'
-            molprobity_dict = None
+            # Results of a sample of models are labelled as such
+            Template_Dict['exv_sampling'] = []
+            self.check_number_of_models(
+                Template_Dict,
+                sampling['Total models'] if sampling else len(exv_data['Models']),
+                'Excluded volume')
+            if sampling:
+                Template_Dict['assess_excluded_volume'] += \
+                    f' (sampled {sampling["Evaluated models"]} of {sampling["Total models"]} models)'
+                Template_Dict['exv_sampling'] = utility.dict_to_JSlist(
+                    {k: [v] for k, v in sampling.items()})
+            # Pairs of chains with most violations
+            Template_Dict['exv_chain_pairs'] = []
+            if chain_violations:
+                Template_Dict['exv_chain_pairs'] = utility.dict_to_JSlist(
+                    excludedvolume.GetExcludedVolume.get_chain_violation_summary(
+                        chain_violations, len(exv_data['Models']), top=20))
+
+            # Gaps between sequence-consecutive beads of all models
+            I_sc = connectivity.GetSequenceConnectivity(
+                self.mmcif_file, system=self.input.system,
+                tolerance=self.connectivity_tolerance)
+            summary, outliers = I_sc.run_connectivity()
+            Template_Dict['connectivity'] = utility.dict_to_JSlist(summary)
+            Template_Dict['connectivity_outliers'] = utility.dict_to_JSlist(
+                I_sc.get_largest_outliers(outliers, top=20))
+            Template_Dict['connectivity_tolerance'] = self.connectivity_tolerance
+            with open(Path(csvDirName, 'connectivity_outliers.csv'), 'w') as f:
+                csv.writer(f).writerows(utility.dict_to_JSlist(outliers))
 
         # we now set the disclaimer tag to see if there are issues while calculating exc vol
         Template_Dict['disclaimer'] = 0
@@ -334,7 +419,8 @@ class WriteReport(object):
         # we start by checking if sas dataset was used to build model
         if self.input.check_for_sas(self.input.get_dataset_comp()):
             Template_Dict['sas'] = ["True"]
-            I_sas = sas.SasValidation(self.mmcif_file, self.db)
+            I_sas = sas.SasValidation(self.mmcif_file, self.db,
+                                      system=self.input.system)
             Template_Dict['atsas_version'] = I_sas.get_atsas_version()
             Template_Dict['p_val'] = utility.dict_to_JSlist(I_sas.get_pvals())
             Template_Dict['sasdb_code'] = I_sas.get_sas_ids()
@@ -379,7 +465,8 @@ class WriteReport(object):
             # create all relevant plots
             # try:
             I_sas_plt = sas_plots.SasValidationPlots(
-                self.mmcif_file, imageDirName, self.driver)
+                self.mmcif_file, imageDirName, self.driver,
+                system=self.input.system)
             I_sas_plt.plot_multiple()
             # I_sas.get_pofr_errors()
             I_sas_plt.plot_pf()
@@ -408,7 +495,7 @@ class WriteReport(object):
 
         if self.input.check_for_cx(self.input.get_dataset_comp()):
             Template_Dict['cx'] = True
-            I_cx = cx.CxValidation(self.mmcif_file)
+            I_cx = cx.CxValidation(self.mmcif_file, system=self.input.system)
             self.I_cx = I_cx
 
             raw_data = None
@@ -461,7 +548,8 @@ class WriteReport(object):
         '''
         get quality at glance image; will be updated as validation report is updated
         '''
-        I_plt = get_plots.Plots(self.mmcif_file, imageDirName, driver=self.driver)
+        I_plt = get_plots.Plots(self.mmcif_file, imageDirName, driver=self.driver,
+                                system=self.input.system)
         I_plt.plot_quality_at_glance(
             molprobity_dict, exv_data, sas_data, sas_fit, cx_fit)
 
@@ -33,8 +33,8 @@ from mmCif import mmcifIO
 class SasValidation(GetInputInformation):
     db_name = 'SASBDB'
 
-    def __init__(self, mmcif_file, db='.'):
-        super().__init__(mmcif_file)
+    def __init__(self, mmcif_file, db='.', system=None):
+        super().__init__(mmcif_file, system=system)
         self.version = self.get_atsas_version()
         self.ID = self.get_id()
         self.nos = GetInputInformation.get_number_of_models(self)
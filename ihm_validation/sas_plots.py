@@ -17,8 +17,8 @@ from bokeh.plotting import figure, save
 from bokeh.layouts import column, gridplot
 
 class SasValidationPlots(sas.SasValidation):
-    def __init__(self, mmcif_file, imageDirName, driver):
-        super().__init__(mmcif_file)
+    def __init__(self, mmcif_file, imageDirName, driver, system=None):
+        super().__init__(mmcif_file, system=system)
         self.ID = self.get_id()
         self.ID_f = self.get_file_id()
         # self.intensities = self.get_intensities()
@@ -0,0 +1,128 @@
+###################################
+# Script :
+# 1) Contains class for a persistent
+# cache of parsed ihm.System objects
+#
+###################################
+
+import os
+import hashlib
+import logging
+import pickle
+import tempfile
+from pathlib import Path
+import ihm
+
+# Default upper bound for the total size of all caches of a cache root
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3  # 10 GB
+
+# Subdirectories and entry suffixes of the caches in a cache root,
+# which share one size budget
+CACHES = {'systems': '.pickle', 'molprobity': '.json.gz'}
+
+
+def get_file_hash(fname: str, blocksize: int = 1 << 20) -> str:
+    """SHA-256 of the file content"""
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class SystemCache(object):
+    """
+    Content-addressed cache of parsed systems.
+    Entries are keyed by the hash of the input file, the python-ihm
+    version and the model class used by the reader. The total size
+    of all caches of the cache root (see CACHES) is bounded; least
+    recently used entries of any of them are evicted first.
+    """
+    subdir = 'systems'
+    suffix = '.pickle'
+
+    def __init__(self, cache_root: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.root = Path(cache_root)
+        self.path = Path(cache_root, self.subdir)
+        self.max_size = max_size
+        if not self.path.is_dir():
+            os.makedirs(self.path)
+            logging.info(f'Created system cache directory {self.path}')
+
+    def get_key(self, fname: str, model_class=ihm.model.Model,
+                variant: str = '') -> str:
+        """cache key for the input file; variant distinguishes
+        partially loaded systems"""
+        h = hashlib.sha256()
+        h.update(get_file_hash(fname).encode())
+        h.update(ihm.__version__.encode())
+        h.update(f'{model_class.__module__}.{model_class.__qualname__}'.encode())
+        h.update(variant.encode())
+        return h.hexdigest()
+
+    def get_filename(self, key: str) -> Path:
+        return Path(self.path, key + self.suffix)
+
+    def load(self, key: str):
+        """return cached (system, encoding) or None"""
+        fname = self.get_filename(key)
+        if not fname.is_file():
+            logging.info('System cache miss')
+            return None
+
+        try:
+            with open(fname, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError,
+                AttributeError, ImportError) as e:
+            logging.warning(f'Discarding broken system cache entry {fname}: {e}')
+            self.remove(fname)
+            return None
+
+        # Mark as recently used
+        os.utime(fname)
+        logging.info('System cache hit')
+        return entry
+
+    def store(self, key: str, system: ihm.System, encoding: str) -> None:
+        """serialize parsed system; write is atomic"""
+        fname = self.get_filename(key)
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((system, encoding), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, fname)
+        except (OSError, RecursionError, pickle.PicklingError) as e:
+            logging.warning(f"Couldn't cache parsed system: {e}")
+            self.remove(tmpname)
+            return
+
+        self.evict()
+
+    def evict(self) -> None:
+        """remove least recently used entries of all caches of the cache
+        root until they fit max_size together"""
+        entries = []
+        for subdir, suffix in CACHES.items():
+            for fname in Path(self.root, subdir).glob('*' + suffix):
+                try:
+                    st = fname.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fname))
+
+        total = sum(x[1] for x in entries)
+        for mtime, size, fname in sorted(entries):
+            if total <= self.max_size:
+                break
+            logging.info(f'Evicting {fname.parent.name}/{fname.name} from cache')
+            self.remove(fname)
+            total -= size
+
+    @staticmethod
+    def remove(fname) -> None:
+        try:
+            os.remove(fname)
+        except OSError:
+            pass
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+###################################
+# Script :
+# 1) Contains fast triage of input
+# files for routing and scheduling
+# of validation jobs
+#
+###################################
+
+import os
+import sys
+import json
+import time
+import mmap
+import inspect
+import argparse
+import logging
+from collections import defaultdict
+import ihm.dataset
+import ihm.location
+from cif_index import CategoryIndex, COORDINATE_CATEGORIES, MIN_STEP, read_line
+from cif_tokenizer import (iter_cif_events, split_line, unquote, is_missing,
+                           get_category, ITEM, LOOP, ROWS)
+from input_formats import get_input_format, open_input
+
+# Small categories needed for the triage record
+TRIAGE_CATEGORIES = ('_entry', '_ihm_model_list', '_ihm_dataset_list',
+                     '_ihm_dataset_related_db_reference',
+                     '_ihm_model_representation_details')
+
+# Same mapping of data types and database names as in python-ihm reader
+DATA_TYPES = {c.data_type.lower(): c.data_type
+              for _, c in inspect.getmembers(ihm.dataset, inspect.isclass)
+              if issubclass(c, ihm.dataset.Dataset)}
+DATA_TYPES['cx-ms data'] = ihm.dataset.CXMSDataset.data_type
+
+DB_NAMES = {c.db_name.lower(): c.db_name
+            for _, c in inspect.getmembers(ihm.location, inspect.isclass)
+            if issubclass(c, ihm.location.DatabaseLocation)}
+
+
+def read_tables(fh, counted=()) -> (dict, dict):
+    """
+    Tabulate categories of a text mmCIF stream as
+    {category: {attribute: [values]}}; rows of categories
+    in counted are only counted
+    """
+    tables = defaultdict(lambda: defaultdict(list))
+    counts = defaultdict(int)
+    tags = []
+    for event, payload, lines in iter_cif_events(fh):
+        if event == ITEM:
+            tag, value = payload
+            value = None if is_missing(value) else unquote(value)
+            tables[get_category(tag)][tag.split('.', 1)[1].lower()].append(value)
+        elif event == LOOP:
+            tags = payload
+        elif event == ROWS and tags:
+            cat = get_category(tags[0])
+            if cat in counted:
+                counts[cat] += len(payload)
+                continue
+            for row in payload:
+                for tag, value in zip(tags, row):
+                    value = None if is_missing(value) else unquote(value)
+                    tables[cat][tag.split('.', 1)[1].lower()].append(value)
+    return tables, dict(counts)
+
+
+def count_loop_rows(buf, header: bytes, start: int, end: int) -> (int, bool):
+    """
+    Number of rows in a loop body. Short bodies, which find_loop_end
+    read row by row, are counted exactly. Longer ones are counted from
+    ids of the first and the last rows, which assumes contiguous ids
+    starting at 1 as written by python-ihm, or estimated from the body
+    size; these counts are not exact. Returns (count, exact)
+    """
+    if end <= start:
+        return 0, True
+    if end - start <= MIN_STEP:
+        # Rows are one per line
+        body = buf[start:end]
+        return body.count(b'\n') + (not body.endswith(b'\n')), True
+    tags = [t.lower() for t in split_line(header.decode('latin-1'))
+            if t.startswith('_')]
+    first = split_line(read_line(buf, start, end).decode('latin-1'))
+    last_start = buf.rfind(b'\n', start, end - 1) + 1
+    last = split_line(read_line(buf, max(last_start, start), end).decode('latin-1'))
+    try:
+        i = [t.split('.', 1)[1] for t in tags].index('id')
+        first_id, last_id = int(first[i]), int(last[i])
+        if len(first) == len(last) == len(tags) and first_id == 1 \
+                and last_id >= first_id:
+            # Other writers may skip or renumber ids
+            return last_id, False
+    except (ValueError, IndexError):
+        pass
+    row_size = len(read_line(buf, start, end))
+    return round((end - start) / row_size), False
+
+
+def get_coordinate_counts(index: CategoryIndex) -> (dict, bool):
+    """row counts of coordinate loops from the category index"""
+    counts, exact = {}, True
+    with open(index.fname, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for cat, start, end in index.sections:
+                if cat not in COORDINATE_CATEGORIES:
+                    continue
+                if cat in index.loop_bodies:
+                    body_start, body_end = index.loop_bodies[cat]
+                    n, ex = count_loop_rows(buf, buf[start:body_start],
+                                            body_start, body_end)
+                else:
+                    # Rows are not uniform; count them exactly
+                    text = buf[start:end].decode('latin-1').splitlines(True)
+                    n = read_tables(text, counted=(cat,))[1].get(cat, 0)
+                    ex = True
+                counts[cat] = counts.get(cat, 0) + n
+                exact = exact and ex
+    return counts, exact
+
+
+def get_column(tables: dict, category: str, attribute: str) -> list:
+    return tables.get(category, {}).get(attribute, [])
+
+
+def get_triage_record(tables: dict, counts: dict) -> dict:
+    """triage record from the small tables and coordinate row counts"""
+    data_types = [DATA_TYPES.get((t or '').lower(), ihm.dataset.Dataset.data_type)
+                  for t in get_column(tables, '_ihm_dataset_list', 'data_type')]
+    db_names = [DB_NAMES.get((d or '').lower(), d or 'Other')
+                for d in get_column(tables, '_ihm_dataset_related_db_reference',
+                                    'db_name')]
+    primitives = set(p.lower() for p in get_column(
+        tables, '_ihm_model_representation_details', 'model_object_primitive')
+        if p is not None)
+
+    atoms = counts.get('_atom_site', 0)
+    spheres = counts.get('_ihm_sphere_obj_site', 0)
+    gaussians = counts.get('_ihm_gaussian_obj_site', 0)
+    entry_id = get_column(tables, '_entry', 'id')
+
+    return {
+        'entry_id': entry_id[0] if entry_id else None,
+        'models': len(get_column(tables, '_ihm_model_list', 'model_id')),
+        'atoms': atoms,
+        'spheres': spheres,
+        'gaussians': gaussians,
+        'atomic': atoms > 0 and spheres == 0 and gaussians == 0,
+        'coarse_grained': spheres > 0 or gaussians > 0
+        or bool(primitives - {'atomistic'}),
+        # Same as GetInputInformation.check_sphere if all models have spheres
+        'sphere': int(spheres > 0),
+        'dataset_types': sorted(set(data_types)),
+        'sas': 'SAS' in str(data_types) and 'SAS' in str(db_names),
+        'cx': 'CX' in str(data_types),
+        'em': 'EM' in str(data_types),
+    }
+
+
+def triage(fname) -> dict:
+    """
+    Triage record of an input file. Uncompressed mmCIF files are scanned
+    with the category index, which jumps over coordinate loops, so the
+    time does not depend on the file size. Compressed files are streamed
+    once; BinaryCIF files are unpacked and only the small categories
+    are decoded.
+    """
+    t0 = time.perf_counter()
+    fmt, compression = get_input_format(fname)
+
+    if fmt == 'mmCIF' and compression is None:
+        index = CategoryIndex(fname, skip=COORDINATE_CATEGORIES)
+        text = index.read(TRIAGE_CATEGORIES).decode('utf8', errors='replace')
+        tables, _ = read_tables(text.splitlines(True))
+        counts, exact = get_coordinate_counts(index)
+    elif fmt == 'mmCIF':
+        with open_input(fname, errors='replace') as fh:
+            tables, counts = read_tables(fh, counted=COORDINATE_CATEGORIES)
+        exact = True
+    else:
+        with open_input(fname) as fh:
+            tables, counts = read_bcif_tables(fh, counted=COORDINATE_CATEGORIES)
+        exact = True
+
+    record = {'file': str(fname), 'format': fmt, 'compression': compression,
+              'size': os.path.getsize(fname)}
+    record.update(get_triage_record(tables, counts))
+    record['exact_counts'] = exact
+    record['elapsed'] = round(time.perf_counter() - t0, 4)
+    return record
+
+
+def read_bcif_tables(fh, counted=()) -> (dict, dict):
+    """
+    Tabulate the triage categories of a BinaryCIF stream as
+    {category: {attribute: [values]}}; rows of categories in counted
+    are taken from the rowCount of the category headers, so their
+    columns are never decoded
+    """
+    import msgpack
+    # Same decoding of columns as in the python-ihm BinaryCIF reader
+    from ihm.format_bcif import _decode
+
+    tables = defaultdict(lambda: defaultdict(list))
+    counts = defaultdict(int)
+    blocks = msgpack.unpack(fh, raw=False)['dataBlocks']
+    # Only the first data block is read, as in python-ihm
+    for category in blocks[0]['categories'] if blocks else []:
+        cat = category['name'].lower()
+        if cat in counted:
+            counts[cat] += category['rowCount']
+        elif cat in TRIAGE_CATEGORIES:
+            for column in category['columns']:
+                data = list(_decode(column['data']['data'],
+                                    column['data']['encoding']))
+                mask = _decode(column['mask']['data'],
+                               column['mask']['encoding']) \
+                    if column['mask'] is not None else [0] * len(data)
+                tables[cat][column['name'].lower()] = [
+                    None if m else str(d) for d, m in zip(data, mask)]
+    return tables, dict(counts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Print a JSON triage record per input file')
+    parser.add_argument('-f', nargs='+', required=True,
+                        help="Input mmCIF files (.cif, .cif.gz, .bcif or .bcif.gz)")
+    parser.add_argument('--indent', type=int, default=None,
+                        help="Indentation of JSON output")
+    args = parser.parse_args()
+
+    status = 0
+    for fname in args.f:
+        try:
+            record = triage(fname)
+        except (OSError, ValueError) as e:
+            logging.error(f'Triage of {fname} failed: {e}')
+            record = {'file': fname, 'error': str(e)}
+            status = 1
+        print(json.dumps(record, indent=args.indent))
+    sys.exit(status)
@@ -0,0 +1,136 @@
+import os
+import sys
+import unittest
+import tempfile
+import pickle
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import ihm.model
+import mmcif_io
+from array_model import ArrayModel, get_sphere_table, get_atom_table
+
+TEST_CIF = """
+data_PDBDEV_test
+_entry.id PDBDEV_test
+loop_
+_ihm_model_list.model_id
+_ihm_model_list.model_name
+_ihm_model_list.assembly_id
+_ihm_model_list.protocol_id
+_ihm_model_list.representation_id
+1 . 1 1 1
+#
+loop_
+_ihm_model_group.id
+_ihm_model_group.name
+_ihm_model_group.details
+1 "Cluster 1" .
+#
+loop_
+_ihm_model_group_link.group_id
+_ihm_model_group_link.model_id
+1 1
+#
+loop_
+_ihm_sphere_obj_site.id
+_ihm_sphere_obj_site.entity_id
+_ihm_sphere_obj_site.seq_id_begin
+_ihm_sphere_obj_site.seq_id_end
+_ihm_sphere_obj_site.asym_id
+_ihm_sphere_obj_site.Cartn_x
+_ihm_sphere_obj_site.Cartn_y
+_ihm_sphere_obj_site.Cartn_z
+_ihm_sphere_obj_site.object_radius
+_ihm_sphere_obj_site.rmsf
+_ihm_sphere_obj_site.model_id
+1 1 1 6 A 389.993 145.089 134.782 4.931 0 1
+2 1 7 7 B 406.895 142.176 135.653 3.318 1.34 1
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_seq_id
+_atom_site.label_asym_id
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.occupancy
+_atom_site.label_entity_id
+_atom_site.auth_asym_id
+_atom_site.B_iso_or_equiv
+_atom_site.pdbx_PDB_model_num
+_atom_site.ihm_model_id
+ATOM 1 N N . MET 1 A 1.000 2.000 3.000 . 1 A . 1 1
+ATOM 2 C CA . MET 1 A 4.000 5.000 6.000 1.0 1 A 12.5 1 1
+"""
+
+
+class Testing(unittest.TestCase):
+    def read(self, model_class, cif=TEST_CIF):
+        with tempfile.TemporaryDirectory() as tempdir:
+            tmpfilepath = os.path.join(tempdir, 'test.cif')
+            with open(tmpfilepath, 'w') as tmpfile:
+                tmpfile.write(cif)
+            system, encoding = mmcif_io.read_system(tmpfilepath,
+                                                    model_class=model_class)
+        return system.state_groups[0][0][0][0]
+
+    @staticmethod
+    def attrs(obj):
+        d = {k: getattr(obj, k) for k in obj.__slots__}
+        d['asym_unit'] = d['asym_unit']._id
+        return d
+
+    def test_same_objects_as_default_model(self):
+        m1 = self.read(ihm.model.Model)
+        m2 = self.read(ArrayModel)
+        self.assertIsInstance(m2, ArrayModel)
+        self.assertEqual(2, m2.get_number_of_spheres())
+        self.assertEqual(2, m2.get_number_of_atoms())
+        for s1, s2 in zip(m1.get_spheres(), m2.get_spheres()):
+            self.assertEqual(self.attrs(s1), self.attrs(s2))
+        for a1, a2 in zip(m1.get_atoms(), m2.get_atoms()):
+            self.assertEqual(self.attrs(a1), self.attrs(a2))
+
+    def test_tables(self):
+        for model_class in (ihm.model.Model, ArrayModel):
+            m = self.read(model_class)
+            spheres = get_sphere_table(m)
+            self.assertEqual([[389.993, 145.089, 134.782],
+                              [406.895, 142.176, 135.653]],
+                             spheres['xyz'].tolist())
+            self.assertEqual([4.931, 3.318], spheres['radius'].tolist())
+            self.assertEqual(['A', 'B'], spheres['asym_id'].tolist())
+            self.assertEqual([6, 7], spheres['seq_id_end'].tolist())
+
+            atoms = get_atom_table(m)
+            self.assertEqual(['N', 'CA'], atoms['atom_id'].tolist())
+            self.assertTrue(np.isnan(atoms['biso'][0]))
+            self.assertEqual(12.5, atoms['biso'][1])
+
+    def test_unknown_values_and_long_names(self):
+        # Unknown occupancy and B; atom names are not truncated
+        cif = TEST_CIF.replace('4.000 5.000 6.000 1.0 1 A 12.5',
+                               '4.000 5.000 6.000 ? 1 A ?')
+        cif = cif.replace('ATOM 1 N N .', 'ATOM 1 C CHAAAAAA .')
+        m = self.read(ArrayModel, cif)
+        atoms = get_atom_table(m)
+        self.assertEqual(['CHAAAAAA', 'CA'], atoms['atom_id'].tolist())
+        self.assertTrue(np.isnan(atoms['occupancy']).all())
+        self.assertTrue(np.isnan(atoms['biso']).all())
+        self.assertEqual('CHAAAAAA', next(m.get_atoms()).atom_id)
+
+    def test_pickle(self):
+        m = pickle.loads(pickle.dumps(self.read(ArrayModel)))
+        self.assertEqual(2, len(list(m.get_spheres())))
+        self.assertEqual(['A', 'B'], get_sphere_table(m)['asym_id'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
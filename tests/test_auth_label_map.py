@@ -0,0 +1,30 @@
+import os
+import sys
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import ihm.model
+import mmcif_io
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example', 'PDBDEV_00000004.cif')
+
+
+class Testing(unittest.TestCase):
+    def test_auth_label_map(self):
+        I = mmcif_io.GetInputInformation(EXAMPLE)
+        emap = I.get_auth_label_map()
+        self.assertEqual(152, len(emap))
+        self.assertEqual(('A', '1'), emap[('A', '1')])
+        self.assertEqual(('B', '76'), emap[('B', '76')])
+
+    def test_same_for_default_model(self):
+        I = mmcif_io.GetInputInformation(EXAMPLE)
+        system, encoding = mmcif_io.read_system(EXAMPLE,
+                                                model_class=ihm.model.Model)
+        self.assertEqual(I.get_auth_label_map(),
+                         I.get_auth_label_map(system=system))
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+import tempfile
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import mmcif_io
+from cif_index import CategoryIndex, COORDINATE_CATEGORIES, find_loop_end
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example', 'PDBDEV_00000004.cif')
+
+TEST_CIF = """# comment
+data_test
+_entry.id test
+_struct.title
+;loop_
+_atom_site.fake
+;
+_struct.entry_id test
+#
+loop_
+_atom_site.id
+_atom_site.x
+1 2.0
+2 3.0
+#
+loop_
+_software.name
+A
+"""
+
+
+class Testing(unittest.TestCase):
+    def test_sections(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            fname = os.path.join(tempdir, 'test.cif')
+            with open(fname, 'w') as f:
+                f.write(TEST_CIF)
+            index = CategoryIndex(fname)
+            self.assertEqual(TEST_CIF.encode(),
+                             b''.join(TEST_CIF.encode()[s:e]
+                                      for c, s, e in index.sections))
+            self.assertEqual({'data_', '_entry', '_struct', '_atom_site',
+                              '_software'}, set(index.get_categories()))
+            text = index.read(exclude=['_atom_site']).decode()
+            self.assertNotIn('_atom_site.id', text)
+            self.assertIn('_atom_site.fake', text)
+            self.assertIn('_software.name', text)
+            text = index.read(categories=['_software']).decode()
+            self.assertEqual('data_test\nloop_\n_software.name\nA\n', text)
+
+    def test_loop_end_before_same_shape_loop(self):
+        # The search must not run into a later loop with the same rows
+        rows = ''.join(f'{i} {i}.0\n' for i in range(1, 20))
+        text = f'loop_\n_a.id\n_a.x\n{rows}#\nloop_\n_b.id\n_b.x\n' \
+            + rows * 10
+        buf = text.encode()
+        start = buf.index(b'1 1.0')
+        end = find_loop_end(buf, start, len(buf), min_step=16)
+        self.assertEqual(buf.index(b'#\n'), end)
+
+    def test_skip_loop_bodies(self):
+        index = CategoryIndex(EXAMPLE)
+        skipped = CategoryIndex(EXAMPLE, skip=COORDINATE_CATEGORIES)
+        self.assertEqual(index.sections, skipped.sections)
+        self.assertEqual(['_atom_site'], list(skipped.loop_bodies))
+        start, end = skipped.loop_bodies['_atom_site']
+        with open(EXAMPLE, 'rb') as f:
+            body = f.read()[start:end]
+        self.assertTrue(body.startswith(b'ATOM '))
+        self.assertEqual(7383, body.count(b'\n'))
+
+    def test_metadata_only(self):
+        full = mmcif_io.GetInputInformation(EXAMPLE)
+        meta = mmcif_io.GetInputInformation(
+            EXAMPLE, exclude_categories=COORDINATE_CATEGORIES)
+        self.assertEqual(full.get_composition(), meta.get_composition())
+        self.assertEqual(full.get_dataset_comp(), meta.get_dataset_comp())
+        self.assertEqual(full.get_number_of_models(),
+                         meta.get_number_of_models())
+        self.assertEqual(0, next(meta.iter_models())[1].get_number_of_atoms())
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import connectivity
+from connectivity import GetSequenceConnectivity
+from test_exv_engine import get_ensemble_cif
+
+
+class Testing(unittest.TestCase):
+    def test_consecutive_pairs(self):
+        # Beads out of order; residue 5 of chain A is missing
+        table = {'asym_id': np.array(['B', 'A', 'A', 'A', 'B'], dtype=object),
+                 'seq_id_begin': np.array([1, 6, 1, 3, 2]),
+                 'seq_id_end': np.array([1, 8, 2, 4, 2])}
+        self.assertEqual([[2, 3], [0, 4]],
+                         connectivity.get_consecutive_pairs(table).tolist())
+
+    def test_block_results(self):
+        table = {'radius': np.array([1., 2., 1., 1.]),
+                 'asym_id': np.array(['A', 'A', 'A', 'B'], dtype=object),
+                 'seq_id_begin': np.array([1, 2, 3, 1]),
+                 'seq_id_end': np.array([1, 2, 3, 1])}
+        xyz = np.zeros((2, 4, 3))
+        xyz[:, 1, 0] = 3.
+        xyz[:, 2, 0] = [6., 10.]
+        summary, outliers = connectivity.get_empty_tables()
+        connectivity.add_block_results(summary, outliers, [7, 8], xyz, table)
+        self.assertEqual([7, 8], summary['Model'])
+        self.assertEqual(['A', 'A'], summary['Chain'])
+        self.assertEqual([2, 2], summary['Consecutive bead pairs'])
+        self.assertEqual([0, 1], summary['Outliers'])
+        self.assertEqual([0., 4.], summary['Maximum gap (A)'])
+        self.assertEqual([8], outliers['Model'])
+        self.assertEqual([2], outliers['Residue begin 1'])
+        self.assertEqual([3], outliers['Residue begin 2'])
+        self.assertEqual([4.], outliers['Gap (A)'])
+
+    def test_run_connectivity(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'test.cif')
+            with open(fname, 'w') as f:
+                f.write(get_ensemble_cif(4))
+            summary, outliers = GetSequenceConnectivity(fname).run_connectivity()
+            # Models are evaluated in blocks of any size
+            size = connectivity.MAX_BLOCK_SIZE
+            connectivity.MAX_BLOCK_SIZE = 9
+            try:
+                self.assertEqual((summary, outliers),
+                                 GetSequenceConnectivity(fname).run_connectivity())
+            finally:
+                connectivity.MAX_BLOCK_SIZE = size
+        self.assertEqual([1, 2, 3, 4], summary['Model'])
+        self.assertEqual([2] * 4, summary['Outliers'])
+        self.assertEqual([16., 15., 16., 11.], outliers['Gap (A)'][:4])
+        largest = GetSequenceConnectivity.get_largest_outliers(outliers, top=3)
+        self.assertEqual([1, 2, 3], largest['Model'])
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,320 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from multiprocessing import shared_memory
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import exv_engine
+from excludedvolume import GetExcludedVolume
+
+
+def get_ensemble_cif(models: int) -> str:
+    """mmCIF text of models of two spheres at different distances"""
+    lines = ['data_PDBDEV_test', '_entry.id PDBDEV_test', 'loop_',
+             '_ihm_model_list.model_id', '_ihm_model_list.model_name',
+             '_ihm_model_list.assembly_id', '_ihm_model_list.protocol_id',
+             '_ihm_model_list.representation_id']
+    lines += [f'{m} . 1 1 1' for m in range(1, models + 1)]
+    lines += ['#', 'loop_', '_ihm_model_group.id', '_ihm_model_group.name',
+              '_ihm_model_group.details', '1 . .', '#', 'loop_',
+              '_ihm_model_group_link.group_id', '_ihm_model_group_link.model_id']
+    lines += [f'1 {m}' for m in range(1, models + 1)]
+    lines += ['#', 'loop_'] + [f'_ihm_sphere_obj_site.{c}' for c in (
+        'id', 'entity_id', 'seq_id_begin', 'seq_id_end', 'asym_id', 'Cartn_x',
+        'Cartn_y', 'Cartn_z', 'object_radius', 'rmsf', 'model_id')]
+    for m in range(1, models + 1):
+        # Spheres 1 and 3 overlap in every other model
+        x = 1. if m % 2 else 5.
+        lines += [f'{3 * m - 2} 1 1 1 A 0 0 0 2.0 0 {m}',
+                  f'{3 * m - 1} 1 2 2 A 20 0 0 2.0 0 {m}',
+                  f'{3 * m} 1 3 3 A {x} 0 0 2.0 0 {m}']
+    return '\n'.join(lines) + '\n'
+
+
+def get_overlapping_pairs_brute_force(xyz, radii):
+    d = np.linalg.norm(xyz[:, None] - xyz[None, :], axis=2)
+    i, j = np.triu_indices(len(xyz), 1)
+    mask = d[i, j] < radii[i] + radii[j]
+    return set(zip(i[mask], j[mask]))
+
+
+class Testing(unittest.TestCase):
+    def test_overlapping_pairs(self):
+        rng = np.random.default_rng(1)
+        xyz = rng.uniform(0, 40, (300, 3))
+        radii = rng.uniform(1, 6, 300)
+        pairs = exv_engine.get_overlapping_pairs(xyz, radii)
+        self.assertEqual(get_overlapping_pairs_brute_force(xyz, radii),
+                         set(map(tuple, pairs)))
+        self.assertTrue((pairs[:, 0] < pairs[:, 1]).all())
+        viols = exv_engine.get_violations_per_sphere(xyz, radii)
+        self.assertEqual(len(pairs), viols.sum())
+
+    def test_radius_classes(self):
+        rng = np.random.default_rng(2)
+        radii = rng.uniform(1, 3, 500)
+        radii[::50] = rng.uniform(10, 20, 10)
+        xyz = rng.uniform(0, 60, (500, 3))
+        classes = exv_engine.get_radius_classes(radii)
+        self.assertEqual(list(range(500)), sorted(np.concatenate(classes)))
+        for c in classes:
+            self.assertLess(radii[c].max() / radii[c].min(), 2.)
+        single = exv_engine.get_overlapping_pairs(xyz, radii, ratio=None)
+        pairs = exv_engine.get_overlapping_pairs(xyz, radii)
+        self.assertEqual(set(map(tuple, single)), set(map(tuple, pairs)))
+        self.assertEqual(len(single), len(pairs))
+
+    def test_parallel(self):
+        rng = np.random.default_rng(3)
+        models = [(rng.uniform(0, 50, (n, 3)), rng.uniform(1, 4, n))
+                  for n in (100, 300, 200, 500, 50, 700, 10)]
+        serial = [exv_engine.count_violations(*m) for m in models]
+        # Small chunks to reuse and grow the shared memory block
+        parallel = exv_engine.iter_violations_parallel(iter(models), workers=2,
+                                                       chunk_size=2)
+        self.assertEqual(serial, list(parallel))
+
+    def test_verlet_list(self):
+        rng = np.random.default_rng(4)
+        xyz = rng.uniform(0, 40, (400, 3))
+        radii = rng.uniform(1, 4, 400)
+        verlet = exv_engine.VerletList(skin=2.)
+        models = []
+        for k in range(20):
+            models.append((xyz, radii))
+            self.assertEqual(exv_engine.count_violations(xyz, radii),
+                             verlet.count_violations(xyz, radii))
+            xyz = xyz + rng.normal(0, 0.2, xyz.shape)
+        self.assertLess(1, verlet.builds)
+        self.assertGreater(20, verlet.builds)
+        # Different radii force a rebuild
+        builds = verlet.builds
+        verlet.count_violations(xyz, radii * 1.1)
+        self.assertEqual(builds + 1, verlet.builds)
+        serial = [exv_engine.count_violations(*m) for m in models]
+        parallel = exv_engine.iter_violations_parallel(iter(models), workers=2,
+                                                       skin=2.)
+        self.assertEqual(serial, list(parallel))
+
+    def test_worker_verlet_list(self):
+        """the Verlet list of a worker is kept between its tasks"""
+        rng = np.random.default_rng(5)
+        xyz = rng.uniform(0, 40, (400, 3))
+        radii = rng.uniform(1, 4, 400)
+        models = [(xyz + rng.normal(0, 0.05, xyz.shape), radii)
+                  for k in range(6)]
+        # The last model is far from the others
+        models.append((xyz + 5., radii))
+        block = shared_memory.SharedMemory(create=True,
+                                           size=len(models) * 400 * 4 * 8)
+        try:
+            shape = (len(models), 400, 4)
+            array = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+            for k, (x, r) in enumerate(models):
+                array[k, :, :3], array[k, :, 3] = x, r
+            del array
+            exv_engine._init_worker(skin=2.)
+            violations = []
+            # Built for the first model and rebuilt only for the last one
+            for ks, builds in (([0, 1, 2], 1), ([3, 4, 5], 1), ([6], 2)):
+                violations += exv_engine._count_violations_shared(
+                    (block.name, shape, ks, [400] * len(ks), False, False))
+                self.assertEqual(builds, exv_engine._counter.builds)
+            self.assertEqual([exv_engine.count_violations(*m) for m in models],
+                             violations)
+        finally:
+            while exv_engine._attached:
+                _, (attached, array) = exv_engine._attached.popitem()
+                del array
+                attached.close()
+            block.close()
+            block.unlink()
+
+    def test_rigid_bodies(self):
+        rng = np.random.default_rng(5)
+        xyz = rng.uniform(0, 40, (600, 3))
+        radii = rng.uniform(1, 4, 600)
+        bodies = rng.integers(-1, 6, 600)
+        flexible, rigid = exv_engine.get_body_index(bodies)
+        self.assertEqual(np.sum(bodies == -1), len(flexible))
+        self.assertEqual(6, len(rigid))
+        self.assertEqual([], exv_engine.get_body_index(np.full(5, -1))[1])
+        full = exv_engine.count_violations(xyz, radii)
+        intra = exv_engine.count_intra_body_violations(xyz, radii, bodies)
+        inter = exv_engine.count_inter_body_violations(xyz, radii, bodies)
+        self.assertEqual(full, intra + inter)
+        # Rigid moves of a body do not change violations within it
+        models = []
+        for k in range(4):
+            models.append((xyz, radii, bodies))
+            rot, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+            xyz = xyz.copy()
+            xyz[bodies == 0] = xyz[bodies == 0] @ rot + rng.normal(0, 5, 3)
+            xyz[bodies == -1] += rng.normal(0, 1, (np.sum(bodies == -1), 3))
+        for workers in (1, 2):
+            results = list(exv_engine.iter_rigid_body_violations(
+                iter(models), workers=workers))
+            self.assertEqual(1, len(set(r[0] for r in results)))
+            self.assertEqual([exv_engine.count_violations(*m[:2]) for m in models],
+                             [sum(r) for r in results])
+
+    def test_chain_pairs(self):
+        rng = np.random.default_rng(6)
+        models = []
+        for k in range(5):
+            xyz = rng.uniform(0, 30, (300, 3))
+            radii = rng.uniform(1, 4, 300)
+            chains = rng.integers(0, 4, 300)
+            models.append((xyz, radii, None, chains))
+        for workers in (1, 2):
+            results = exv_engine.iter_violations_parallel(
+                iter(models), workers=workers, details=True)
+            for (xyz, radii, _, chains), result in zip(models, results):
+                pairs = get_overlapping_pairs_brute_force(xyz, radii)
+                expected = np.zeros((4, 4), dtype=int)
+                for i, j in pairs:
+                    a, b = sorted((chains[i], chains[j]))
+                    expected[a, b] += 1
+                self.assertEqual(len(pairs), result['violations'])
+                np.testing.assert_array_equal(
+                    expected, result['chain_pairs'].toarray())
+        table = {'Models': [1, 1, 2], 'Chain 1': ['A', 'A', 'A'],
+                 'Chain 2': ['A', 'B', 'B'], 'Number of violations': [1, 4, 2]}
+        summary = GetExcludedVolume.get_chain_violation_summary(table, 2)
+        self.assertEqual(['A', 'A'], summary['Chain 1'])
+        self.assertEqual(['B', 'A'], summary['Chain 2'])
+        self.assertEqual([2, 1], summary['Models with violations'])
+        self.assertEqual([3.0, 0.5], summary['Mean number of violations'])
+        self.assertEqual([4, 1], summary['Maximum number of violations'])
+
+    def test_atoms(self):
+        # Bead (residues 1-10), atoms of residues 11, 12 and 13 of chain 0,
+        # atom of residue 11 of chain 1, atoms of residues 30 and 40
+        xyz = np.array([[0., 0., 0.], [5., 0., 0.], [7., 0., 0.],
+                        [8.5, 0., 0.], [5., 2.5, 0.], [30., 0., 0.],
+                        [32.5, 0., 0.]])
+        radii = np.array([4.] + [1.7] * 6)
+        chains = np.array([0, 0, 0, 0, 1, 0, 0])
+        atoms = np.array([[0, 1, 10], [1, 11, 11], [1, 12, 12],
+                          [1, 13, 13], [1, 11, 11], [1, 30, 30],
+                          [1, 40, 40]])
+        model = (xyz, radii, None, chains, atoms)
+        pairs = exv_engine.get_model_pairs(model)
+        # Bead and atom of the next residue and atoms of adjacent residues
+        # are bonded; atoms 2.5 A apart overlap by 0.9 A, atoms 3.2 A
+        # apart by only 0.2 A
+        self.assertEqual([[0, 4], [1, 4], [5, 6]], sorted(pairs.tolist()))
+        result = exv_engine.count_model_violations(model, details=True)
+        self.assertEqual({'atom-atom': 2, 'atom-bead': 1, 'bead-bead': 0},
+                         result['pair_kinds'])
+        for workers in (1, 2):
+            results = list(exv_engine.iter_violations_parallel(
+                iter([model, model[:4] + (None,)]), workers=workers,
+                details=True))
+            self.assertEqual(result['pair_kinds'], results[0]['pair_kinds'])
+            self.assertNotIn('pair_kinds', results[1])
+        # Three of the 21 pairs are bonded and never tested
+        self.assertEqual(3, exv_engine.get_bonded_pair_count(chains, atoms))
+        self.assertEqual(0, exv_engine.get_bonded_pair_count(chains, None))
+        self.assertAlmostEqual(100 * 15 / 18, exv_engine.get_satisfaction(7, 3, 3))
+        np.testing.assert_allclose([1.7, 1.55, 1.2, 1.7],
+                                   exv_engine.get_vdw_radii(['C', 'N', 'h', '']))
+
+    def test_clashes(self):
+        xyz = np.array([[0., 0., 0.], [3., 0., 0.], [4., 0., 0.], [10., 0., 0.]])
+        radii = np.array([2., 2., 2., 1.])
+        chains = np.array([0, 0, 1, 1])
+        for workers in (1, 2):
+            result, = exv_engine.iter_violations_parallel(
+                iter([(xyz, radii, None, chains)]), workers=workers,
+                clashes=True)
+            self.assertEqual(2, result['violations'])
+            order = np.argsort(result['pairs'][:, 0])
+            np.testing.assert_array_equal([[0, 1], [1, 2]],
+                                          result['pairs'][order])
+            np.testing.assert_allclose([1., 3.], result['overlap'][order])
+        table = {'asym_id': np.array(['A', 'A', 'B,C', 'B,C'], dtype=object),
+                 'seq_id_begin': np.array([1, 2, 1, 5]),
+                 'seq_id_end': np.array([1, 4, 1, 5])}
+        fh = io.StringIO()
+        GetExcludedVolume.write_clashes(fh, 1, table, result['pairs'],
+                                        result['overlap'])
+        self.assertEqual('1,A,1,1,A,2,4,1.0\n1,A,2,4,"B,C",1,1,3.0\n',
+                         fh.getvalue())
+
+    def test_sample_order(self):
+        order = exv_engine.get_sample_order(23, 'random', seed=1)
+        self.assertEqual(list(range(23)), sorted(order))
+        np.testing.assert_array_equal(
+            order, exv_engine.get_sample_order(23, 'random', seed=1))
+        order = exv_engine.get_sample_order(23, 'stratified', strata=5)
+        self.assertEqual(list(range(23)), sorted(order))
+        # Each round takes one model from each stratum
+        strata = [0, 5, 10, 15, 19, 23]
+        for k in range(0, 20, 5):
+            self.assertEqual([1] * 5, list(np.histogram(order[k:k + 5],
+                                                        strata)[0]))
+        self.assertRaises(ValueError, exv_engine.get_sample_order, 5, 'x')
+
+    def test_confidence_interval(self):
+        values = [99., 98., 97., 96.]
+        low, high = exv_engine.get_confidence_interval(values)
+        self.assertAlmostEqual(97.5, (low + high) / 2)
+        self.assertAlmostEqual(2.054, (high - low) / 2, places=3)
+        # Finite population correction
+        low2, high2 = exv_engine.get_confidence_interval(values, 10)
+        self.assertLess(high2 - low2, high - low)
+        self.assertEqual((97.5, 97.5),
+                         exv_engine.get_confidence_interval(values, 4))
+
+    def test_sampled(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'test.cif')
+            with open(fname, 'w') as f:
+                f.write(get_ensemble_cif(40))
+            I = GetExcludedVolume(fname, cache=tmpdir, workers=1)
+            exv = I.run_exc_vol_sampled(max_models=15, seed=2)
+            self.assertEqual(15, len(exv['Models']))
+            self.assertEqual(sorted(exv['Models']), exv['Models'])
+            for m, v in zip(exv['Models'], exv['Number of violations']):
+                self.assertEqual(m % 2, v)
+            self.assertEqual(15, I.sampling['Evaluated models'])
+            self.assertEqual(40, I.sampling['Total models'])
+            self.assertFalse(I.sampling['Stopped early'])
+            # Wide tolerance; stops after the first batch
+            I = GetExcludedVolume(fname, cache=tmpdir, workers=1)
+            exv = I.run_exc_vol_sampled(tolerance=100., strategy='stratified',
+                                        batch=5)
+            self.assertEqual(5, len(exv['Models']))
+            self.assertTrue(I.sampling['Stopped early'])
+            # Cached
+            I = GetExcludedVolume(fname, cache=tmpdir, workers=1)
+            exv = I.run_exc_vol_sampled(tolerance=100., strategy='stratified',
+                                        batch=5)
+            self.assertEqual(5, len(exv['Models']))
+            self.assertEqual(5, I.sampling['Evaluated models'])
+
+    def test_small(self):
+        self.assertEqual(0, exv_engine.count_violations(np.zeros((1, 3)), [1.]))
+        xyz = np.array([[0., 0., 0.], [3., 0., 0.], [10., 0., 0.]])
+        self.assertEqual(1, exv_engine.count_violations(xyz, [2., 2., 2.]))
+        # Touching spheres do not overlap
+        self.assertEqual(0, exv_engine.count_violations(xyz, [1.5, 1.5, 1.5]))
+        self.assertAlmostEqual(100 * 2 / 3, exv_engine.get_satisfaction(3, 1))
+
+    def test_violation_dict(self):
+        xyz = np.array([[0., 0., 0.], [3., 0., 0.], [4., 0., 0.]])
+        table = {'xyz': xyz, 'radius': np.array([2., 2., 2.])}
+        df = GetExcludedVolume.get_xyzr(table)
+        viols = GetExcludedVolume.get_violation_dict(df)
+        self.assertEqual({1: 1.0, 2: 1.0}, viols)
+        self.assertEqual((33.33, 2.0),
+                         GetExcludedVolume.get_exc_vol_given_sphere_parallel(table))
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,79 @@
+import os
+import sys
+import gzip
+import shutil
+import unittest
+import tempfile
+import ihm.reader
+import ihm.dumper
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+from mmcif_io import GetInputInformation, read_system
+from array_model import get_number_of_atoms, get_number_of_spheres
+
+EXAMPLES = [os.path.join(os.path.dirname(__file__), '..', 'example', f)
+            for f in ('PDBDEV_00000001.cif', 'PDBDEV_00000004.cif')]
+
+
+def convert(fname, dirname) -> dict:
+    """copies of an mmCIF file as .cif.gz, .bcif and .bcif.gz
+    in dirname; returns {suffix: file name}"""
+    stem = os.path.join(dirname, os.path.basename(fname)[:-len('.cif')])
+    with open(fname) as fh:
+        system, = ihm.reader.read(fh)
+    with open(stem + '.bcif', 'wb') as fh:
+        ihm.dumper.write(fh, [system], format='BCIF')
+    for suffix, src in (('.cif.gz', fname), ('.bcif.gz', stem + '.bcif')):
+        with open(src, 'rb') as fin, gzip.open(stem + suffix, 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+    return {suffix: stem + suffix for suffix in ('.cif.gz', '.bcif', '.bcif.gz')}
+
+
+def get_counts(system) -> list:
+    """(atoms, spheres) of each model"""
+    return [(get_number_of_atoms(m), get_number_of_spheres(m))
+            for group, m in system._all_models()]
+
+
+class Testing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.files = {fname: convert(fname, cls.tmpdir.name)
+                     for fname in EXAMPLES}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_read_system(self):
+        for fname, files in self.files.items():
+            system, encoding = read_system(fname)
+            for suffix, f in files.items():
+                other, _ = read_system(f)
+                self.assertEqual(system.id, other.id, f)
+                self.assertEqual(get_counts(system), get_counts(other), f)
+
+    def test_mmcif_get_lists(self):
+        # PDBDEV_00000001 has no _atom_site loop
+        fname = EXAMPLES[1]
+        files = self.files[fname]
+        before, tags, atoms, after = GetInputInformation(fname).mmcif_get_lists()
+        # Compressed files are read as the same text
+        self.assertEqual((before, tags, atoms, after),
+                         GetInputInformation(files['.cif.gz']).mmcif_get_lists())
+        for suffix in ('.bcif', '.bcif.gz'):
+            # BinaryCIF files are dumped as text from the parsed system
+            _, bcif_tags, bcif_atoms, _ = \
+                GetInputInformation(files[suffix]).mmcif_get_lists()
+            self.assertEqual(7383, len(atoms))
+            self.assertEqual(len(atoms), len(bcif_atoms))
+            # The dumper writes its own set of columns
+            for tag in ('_atom_site.Cartn_x', '_atom_site.label_seq_id',
+                        '_atom_site.occupancy', '_atom_site.B_iso_or_equiv'):
+                self.assertIn(tag, bcif_tags.values())
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
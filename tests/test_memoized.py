@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import ihm
+import ihm.dataset
+import ihm.location
+import mmcif_io
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example', 'PDBDEV_00000001.cif')
+
+
+class Testing(unittest.TestCase):
+    def test_computed_once(self):
+        I = mmcif_io.GetInputInformation(EXAMPLE)
+        calls = []
+        orig = mmcif_io.GetInputInformation.get_dataset_comp.__wrapped__
+
+        def counted(self):
+            calls.append(1)
+            return orig(self)
+
+        I.get_dataset_comp = mmcif_io.memoized(counted).__get__(I)
+        d1 = I.get_dataset_comp()
+        d2 = I.get_dataset_comp()
+        self.assertEqual(d1, d2)
+        self.assertEqual(1, len(calls))
+
+    def test_result_is_a_copy(self):
+        I = mmcif_io.GetInputInformation(EXAMPLE)
+        comp = I.get_composition()
+        comp['Chain ID'].append('XXX')
+        self.assertNotIn('XXX', I.get_composition()['Chain ID'])
+
+    def test_invalidation(self):
+        I = mmcif_io.GetInputInformation(EXAMPLE)
+        n = len(I.get_dataset_comp()['ID'])
+        loc = ihm.location.PDBLocation('1ABC')
+        d = ihm.dataset.PDBDataset(loc)
+        d._id = 'new'
+        I.system.orphan_datasets.append(d)
+        self.assertEqual(n + 1, len(I.get_dataset_comp()['ID']))
+
+        I.system = mmcif_io.read_system(EXAMPLE)[0]
+        self.assertEqual(n, len(I.get_dataset_comp()['ID']))
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
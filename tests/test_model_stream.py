@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+import tempfile
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import mmcif_io
+
+TEST_CIF = """
+data_PDBDEV_test
+_entry.id PDBDEV_test
+loop_
+_ihm_model_list.model_id
+_ihm_model_list.model_name
+_ihm_model_list.assembly_id
+_ihm_model_list.protocol_id
+_ihm_model_list.representation_id
+1 . 1 1 1
+2 . 1 1 1
+3 . 1 1 1
+#
+loop_
+_ihm_model_group.id
+_ihm_model_group.name
+_ihm_model_group.details
+1 "Cluster 1" .
+2 "Cluster 2" .
+#
+loop_
+_ihm_model_group_link.group_id
+_ihm_model_group_link.model_id
+1 1
+1 2
+2 3
+#
+loop_
+_ihm_sphere_obj_site.id
+_ihm_sphere_obj_site.entity_id
+_ihm_sphere_obj_site.seq_id_begin
+_ihm_sphere_obj_site.seq_id_end
+_ihm_sphere_obj_site.asym_id
+_ihm_sphere_obj_site.Cartn_x
+_ihm_sphere_obj_site.Cartn_y
+_ihm_sphere_obj_site.Cartn_z
+_ihm_sphere_obj_site.object_radius
+_ihm_sphere_obj_site.rmsf
+_ihm_sphere_obj_site.model_id
+1 1 1 6 A 389.993 145.089 134.782 4.931 0 1
+2 1 7 7 B 406.895 142.176 135.653 3.318 1.34 1
+3 1 1 6 A 389.993 145.089 134.782 4.931 0 2
+4 1 1 6 A 389.993 145.089 134.782 4.931 0 3
+"""
+
+
+class Testing(unittest.TestCase):
+    def get_input(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            tmpfilepath = os.path.join(tempdir, 'test.cif')
+            with open(tmpfilepath, 'w') as tmpfile:
+                tmpfile.write(TEST_CIF)
+            return mmcif_io.GetInputInformation(tmpfilepath)
+
+    def test_iter_models(self):
+        I = self.get_input()
+        models = list(I.iter_models())
+        self.assertEqual(3, len(models))
+        self.assertEqual([1, 2, 3], [x['model_number'] for x, m in models])
+        self.assertEqual([1, 1, 2], [x['model_group'] for x, m in models])
+        self.assertEqual([2, 1, 1],
+                         [m.get_number_of_spheres() for x, m in models])
+
+    def test_iter_models_is_lazy(self):
+        I = self.get_input()
+        it = I.iter_models()
+        ids, m = next(it)
+        self.assertEqual(1, ids['model_number'])
+
+    def test_max_num_models(self):
+        I = self.get_input()
+        models = list(I.iter_models(max_num_models=2))
+        self.assertEqual([1, 2], [x['model_number'] for x, m in models])
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
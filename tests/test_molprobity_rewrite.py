@@ -0,0 +1,117 @@
+import os
+import sys
+import unittest
+from io import StringIO
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import ihm.reader
+from array_model import get_atom_table
+from molprobity import write_molprobity_cif
+from cif_tokenizer import iter_cif_events, split_line, ROWS
+
+TEST_CIF = """data_PDBDEV_test
+_entry.id PDBDEV_test
+_struct.title 'Café complex'
+#
+loop_
+_flr_fret_analysis.id
+_flr_fret_analysis.details
+1 'to be removed'
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_seq_id
+_atom_site.label_asym_id
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.label_entity_id
+_atom_site.auth_asym_id
+_atom_site.B_iso_or_equiv
+_atom_site.pdbx_PDB_model_num
+_atom_site.ihm_model_id
+ATOM 1 N N . MET 1 A 1.000 2.000 3.000 1 A . 1 1
+ATOM 2 C CA . MET 1 A 4.000 5.000 6.000 1 A 12.5 1 1
+#
+loop_
+_ihm_sphere_obj_site.id
+_ihm_sphere_obj_site.entity_id
+_ihm_sphere_obj_site.seq_id_begin
+_ihm_sphere_obj_site.seq_id_end
+_ihm_sphere_obj_site.asym_id
+_ihm_sphere_obj_site.Cartn_x
+_ihm_sphere_obj_site.Cartn_y
+_ihm_sphere_obj_site.Cartn_z
+_ihm_sphere_obj_site.object_radius
+_ihm_sphere_obj_site.rmsf
+_ihm_sphere_obj_site.model_id
+1 1 2 10 A 7.000 8.000 9.000 5.000 . 1
+#
+"""
+
+
+class Testing(unittest.TestCase):
+    def rewrite(self, **kwargs):
+        fout = StringIO()
+        write_molprobity_cif(StringIO(TEST_CIF), fout, **kwargs)
+        return fout.getvalue()
+
+    def test_tokenizer_roundtrip(self):
+        lines = []
+        for event, payload, lines_ in iter_cif_events(StringIO(TEST_CIF)):
+            lines.extend(lines_)
+        self.assertEqual(TEST_CIF, ''.join(lines))
+        self.assertEqual(['ATOM', "'O5''", '"a b"', 'x#y'],
+                         split_line("ATOM 'O5'' \"a b\" x#y # comment"))
+
+    def test_no_fixes(self):
+        out = self.rewrite()
+        self.assertNotIn('_flr', out)
+        self.assertNotIn('to be removed', out)
+        self.assertIn("'Caf complex'", out)
+        self.assertTrue(out.isascii())
+        self.assertIn('ATOM 1 N N . MET 1 A 1.000 2.000 3.000 1 A . 1 1', out)
+
+    def test_atoms_only(self):
+        # Coarse-grained parts of multi-resolution models are dropped
+        out = self.rewrite(atoms_only=True)
+        self.assertNotIn('_ihm_sphere_obj_site', out)
+        self.assertNotIn('7.000 8.000 9.000', out)
+        # and kept otherwise
+        out = self.rewrite()
+        self.assertIn('_ihm_sphere_obj_site', out)
+        self.assertIn('7.000 8.000 9.000', out)
+
+    def test_fill_missing_values(self):
+        out = self.rewrite(fix_occupancy=True, fix_biso=True)
+        system, = ihm.reader.read(StringIO(out))
+        model = system.state_groups[0][0][0][0]
+        atoms = get_atom_table(model)
+        self.assertEqual([0.0, 12.5], atoms['biso'].tolist())
+        self.assertEqual([1.0, 1.0], atoms['occupancy'].tolist())
+        # Other missing values are kept
+        self.assertIn('ATOM 1 N N . MET', out)
+
+    def test_occupancy_default(self):
+        # Missing occupancies are full, both in an existing column and
+        # in a column added to _atom_site
+        cif = TEST_CIF.replace('_atom_site.B_iso_or_equiv\n',
+                               '_atom_site.B_iso_or_equiv\n_atom_site.occupancy\n')
+        cif = cif.replace('12.5 1 1\n', '12.5 0.50 1 1\n').replace(
+            'A . 1 1\n', 'A . . 1 1\n')
+        for text, occupancy in ((TEST_CIF, [1.0, 1.0]), (cif, [1.0, 0.5])):
+            fout = StringIO()
+            write_molprobity_cif(StringIO(text), fout, fix_occupancy=True)
+            system, = ihm.reader.read(StringIO(fout.getvalue()))
+            atoms = get_atom_table(system.state_groups[0][0][0][0])
+            self.assertEqual(occupancy, atoms['occupancy'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
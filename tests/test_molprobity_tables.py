@@ -0,0 +1,102 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import molprobity_tables
+
+CHAINS_MAP = {('A', '10'): ('A', '1'), ('A', '11'): ('A', '2'),
+              ('AB', '1000'): ('B', '7'), ('A', '72'): ('A', '3'),
+              ('B', '76'): ('C', '4'), ('A', '1000'): ('A', '5'),
+              ('ABC', '76'): ('D', '6')}
+
+
+class Testing(unittest.TestCase):
+    def test_rama(self):
+        # Long chain ids and residue numbers may be merged
+        models = {1: ['A  10  LYS:98.43:-60.1:-40.2:Favored:General',
+                      'A  11  PRO:0.01:-60.1:-40.2:OUTLIER:Trans-proline',
+                      'AB1000 AALA:1.20:60.0:40.0:Allowed:General',
+                      'AB1000  GLY:0.02:60.0:40.0:OUTLIER:Glycine'],
+                  2: []}
+        table = molprobity_tables.parse_rama(models)
+        self.assertEqual(['A', 'A', 'AB', 'AB'], table['chain'].tolist())
+        self.assertEqual(['10', '11', '1000', '1000'], table['resseq'].tolist())
+        self.assertEqual(['', '', 'A', ''], table['altloc'].tolist())
+        self.assertEqual([-60.1, -60.1, 60., 60.], table['phi'].tolist())
+        self.assertEqual({'Model ID': [1, 2], 'Analyzed': [4, 0],
+                          'Favored': [1, 0], 'Allowed': [1, 0],
+                          'Outliers': [2, 0]},
+                         molprobity_tables.get_evaluation_summary(table))
+        self.assertEqual({'Model ID': [1, 1], 'Chain': ['A', 'B'],
+                          'Residue ID': ['2', '7'],
+                          'Residue type': ['PRO', 'GLY']},
+                         molprobity_tables.get_outlier_details(table, CHAINS_MAP))
+
+    def test_rama_outliers(self):
+        """Ramachandran outliers are listed. Before the tables were
+        parsed into columns, lines were matched against 'OUTLINE',
+        so no Ramachandran outliers were ever listed"""
+        models = {1: ['A  10  LYS:98.43:-60.1:-40.2:Favored:General',
+                      'A  11  PRO:0.01:-60.1:-40.2:OUTLIER:Trans-proline'],
+                  2: ['A  10  LYS:0.02:60.0:40.0:OUTLIER:General',
+                      'A  11  PRO:0.01:x:-40.2:OUTLIER:Trans-proline']}
+        table = molprobity_tables.parse_rama(models)
+        self.assertTrue(np.isnan(table['phi'][3]))
+        self.assertEqual({'Model ID': [1, 2, 2], 'Chain': ['A', 'A', 'A'],
+                          'Residue ID': ['2', '1', '2'],
+                          'Residue type': ['PRO', 'LYS', 'PRO']},
+                         molprobity_tables.get_outlier_details(table, CHAINS_MAP))
+
+    def test_rota(self):
+        models = {1: ['A  10  LYS:1.00:0.3:62.1:180.0:170.0:80.0:OUTLIER:OUTLIER'],
+                  2: ['A  10  LYS:1.00:85.0:62.1:180.0:170.0:80.0:Favored:mttt',
+                      # residues missing from the map are skipped
+                      'Z  10  LYS:1.00:0.3:62.1:180.0:170.0:80.0:OUTLIER:OUTLIER']}
+        table = molprobity_tables.parse_rota(models)
+        self.assertEqual(['OUTLIER', 'mttt', 'OUTLIER'], table['rotamer'].tolist())
+        self.assertEqual([1, 1], molprobity_tables.get_evaluation_summary(table)['Outliers'])
+        self.assertEqual({'Model ID': [1], 'Chain': ['A'], 'Residue ID': ['1'],
+                          'Residue type': ['LYS']},
+                         molprobity_tables.get_outlier_details(table, CHAINS_MAP))
+
+    def test_clash(self):
+        line = ['Bad Clashes >= 0.4 Angstrom MODEL 1:',
+                'A  72  ARG  HD2  B  76  GLU  OE2 :0.438',
+                'Bad Clashes >= 0.4 Angstrom MODEL 10:',
+                'A  72  ARG  HD2  B  76  GLU  OE2 :0.5',
+                'A  72  ARG  HD3  Z  76  GLU  OE1 :0.621',
+                'unknown',
+                # not in columns; chain and residue number are merged
+                'A1000  ARG  HD2 ABC  76  GLU  OE2 :0.7',
+                'MODEL 1 clashscore = 2.31',
+                'MODEL 10 clashscore = 10.50']
+        table, clashscores = molprobity_tables.parse_clash(line, nos=2)
+        self.assertEqual({1: '2.31', 10: '10.50'}, clashscores)
+        summary, total = molprobity_tables.get_clash_summary(table, clashscores, nos=2)
+        self.assertEqual({'Model ID': ['1', '10'], 'Clash score': ['2.31', '10.50'],
+                          'Number of clashes': [1, 4]}, summary)
+        self.assertEqual(5, total)
+        self.assertEqual({'Model ID': ['1', '10', '10'],
+                          'Atom-1': ['A:3:ARG:HD2'] * 2 + ['A:5:ARG:HD2'],
+                          'Atom-2': ['C:4:GLU:OE2'] * 2 + ['D:6:GLU:OE2'],
+                          'Clash overlap (&#8491)': ['0.438', '0.500', '0.700']},
+                         molprobity_tables.get_clash_details(table, CHAINS_MAP))
+
+    def test_clash_single(self):
+        table, clashscores = molprobity_tables.parse_clash(
+            ['Bad Clashes >= 0.4 Angstrom:', 'clashscore = 0.00'])
+        self.assertEqual(({'Model ID': ['1'], 'Clash score': ['0.00'],
+                           'Number of clashes': [0]}, 0),
+                         molprobity_tables.get_clash_summary(table, clashscores))
+        # Models have no clashes without clashscore records
+        table, clashscores = molprobity_tables.parse_clash([], nos=2)
+        self.assertEqual([0.0, 0.0], molprobity_tables.get_clash_summary(
+            table, clashscores, nos=2)[0]['Clash score'])
+        self.assertEqual([], molprobity_tables.get_clash_details(table, {})['Atom-1'])
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,265 @@
+import os
+import sys
+import stat
+import time
+import tempfile
+import gzip
+import subprocess
+import unittest
+from unittest import mock
+import pandas as pd
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+from molprobity import GetMolprobityInformation
+from molprobity_cache import MolprobityCache
+from mmcif_io import read_system
+from test_molprobity_rewrite import TEST_CIF
+from test_input_formats import EXAMPLES, convert, get_counts
+
+# Stand-in for molprobity tools: prints its name and input file and
+# one line per atom (residue, model, atom) in the layout of the tool;
+# CA atoms are outliers
+# after a delay; fails if another tool shares its working directory
+# or if it is named by FAIL_TOOL
+TOOL = """#!{python}
+import os, sys, time
+if sys.argv[1:] == ['--version']:
+    print('molprobity test')
+    sys.exit()
+if os.path.exists('molprobity.out'):
+    sys.exit('molprobity.out exists')
+open('molprobity.out', 'w').close()
+if os.environ.get('FAIL_TOOL') == os.path.basename(sys.argv[0]):
+    sys.exit('tool failed')
+time.sleep({delay})
+tool = os.path.basename(sys.argv[0])
+print(tool, os.path.basename(sys.argv[1]), *sys.argv[2:])
+atoms = [line.split() for line in open(sys.argv[1]) if line.startswith('ATOM')]
+ids = [f'{{a[7]:>2}}{{a[6]:>4}}  {{a[5]}}' for a in atoms]
+evaluations = ['OUTLIER' if a[3] == 'CA' else 'Favored' for a in atoms]
+rows = [f'{{i}}:{{a[15]}}:0.0:0.0:{{e}}:{{a[3]}}'
+        for i, a, e in zip(ids, atoms, evaluations)]
+if tool == 'molprobity.clashscore':
+    clashes = [f'{{i}} {{a[3]:>4}} {{i}} {{a[3]:>4}} :0.{{a[15]}}00'
+               for i, a in zip(ids, atoms)]
+    print('Bad Clashes >= 0.4 Angstrom:', *clashes,
+          f'clashscore = {{len(rows)}}.00', sep=os.linesep)
+elif tool == 'molprobity.ramalyze':
+    print(*rows, 'SUMMARY', 'SUMMARY', 'SUMMARY', sep=os.linesep)
+elif tool == 'molprobity.rotalyze':
+    print(*rows, 'SUMMARY', sep=os.linesep)
+"""
+
+# Models of two and three atoms
+ENSEMBLE_CIF = """data_PDBDEV_test
+_entry.id PDBDEV_test
+loop_
+_ihm_model_list.model_id
+_ihm_model_list.model_name
+_ihm_model_list.assembly_id
+_ihm_model_list.protocol_id
+_ihm_model_list.representation_id
+1 . 1 1 1
+2 . 1 1 1
+#
+loop_
+_ihm_model_group.id
+_ihm_model_group.name
+_ihm_model_group.details
+1 . .
+#
+loop_
+_ihm_model_group_link.group_id
+_ihm_model_group_link.model_id
+1 1
+1 2
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_alt_id
+_atom_site.label_comp_id
+_atom_site.label_seq_id
+_atom_site.label_asym_id
+_atom_site.Cartn_x
+_atom_site.Cartn_y
+_atom_site.Cartn_z
+_atom_site.label_entity_id
+_atom_site.auth_asym_id
+_atom_site.B_iso_or_equiv
+_atom_site.pdbx_PDB_model_num
+_atom_site.ihm_model_id
+ATOM 1 N N . MET 1 A 1.000 2.000 3.000 1 A 1.0 1 1
+ATOM 2 C CA . MET 1 A 4.000 5.000 6.000 1 A 1.0 1 1
+ATOM 3 N N . MET 1 A 1.000 2.000 3.000 1 A 1.0 2 2
+ATOM 4 C CA . MET 1 A 4.000 5.000 6.000 1 A 1.0 2 2
+ATOM 5 C C . MET 1 A 5.000 5.000 6.000 1 A 1.0 2 2
+#
+"""
+
+TOOLS = ('molprobity.molprobity', 'molprobity.clashscore',
+         'molprobity.ramalyze', 'molprobity.rotalyze')
+
+
+class Testing(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        bindir = os.path.join(self.tmpdir.name, 'bin')
+        os.mkdir(bindir)
+        for tool in TOOLS:
+            fname = os.path.join(bindir, tool)
+            with open(fname, 'w') as f:
+                f.write(TOOL.format(python=sys.executable, delay=0.5))
+            os.chmod(fname, os.stat(fname).st_mode | stat.S_IEXEC)
+        self.fname = os.path.join(self.tmpdir.name, 'test.cif')
+        with open(self.fname, 'w', encoding='utf-8') as f:
+            f.write(TEST_CIF)
+        self.cache = os.path.join(self.tmpdir.name, 'cache')
+        env = {'PATH': bindir + os.pathsep + os.environ['PATH']}
+        self.patch = mock.patch.dict(os.environ, env)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmpdir.cleanup()
+
+    def test_run_all(self):
+        I = GetMolprobityInformation(self.fname, cache=self.cache)
+        self.assertEqual('molprobity test', I.version)
+        t0 = time.perf_counter()
+        d = I.run_all({}, workers=4)
+        # Tools run at the same time, each in its own directory
+        self.assertLess(time.perf_counter() - t0, 1.5)
+        self.assertEqual(['molprobity.molprobity temp.cif coot=False'],
+                         d['molprobity'])
+        # Outputs are parsed into tables as they are read
+        self.assertEqual(['A', 'A'], d['rama']['chain'].tolist())
+        self.assertEqual(['Favored', 'OUTLIER'], d['rota']['evaluation'].tolist())
+        self.assertEqual([0.1, 0.1], d['clash']['overlap'].tolist())
+        self.assertEqual({1: '2.00'}, d['clashscores'])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.cache, 'molprobity.out')))
+        # No raw outputs are written
+        self.assertEqual([], [f for f in os.listdir(self.cache)
+                              if f.endswith(('.txt', '.txt.gz'))])
+        I.cleanup()
+
+    def test_rewrite_formats(self):
+        """compressed and BinaryCIF input is rewritten as text mmCIF"""
+        out = os.path.join(self.tmpdir.name, 'out.cif')
+        for fname in EXAMPLES:
+            GetMolprobityInformation(fname, cache=self.cache).rewrite_mmcif(out)
+            with open(out) as f:
+                expected = f.read()
+            counts = get_counts(read_system(out)[0])
+            for suffix, f in convert(fname, self.tmpdir.name).items():
+                GetMolprobityInformation(f, cache=self.cache).rewrite_mmcif(out)
+                if suffix == '.cif.gz':
+                    with open(out) as fh:
+                        self.assertEqual(expected, fh.read())
+                self.assertEqual(counts, get_counts(read_system(out)[0]), f)
+
+    def test_failure(self):
+        I = GetMolprobityInformation(self.fname, cache=self.cache)
+        with mock.patch.dict(os.environ, {'FAIL_TOOL': 'molprobity.ramalyze'}):
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                I.run_all({}, workers=4)
+        self.assertEqual(1, cm.exception.returncode)
+        self.assertIn('tool failed', cm.exception.stderr)
+        I.cleanup()
+
+    def test_archive(self):
+        I = GetMolprobityInformation(self.fname, cache=self.cache,
+                                     archive=True)
+        I.run_all({}, workers=4)
+        fname = os.path.join(self.cache, f'{I.ID}_clash.txt.gz')
+        with gzip.open(fname, 'rt') as f:
+            self.assertEqual('molprobity.clashscore temp.cif', f.readline().strip())
+            self.assertIn('clashscore = 2.00\n', f.readlines())
+        for key in ('rama', 'rota', 'mp'):
+            self.assertTrue(os.path.exists(
+                os.path.join(self.cache, f'{I.ID}_{key}.txt.gz')))
+        I.cleanup()
+
+    def test_run_split(self):
+        with open(self.fname, 'w', encoding='utf-8') as f:
+            f.write(ENSEMBLE_CIF)
+        I = GetMolprobityInformation(self.fname, cache=self.cache)
+        d = I.run_all({}, workers=4, split=True)
+        self.assertEqual(['molprobity.molprobity temp.cif coot=False'],
+                         d['molprobity'])
+        # Lines of each model are attributed to the model
+        chains_map = {('A', '1'): ('A', '1')}
+        for table, summary_table, detailed_table in (
+                (d['rama'], I.rama_summary_table, I.rama_detailed_table),
+                (d['rota'], I.rota_summary_table, I.rota_detailed_table)):
+            self.assertEqual([1, 1, 2, 2, 2], table['model'].tolist())
+            self.assertEqual({'Model ID': [1, 2], 'Analyzed': [2, 3],
+                              'Favored': [1, 2], 'Allowed': [0, 0],
+                              'Outliers': [1, 1]},
+                             summary_table(table))
+            self.assertEqual({'Model ID': [1, 2], 'Chain': ['A', 'A'],
+                              'Residue ID': ['1', '1'],
+                              'Residue type': ['MET', 'MET']},
+                             detailed_table(table, chains_map))
+        clashes, clashscores = d['clash'], d['clashscores']
+        summary, total = I.clash_summary_table(clashes, clashscores)
+        self.assertEqual(['1', '2'], summary['Model ID'])
+        self.assertEqual(['2.00', '3.00'], summary['Clash score'])
+        self.assertEqual([2, 3], summary['Number of clashes'])
+        self.assertEqual(5, total)
+        detail = I.clash_detailed_table(clashes, chains_map)
+        self.assertEqual(['1', '1', '2', '2', '2'], detail['Model ID'])
+        self.assertEqual('A:1:MET:CA', detail['Atom-2'][1])
+        self.assertEqual(['0.100'] * 2 + ['0.200'] * 3,
+                         detail['Clash overlap (&#8491)'])
+        # Attribution of a single run to models is approximate
+        with self.assertLogs(level='WARNING') as cm:
+            I.run_all({}, workers=4)
+        self.assertIn('not exact', cm.output[0])
+        I.cleanup()
+        # Files of single models are removed
+        self.assertEqual([], [f for f in os.listdir(self.cache)
+                              if os.path.isdir(os.path.join(self.cache, f))])
+
+    def test_cache(self):
+        with open(self.fname, 'w', encoding='utf-8') as f:
+            f.write(ENSEMBLE_CIF)
+        I = GetMolprobityInformation(self.fname, cache=self.cache)
+        cache = MolprobityCache(self.cache)
+        key = I.get_cache_key(cache, split=True)
+        misses = MolprobityCache.misses
+        self.assertIsNone(cache.load(key))
+        self.assertEqual(misses + 1, MolprobityCache.misses)
+        d = I.run_all({}, workers=4, split=True)
+        cache.store(key, d)
+        hits = MolprobityCache.hits
+        cached = cache.load(key)
+        self.assertEqual(hits + 1, MolprobityCache.hits)
+        self.assertEqual(d.keys(), cached.keys())
+        for k in ('rama', 'rota', 'clash'):
+            pd.testing.assert_frame_equal(d[k], cached[k])
+        self.assertEqual({1: '2.00', 2: '3.00'}, cached['clashscores'])
+        self.assertEqual(d['molprobity'], cached['molprobity'])
+        self.assertEqual([key + '.json.gz'], os.listdir(cache.path))
+        # Results depend on the tool arguments, version and input
+        self.assertNotEqual(key, I.get_cache_key(cache, split=False))
+        I.version = 'molprobity other'
+        self.assertNotEqual(key, I.get_cache_key(cache, split=True))
+        with open(I._tempcif, 'a') as f:
+            f.write('#\n')
+        I.version = 'molprobity test'
+        self.assertNotEqual(key, I.get_cache_key(cache, split=True))
+        # Broken entries are discarded
+        with open(cache.get_filename(key), 'wb') as f:
+            f.write(b'broken')
+        self.assertIsNone(cache.load(key))
+        self.assertEqual([], os.listdir(cache.path))
+        I.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
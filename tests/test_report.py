@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+import tempfile
+from unittest import mock
+from collections import defaultdict
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+from report import WriteReport
+from mmcif_io import get_parse_count
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example',
+                       'PDBDEV_00000001.cif')
+
+
+class Testing(unittest.TestCase):
+    # Figures are not rendered, so no browser is needed
+    @mock.patch.object(WriteReport, 'create_webdriver', return_value=None)
+    def test_parse_once(self, create_webdriver):
+        """the input file is parsed once for all stages of a report"""
+        with tempfile.TemporaryDirectory() as tempdir:
+            dirnames = {k: os.path.join(tempdir, k) for k in ('csv', 'html')}
+            for dirname in dirnames.values():
+                os.mkdir(dirname)
+            count = get_parse_count()
+            report = WriteReport(EXAMPLE, db=tempdir,
+                                 cache=os.path.join(tempdir, 'cache'),
+                                 nprocs=1)
+            template_dict = report.run_entry_composition(defaultdict())
+            template_dict, molprobity_dict, exv_data = report.run_model_quality(
+                template_dict, csvDirName=dirnames['csv'],
+                htmlDirName=dirnames['html'])
+            template_dict = report.run_supplementary_table(template_dict)
+            self.assertEqual([1, 2], exv_data['Models'])
+            self.assertEqual(1, get_parse_count() - count)
+            self.assertEqual(get_parse_count(), report.get_parse_count())
+            report.clean()
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,116 @@
+import os
+import sys
+import unittest
+import tempfile
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+import mmcif_io
+from system_cache import SystemCache
+from molprobity_cache import MolprobityCache
+
+TEST_CIF = """
+data_PDBDEV_test
+_entry.id PDBDEV_test
+loop_
+_ihm_model_list.model_id
+_ihm_model_list.model_name
+_ihm_model_list.assembly_id
+_ihm_model_list.protocol_id
+_ihm_model_list.representation_id
+1 . 1 1 1
+#
+loop_
+_ihm_model_group.id
+_ihm_model_group.name
+_ihm_model_group.details
+1 "Cluster 1" .
+#
+loop_
+_ihm_model_group_link.group_id
+_ihm_model_group_link.model_id
+1 1
+#
+loop_
+_ihm_sphere_obj_site.id
+_ihm_sphere_obj_site.entity_id
+_ihm_sphere_obj_site.seq_id_begin
+_ihm_sphere_obj_site.seq_id_end
+_ihm_sphere_obj_site.asym_id
+_ihm_sphere_obj_site.Cartn_x
+_ihm_sphere_obj_site.Cartn_y
+_ihm_sphere_obj_site.Cartn_z
+_ihm_sphere_obj_site.object_radius
+_ihm_sphere_obj_site.rmsf
+_ihm_sphere_obj_site.model_id
+1 1 1 6 A 389.993 145.089 134.782 4.931 0 1
+2 1 7 7 B 406.895 142.176 135.653 3.318 1.34 1
+"""
+
+
+class Testing(unittest.TestCase):
+    def test_warm_run_skips_parsing(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            tmpfilepath = os.path.join(tempdir, 'test.cif')
+            with open(tmpfilepath, 'w') as tmpfile:
+                tmpfile.write(TEST_CIF)
+            cache_root = os.path.join(tempdir, 'cache')
+
+            count = mmcif_io.get_parse_count()
+            I = mmcif_io.GetInputInformation(tmpfilepath, cache_root=cache_root)
+            self.assertEqual(count + 1, mmcif_io.get_parse_count())
+
+            I = mmcif_io.GetInputInformation(tmpfilepath, cache_root=cache_root)
+            self.assertEqual(count + 1, mmcif_io.get_parse_count())
+            self.assertEqual(1, I.get_number_of_models())
+
+            I = mmcif_io.GetInputInformation(tmpfilepath, cache_root=cache_root,
+                                             nocache=True)
+            self.assertEqual(count + 2, mmcif_io.get_parse_count())
+
+    def test_key_depends_on_content(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            tmpfilepath = os.path.join(tempdir, 'test.cif')
+            with open(tmpfilepath, 'w') as tmpfile:
+                tmpfile.write(TEST_CIF)
+            cache = SystemCache(os.path.join(tempdir, 'cache'))
+            key1 = cache.get_key(tmpfilepath)
+            with open(tmpfilepath, 'a') as tmpfile:
+                tmpfile.write('#\n')
+            key2 = cache.get_key(tmpfilepath)
+            self.assertNotEqual(key1, key2)
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            tmpfilepath = os.path.join(tempdir, 'test.cif')
+            with open(tmpfilepath, 'w') as tmpfile:
+                tmpfile.write(TEST_CIF)
+            system, encoding = mmcif_io.read_system(tmpfilepath)
+            cache = SystemCache(os.path.join(tempdir, 'cache'), max_size=0)
+            cache.store('a', system, encoding)
+            self.assertIsNone(cache.load('a'))
+
+    def test_shared_budget(self):
+        # Systems and MolProbity results share the size budget
+        with tempfile.TemporaryDirectory() as tempdir:
+            tmpfilepath = os.path.join(tempdir, 'test.cif')
+            with open(tmpfilepath, 'w') as tmpfile:
+                tmpfile.write(TEST_CIF)
+            system, encoding = mmcif_io.read_system(tmpfilepath)
+            cache_root = os.path.join(tempdir, 'cache')
+            cache = SystemCache(cache_root)
+            mp_cache = MolprobityCache(cache_root)
+            mp_cache.store('b', {'molprobity': ['line'] * 1000})
+            os.utime(mp_cache.get_filename('b'), (0, 0))
+            cache.store('a', system, encoding)
+            size = sum(os.path.getsize(f) for f in
+                       (cache.get_filename('a'), mp_cache.get_filename('b')))
+            cache.max_size = size - 1
+            cache.evict()
+            # Least recently used entry of either cache goes first
+            self.assertFalse(mp_cache.get_filename('b').exists())
+            self.assertTrue(cache.get_filename('a').exists())
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')
@@ -0,0 +1,84 @@
+import os
+import sys
+import gzip
+import shutil
+import unittest
+import tempfile
+import ihm.reader
+import ihm.dumper
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ihm_validation'))
+sys.path.insert(0, path)
+from mmcif_io import GetInputInformation
+from array_model import get_number_of_atoms, get_number_of_spheres
+from triage import triage
+
+EXAMPLES = [os.path.join(os.path.dirname(__file__), '..', 'example', f)
+            for f in ('PDBDEV_00000001.cif', 'PDBDEV_00000004.cif')]
+
+
+class Testing(unittest.TestCase):
+    def check_record(self, record, I, exact=True):
+        self.assertEqual(I.get_id(), record['entry_id'])
+        self.assertEqual(I.get_number_of_models(), record['models'])
+        self.assertEqual(I.check_sphere(), record['sphere'])
+        self.assertEqual(I.check_for_sas(None), record['sas'])
+        self.assertEqual(I.check_for_cx(None), record['cx'])
+        self.assertEqual(I.check_for_em(None), record['em'])
+        models = [m for ids, m in I.iter_models()]
+        self.assertEqual(sum(get_number_of_atoms(m) for m in models),
+                         record['atoms'])
+        self.assertEqual(sum(get_number_of_spheres(m) for m in models),
+                         record['spheres'])
+        self.assertEqual(exact, record['exact_counts'])
+
+    def test_triage(self):
+        for fname in EXAMPLES:
+            record = triage(fname)
+            # Rows of uncompressed files are counted from their ids
+            self.check_record(record, GetInputInformation(fname), exact=False)
+        self.assertTrue(triage(EXAMPLES[0])['coarse_grained'])
+        self.assertTrue(triage(EXAMPLES[1])['atomic'])
+
+    def test_triage_gzip(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            fname = os.path.join(tempdir, 'test.cif.gz')
+            with open(EXAMPLES[1], 'rb') as fin, gzip.open(fname, 'wb') as fout:
+                shutil.copyfileobj(fin, fout)
+            record = triage(fname)
+            self.assertEqual('gzip', record['compression'])
+            # Rows of compressed files are counted
+            self.check_record(record, GetInputInformation(EXAMPLES[1]))
+
+    def test_triage_bcif(self):
+        system, = ihm.reader.read(open(EXAMPLES[0]))
+        with tempfile.TemporaryDirectory() as tempdir:
+            fname = os.path.join(tempdir, 'test.bcif')
+            with open(fname, 'wb') as fh:
+                ihm.dumper.write(fh, [system], format='BCIF')
+            with open(fname, 'rb') as fin, \
+                    gzip.open(fname + '.gz', 'wb') as fout:
+                shutil.copyfileobj(fin, fout)
+            I = GetInputInformation(fname)
+            for f in (fname, fname + '.gz'):
+                record = triage(f)
+                self.assertEqual('BCIF', record['format'])
+                # Rows of BinaryCIF files are counted from category headers
+                self.check_record(record, I)
+                self.assertTrue(record['coarse_grained'])
+
+    def test_triage_short_loop(self):
+        """short loops are counted row by row, whatever their ids"""
+        with tempfile.TemporaryDirectory() as tempdir:
+            fname = os.path.join(tempdir, 'test.cif')
+            with open(fname, 'w') as fh:
+                fh.write("data_test\n_entry.id test\nloop_\n"
+                         "_atom_site.id\n_atom_site.type_symbol\n"
+                         "1 C\n5 N\n9 O\n#\n")
+            record = triage(fname)
+            self.assertEqual(3, record['atoms'])
+            self.assertTrue(record['exact_counts'])
+
+
+if __name__ == '__main__':
+    unittest.main(warnings='ignore')